@@ -9,4 +9,7 @@ from public."location" l
 left join public.service_update su on l.update_id = su.update_id 
 left join public."timestamp" dep on l.departure_id = dep.ts_id 
 left join public."timestamp" arr on l.arrival_id = arr.ts_id 
-where su.rid = '202406187143949'
\ No newline at end of file
+where su.rid = '202406187143949'
+-- The rid's date bounds ts so only that train's partitions are scanned
+and su.ts >= '2024-06-17' and su.ts < '2024-06-20'
+and l.ts >= '2024-06-17' and l.ts < '2024-06-20'
\ No newline at end of file
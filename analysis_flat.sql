@@ -0,0 +1,13 @@
+select 
+l.update_id as id,
+l.tpl,
+l.departure_ts,
+l.departure_status,
+l.arrival_ts,
+l.arrival_status
+from public.location_flat l 
+left join public.service_update su on l.update_id = su.update_id 
+where su.rid = '202406187143949'
+-- The rid's date bounds ts so only that train's partitions are scanned
+and su.ts >= '2024-06-17' and su.ts < '2024-06-20'
+and l.ts >= '2024-06-17' and l.ts < '2024-06-20'
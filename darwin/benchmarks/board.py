@@ -0,0 +1,85 @@
+from __future__ import annotations
+import random
+import time
+
+import click
+
+from darwin.benchmarks.memory import retained_bytes
+from darwin.messages.src.decoder import StreamingDecoder
+from darwin.messages.src.ts import TSMessage
+from darwin.service.src.board import BoardKind, LiveStateStore
+from darwin.service.src.metrics import Metrics, percentile
+from darwin.simulator.generator import GeneratorConfig, PportGenerator
+
+
+def payloads(rids: int, count: int) -> list[bytes]:
+    generator = PportGenerator(GeneratorConfig(rids=rids, seed=1, mix={"ts": 1.0}))
+    return [generator.xml()[1] for _ in range(count)]
+
+
+def feed(store: LiveStateStore, batch: list[bytes]) -> list[LiveStateStore]:
+
+    # Decoded here so only what the store keeps of each message is counted as retained
+    for payload in batch:
+        store.update(StreamingDecoder.decode_ts(payload))
+
+    return [store]
+
+
+def update_secs(batch: list[TSMessage], maxsize: int) -> float:
+
+    store = LiveStateStore(maxsize=maxsize, metrics=Metrics())
+
+    start = time.perf_counter()
+    for message in batch:
+        store.update(message)
+
+    return time.perf_counter() - start
+
+
+def query(store: LiveStateStore, tiplocs: list[str], queries: int) -> list[float]:
+
+    # Kept raw, a Histogram's buckets are wider than the differences being measured
+    timings = []
+    chooser = random.Random(1)
+
+    for _ in range(queries):
+        tpl = chooser.choice(tiplocs)
+        kind = chooser.choice(list(BoardKind))
+
+        start = time.perf_counter()
+        store.board(tpl, kind)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+@click.command()
+@click.option("--rids", "rid_counts", type=int, multiple=True, help="Trains running at once, repeatable")
+@click.option("--messages", "count", type=int, default=50000, help="TS updates fed to the store")
+@click.option("--queries", type=int, default=20000, help="Board queries timed after feeding")
+@click.option("--maxsize", type=int, default=50000, help="Trains the store holds before evicting the oldest")
+def main(rid_counts: tuple[int, ...], count: int, queries: int, maxsize: int) -> None:
+
+    for rids in rid_counts or (2000, 20000, 100000):
+        batch = payloads(rids, count)
+        decoded = [StreamingDecoder.decode_ts(payload) for payload in batch]
+        tiplocs = sorted({location.tpl for message in decoded for location in message.locations})
+
+        elapsed = update_secs(decoded, maxsize)
+
+        store = LiveStateStore(maxsize=maxsize, metrics=Metrics())
+        retained, _ = retained_bytes(lambda: feed(store, batch))
+
+        timings = query(store, tiplocs, queries)
+
+        print(
+            f"{rids:>7} rids: {len(store):6d} trains {store.events:7d} events "
+            f"{retained / 1024 / 1024:7.1f} MiB {retained / max(1, len(store)):6.0f} bytes/train, "
+            f"update {elapsed / count * 1e6:6.1f} us, "
+            f"board p50 {percentile(timings, 50) * 1e6:6.1f} us p99 {percentile(timings, 99) * 1e6:6.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
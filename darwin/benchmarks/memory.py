@@ -0,0 +1,71 @@
+from __future__ import annotations
+import gc
+import pickle
+import tracemalloc
+from typing import Callable
+
+import click
+
+from darwin.messages.src.common import Message, MessageType, RawMessage
+from darwin.messages.src.decoder import StreamingDecoder
+from darwin.messages.src.schedule import ScheduleParser
+from darwin.messages.src.ts import TSService
+from darwin.simulator.generator import GeneratorConfig, PportGenerator
+
+
+def retained_bytes(build: Callable[[], list]) -> tuple[int, list]:
+
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        built = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    return after - before, built
+
+
+def report(name: str, build: Callable[[], list]) -> None:
+
+    retained, built = retained_bytes(build)
+    pickled = sum(len(pickle.dumps(item, pickle.HIGHEST_PROTOCOL)) for item in built)
+    count = max(1, len(built))
+
+    print(f"{name:>24}: {len(built):6d} messages, {retained / count:8.0f} bytes retained, {pickled / count:6.0f} bytes pickled")
+
+
+@click.command()
+@click.option("--messages", type=int, default=5000, help="Generated frames, about 80% TS and 20% schedules")
+def main(messages: int) -> None:
+
+    generator = PportGenerator(GeneratorConfig(rids=min(2000, messages), seed=1, mix={"ts": 0.8, "cis": 0.2}))
+    raw = [RawMessage(headers["MessageType"], body) for headers, body in generator.frames(messages)]
+
+    ts = [message for message in raw if message.message_type == MessageType.TS.value]
+    schedules = [message for message in raw if message.message_type == MessageType.SC.value]
+
+    # Payloads are decompressed up front so only the parsed models are counted
+    for message in raw:
+        message.payload
+
+    parsed_ts = [Message.from_message(message) for message in ts]
+    parsed_schedules = [Message.from_message(message) for message in schedules]
+
+    report("StreamingDecoder.ts", lambda: [StreamingDecoder.decode_ts(message.payload) for message in ts])
+    report("TSService.parse", lambda: [TSService.parse(message) for message in parsed_ts])
+    report(
+        "StreamingDecoder.schedule",
+        lambda: [StreamingDecoder.decode_schedule(message.payload) for message in schedules]
+    )
+    report(
+        "ScheduleParser.create",
+        lambda: [ScheduleParser.create(message.body, message.timestamp) for message in parsed_schedules]
+    )
+
+
+if __name__ == "__main__":
+    main()
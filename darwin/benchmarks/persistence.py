@@ -0,0 +1,132 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+import time
+from typing import Callable
+
+import click
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+from darwin.messages.src.ts import (
+    LocationTimestamp,
+    PassingLocation,
+    Platform,
+    Service,
+    ServiceUpdate,
+    Status,
+    StoppingLocation,
+    TSMessage,
+)
+from darwin.repository.batch import BatchedDatabaseRepository, FlushPolicy
+from darwin.repository.db import DatabaseRepository, LocationSchema, engine_for_url, train_locations
+
+TIPLOCS = ["BRSTLTM", "BATHSPA", "CHPNHAM", "SWINDON", "DIDCOTP", "READING", "SLOUGH", "PADTON"]
+
+
+def make_ts_message(i: int, locations: int, trains: int = 200) -> TSMessage:
+
+    ts = datetime(2024, 6, 18, 6, 0) + timedelta(seconds=i)
+    rid = f"20240618{i % trains:07d}"
+    locs = []
+
+    for j in range(locations):
+        at = LocationTimestamp(6 * 60 + j % (18 * 60), "TD", False, Status.ESTIMATED)
+        tpl = TIPLOCS[j % len(TIPLOCS)]
+
+        if j % 3 == 1:
+            locs.append(PassingLocation(tpl=tpl, passing=at))
+        else:
+            locs.append(StoppingLocation(tpl=tpl, arrival=at, departure=at, platform=Platform("P", True, str(j))))
+
+    return TSMessage(
+        update=ServiceUpdate(service=Service(rid=rid, uid=f"U{i % trains:05d}"), ts=ts),
+        locations=locs,
+        timestamp=ts
+    )
+
+
+def save_two_step(repository: DatabaseRepository, message: TSMessage) -> None:
+    update_id = repository.save_service_update(message.update)
+    repository.save_location(message.locations, update_id, message.update.ts)
+
+
+def save_single_transaction(repository: DatabaseRepository, message: TSMessage) -> None:
+    repository.save_ts_message(message)
+
+
+def run(
+    engine: Engine,
+    save: Callable[[DatabaseRepository, TSMessage], None],
+    messages: list[TSMessage],
+    schema: LocationSchema = LocationSchema.NORMALISED
+) -> float:
+
+    repository = DatabaseRepository(engine, schema=schema)
+
+    start = time.perf_counter()
+    for message in messages:
+        save(repository, message)
+
+    return time.perf_counter() - start
+
+
+def run_batched(engine: Engine, messages: list[TSMessage], schema: LocationSchema) -> float:
+
+    repository = BatchedDatabaseRepository(engine, FlushPolicy(max_delay_secs=3600), schema=schema)
+
+    start = time.perf_counter()
+    for message in messages:
+        repository.save_ts_message(message)
+
+    repository.close()
+    return time.perf_counter() - start
+
+
+def run_queries(engine: Engine, rids: list[str], schema: LocationSchema) -> tuple[float, int]:
+
+    rows = 0
+
+    with Session(engine) as session:
+        start = time.perf_counter()
+        for rid in rids:
+            rows += len(train_locations(session, rid, schema))
+
+        return time.perf_counter() - start, rows
+
+
+@click.command()
+@click.option("--url", type=str, default="sqlite://", help="Database to write to, tables must already exist outside SQLite")
+@click.option("--messages", type=int, default=2000)
+@click.option("--locations", type=int, default=8, help="Locations per TS message")
+@click.option(
+    "--schema",
+    "schemas",
+    type=click.Choice([schema.value for schema in LocationSchema]),
+    multiple=True,
+    help="Location schemas to compare, defaults to both"
+)
+def main(url: str, messages: int, locations: int, schemas: tuple[str, ...]) -> None:
+
+    batch = [make_ts_message(i, locations) for i in range(messages)]
+    rids = sorted({message.update.service.rid for message in batch})
+
+    for schema in [LocationSchema(schema) for schema in schemas] or list(LocationSchema):
+        engine = engine_for_url(url)
+
+        for name, save in [("two-step", save_two_step), ("single transaction", save_single_transaction)]:
+            elapsed = run(engine, save, batch, schema)
+            print(f"{schema.value:>10} {name:>20}: {messages / elapsed:8.0f} msg/s {elapsed / messages * 1000:8.3f} ms/msg")
+
+        elapsed = run_batched(engine, batch, schema)
+        print(f"{schema.value:>10} {'batched':>20}: {messages / elapsed:8.0f} msg/s {elapsed / messages * 1000:8.3f} ms/msg")
+
+        # Each train has been written three times over by now, as it would build up over a day
+        elapsed, rows = run_queries(engine, rids, schema)
+        print(
+            f"{schema.value:>10} {'analysis query':>20}: {len(rids) / elapsed:8.0f} trains/s "
+            f"{elapsed / len(rids) * 1000:8.3f} ms/train, {rows / len(rids):.0f} rows each"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+from __future__ import annotations
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import re
+import time
+
+import click
+from sqlalchemy import Engine, create_engine, text
+
+from darwin.repository.db import rid_window
+from darwin.repository.partitions import PARTITIONED_TABLES, Partition
+
+DB_SQL = Path(__file__).resolve().parents[2] / "db.sql"
+
+# db.sql as it was before partitioning, one heap per table and only the primary keys indexed
+UNPARTITIONED_DDL = """
+create table service (rid varchar(30) PRIMARY KEY, uid varchar(10) UNIQUE NOT NULL);
+create table service_update (
+    update_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    ts TIMESTAMP NOT NULL,
+    rid varchar(30) NOT NULL REFERENCES service(rid)
+);
+create table timestamp (
+    ts_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    ts TIME NOT NULL, src varchar(30), delayed BOOLEAN, status varchar(30)
+);
+create table platform (
+    plat_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    src varchar(30), confirmed BOOLEAN, text varchar(30)
+);
+create table location (
+    loc_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    update_id BIGINT REFERENCES service_update(update_id),
+    tpl varchar(10) NOT NULL,
+    departure_id BIGINT UNIQUE REFERENCES timestamp(ts_id),
+    arrival_id BIGINT UNIQUE REFERENCES timestamp(ts_id),
+    platform_id BIGINT UNIQUE REFERENCES platform(plat_id)
+);
+create table location_flat (
+    loc_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    update_id BIGINT NOT NULL REFERENCES service_update(update_id),
+    tpl varchar(10) NOT NULL,
+    arrival_ts TIME, arrival_src varchar(30), arrival_delayed BOOLEAN, arrival_status varchar(30),
+    departure_ts TIME, departure_src varchar(30), departure_delayed BOOLEAN, departure_status varchar(30),
+    platform_src varchar(30), platform_confirmed BOOLEAN, platform_text varchar(30)
+);
+"""
+
+# Every train runs updates through the day, each update carrying a handful of locations out of a pool of TIPLOCs
+GENERATE = """
+insert into service (rid, uid)
+select to_char(:start + d, 'YYYYMMDD') || lpad(train::text, 7, '0'), 'S' || lpad((d * :trains + train)::text, 9, '0')
+from generate_series(0, :days - 1) d, generate_series(1, :trains) train;
+
+insert into service_update (update_id, ts, rid)
+select
+    (d * :trains + train - 1) * :updates + u + 1,
+    (:start + d) + make_interval(secs => 18000 + (train * 17) % 57600 + u * 360),
+    to_char(:start + d, 'YYYYMMDD') || lpad(train::text, 7, '0')
+from generate_series(0, :days - 1) d, generate_series(1, :trains) train, generate_series(0, :updates - 1) u;
+
+insert into timestamp (ts_id, ts, src, delayed, status)
+select update_id * :locations + l, (ts + make_interval(mins => l * 7))::time, 'TD', false, 'estimated'
+from service_update, generate_series(0, :locations - 1) l;
+
+insert into location (loc_id, update_id, {ts}tpl, departure_id)
+select update_id * :locations + l, update_id, {ts}'T' || ((update_id / :updates + l * 37) % :tiplocs), update_id * :locations + l
+from service_update, generate_series(0, :locations - 1) l;
+
+insert into location_flat (loc_id, update_id, {ts}tpl, departure_ts, departure_src, departure_delayed, departure_status)
+select
+    update_id * :locations + l, update_id, {ts}'T' || ((update_id / :updates + l * 37) % :tiplocs),
+    (ts + make_interval(mins => l * 7))::time, 'TD', false, 'estimated'
+from service_update, generate_series(0, :locations - 1) l;
+"""
+
+BY_RID = """
+select l.update_id, l.tpl, dep.ts, dep.status, arr.ts, arr.status
+from location l
+join service_update su on l.update_id = su.update_id
+left join timestamp dep on l.departure_id = dep.ts_id
+left join timestamp arr on l.arrival_id = arr.ts_id
+where su.rid = :rid{window}
+"""
+
+BY_RID_FLAT = """
+select l.update_id, l.tpl, l.departure_ts, l.departure_status, l.arrival_ts, l.arrival_status
+from location_flat l
+join service_update su on l.update_id = su.update_id
+where su.rid = :rid{window}
+"""
+
+BY_TIPLOC = """
+select su.rid, l.departure_ts
+from location_flat l
+join service_update su on l.update_id = su.update_id
+where l.tpl = :tpl and {column}.ts >= :start and {column}.ts < :end{window}
+"""
+
+RID_WINDOW = " and su.ts >= :start and su.ts < :end and l.ts >= :start and l.ts < :end"
+TIPLOC_WINDOW = " and su.ts >= :start and su.ts < :end"
+
+EXECUTION_TIME = re.compile(r"Execution Time: ([\d.]+) ms")
+
+
+def layout_engine(url: str, layout: str) -> Engine:
+
+    with create_engine(url).begin() as connection:
+        connection.execute(text(f"drop schema if exists plans_{layout} cascade"))
+        connection.execute(text(f"create schema plans_{layout}"))
+
+    return create_engine(url, connect_args={"options": f"-csearch_path=plans_{layout}"})
+
+
+def execute_script(engine: Engine, script: str) -> None:
+
+    # Straight through the driver so the % in the DO block of db.sql is not taken as a parameter
+    with engine.begin() as connection:
+        connection.connection.cursor().execute(script)
+
+
+def create_layout(engine: Engine, partitioned: bool, start: date, days: int) -> None:
+
+    if not partitioned:
+        execute_script(engine, UNPARTITIONED_DDL)
+        return
+
+    execute_script(engine, DB_SQL.read_text())
+
+    with engine.begin() as connection:
+        for table in PARTITIONED_TABLES:
+            for day in range(days):
+                partition = Partition.create(table, start + timedelta(days=day), start + timedelta(days=day + 1))
+                connection.execute(text(partition.create_sql()))
+
+
+def generate(engine: Engine, partitioned: bool, params: dict) -> float:
+
+    began = time.perf_counter()
+
+    with engine.begin() as connection:
+        for statement in GENERATE.format(ts="ts, " if partitioned else "").split(";"):
+            if statement.strip():
+                connection.execute(text(statement), params)
+
+    with engine.begin() as connection:
+        connection.execute(text("analyze"))
+
+    return time.perf_counter() - began
+
+
+def explain(engine: Engine, query: str, params: dict, repeat: int) -> tuple[float, str]:
+
+    best = None
+    plan = ""
+
+    with engine.connect() as connection:
+        for _ in range(repeat):
+            rows = connection.execute(text(f"explain (analyze, buffers) {query}"), params).scalars().all()
+            plan = "\n".join(rows)
+            elapsed = float(EXECUTION_TIME.search(plan).group(1))
+            best = elapsed if best is None else min(best, elapsed)
+
+    return best, plan
+
+
+def queries(partitioned: bool, rid: str, tpl: str, at: datetime) -> dict[str, tuple[str, dict]]:
+
+    start, end = rid_window(rid)
+    rid_params = {"rid": rid, "start": start, "end": end}
+    tiploc_params = {"tpl": tpl, "start": at, "end": at + timedelta(hours=1)}
+
+    return {
+        "by rid": (BY_RID.format(window=RID_WINDOW if partitioned else ""), rid_params),
+        "by rid flat": (BY_RID_FLAT.format(window=RID_WINDOW if partitioned else ""), rid_params),
+        "by tiploc": (
+            BY_TIPLOC.format(column="l" if partitioned else "su", window=TIPLOC_WINDOW if partitioned else ""),
+            tiploc_params
+        ),
+    }
+
+
+@click.command()
+@click.option("--url", type=str, required=True, help="Postgres database to create the plans_* schemas in")
+@click.option("--days", type=int, default=14)
+@click.option("--trains", type=int, default=3000, help="Trains per day")
+@click.option("--updates", type=int, default=10, help="Updates per train")
+@click.option("--locations", type=int, default=6, help="Locations per update")
+@click.option("--tiplocs", type=int, default=2000)
+@click.option("--repeat", type=int, default=5, help="Runs of each query, the fastest is reported")
+@click.option("--plans", is_flag=True, default=False, help="Print the full plan of each query")
+def main(
+    url: str,
+    days: int,
+    trains: int,
+    updates: int,
+    locations: int,
+    tiplocs: int,
+    repeat: int,
+    plans: bool
+) -> None:
+
+    start = date.today() - timedelta(days=days - 1)
+    params = {
+        "start": start, "days": days, "trains": trains, "updates": updates,
+        "locations": locations, "tiplocs": tiplocs
+    }
+    rows = days * trains * updates * locations
+
+    # A train and a TIPLOC hour from the middle of the last day, the part of the history a live board reads
+    last_day = start + timedelta(days=days - 1)
+    rid = f"{last_day:%Y%m%d}{trains // 2:07d}"
+    at = datetime.combine(last_day, datetime.min.time()) + timedelta(hours=12)
+
+    for layout, partitioned in [("before", False), ("after", True)]:
+        engine = layout_engine(url, layout)
+        create_layout(engine, partitioned, start, days)
+
+        elapsed = generate(engine, partitioned, params)
+        print(f"{layout:>6}: generated {rows} locations in each location table in {elapsed:.1f}s")
+
+        for name, (query, query_params) in queries(partitioned, rid, "T7", at).items():
+            best, plan = explain(engine, query, query_params, repeat)
+            print(f"{layout:>6} {name:>12}: {best:10.3f} ms")
+
+            if plans:
+                print(plan)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+import os
+
+import click
+
+from darwin.repository.db import DatabaseRepositoryInterface
+from darwin.service.src.capture import CapturedFrame, FrameCapture
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.metrics import Metrics
+from darwin.service.src.pool import ParsePool
+from darwin.service.src.replay import ReplayStats, replay
+from darwin.service.src.sink import TrainSink
+from darwin.service.src.watch import WatchSet
+from darwin.simulator.generator import GeneratorConfig, PportGenerator
+from darwin.stomp_client import StompClient
+
+
+def run(frames: list[CapturedFrame], processes: int, stations: tuple[str, ...], batch_size: int) -> ReplayStats:
+
+    # Nothing is written so the numbers show how parsing scales rather than the disk
+    service = MessageService(
+        DatabaseRepositoryInterface(),
+        sink=TrainSink(),
+        watch=WatchSet.create(stations),
+        metrics=Metrics()
+    )
+    pool = ParsePool(service, processes=processes, batch_size=batch_size) if processes else None
+    client = StompClient(service, pool=pool)
+
+    return replay(frames, client.on_message, drain=pool.close if pool else None)
+
+
+@click.command()
+@click.option("--messages", type=int, default=20000, help="Generated frames, ignored with --capture-directory")
+@click.option("--capture-directory", type=str, required=False, help="Replay captured frames instead")
+@click.option(
+    "--processes",
+    "process_counts",
+    type=int,
+    multiple=True,
+    help="Process counts to compare, defaults to doubling up to the core count"
+)
+@click.option("--batch-size", type=int, default=64)
+@click.option("--station", "-s", "stations", type=str, multiple=True)
+def main(
+    messages: int,
+    capture_directory: str,
+    process_counts: tuple[int, ...],
+    batch_size: int,
+    stations: tuple[str, ...]
+) -> None:
+
+    if capture_directory:
+        frames = list(FrameCapture.read(capture_directory))
+    else:
+        generator = PportGenerator(GeneratorConfig(seed=1))
+        frames = [CapturedFrame(0.0, headers, body) for headers, body in generator.frames(messages)]
+
+    if not process_counts:
+        cores = os.cpu_count() or 1
+        process_counts = tuple(sorted({1, cores, *(2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores)}))
+
+    inline = run(frames, 0, stations, batch_size)
+    print(f"{'inline':>12}: {inline}")
+
+    for processes in process_counts:
+        stats = run(frames, processes, stations, batch_size)
+        print(f"{processes:>3} processes: {stats} ({stats.frames_per_sec / inline.frames_per_sec:.2f}x inline)")
+
+
+if __name__ == "__main__":
+    main()
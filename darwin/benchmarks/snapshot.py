@@ -0,0 +1,88 @@
+from __future__ import annotations
+import os
+import tempfile
+import time
+
+import click
+
+from darwin.benchmarks.board import payloads
+from darwin.messages.src.decoder import StreamingDecoder
+from darwin.messages.src.ts import TSMessage
+from darwin.service.src.board import LiveStateStore
+from darwin.service.src.delta import TrainStateTable
+from darwin.service.src.metrics import Metrics
+from darwin.service.src.snapshot import Snapshot, load_snapshot, write_snapshot
+
+
+def apply(state: TrainStateTable, board: LiveStateStore, batch: list[TSMessage]) -> int:
+
+    # What MessageService does for each watched TS message, without the files or the database
+    written = 0
+
+    for message in batch:
+        board.update(message)
+        changed = state.delta(message)
+
+        if changed is not None:
+            state.record(message, len(changed.locations))
+            written += len(changed.locations)
+
+    return written
+
+
+def fresh() -> tuple[TrainStateTable, LiveStateStore]:
+    return TrainStateTable(), LiveStateStore(metrics=Metrics())
+
+
+@click.command()
+@click.option("--rids", "rid_counts", type=int, multiple=True, help="Trains running at once, repeatable")
+@click.option("--messages", "count", type=int, default=50000, help="TS updates seen before the restart")
+@click.option("--after", type=int, default=5000, help="TS updates seen after the restart")
+def main(rid_counts: tuple[int, ...], count: int, after: int) -> None:
+
+    for rids in rid_counts or (2000, 20000):
+        batch = payloads(rids, count + after)
+        before = [StreamingDecoder.decode_ts(payload) for payload in batch[:count]]
+        following = [StreamingDecoder.decode_ts(payload) for payload in batch[count:]]
+
+        # A cold start learns the trains in flight only as the feed sends them again, this is the
+        # parsing and indexing alone with none of the hours of wall clock the feed takes to do it
+        state, board = fresh()
+        start = time.perf_counter()
+        apply(state, board, before)
+        rebuild = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "state.snapshot")
+
+            start = time.perf_counter()
+            size = write_snapshot(path, state.trains())
+            write = time.perf_counter() - start
+
+            warm_state, warm_board = fresh()
+            start = time.perf_counter()
+            load_snapshot(path, warm_state, warm_board, metrics=Metrics())
+            load = time.perf_counter() - start
+
+            with Snapshot(path) as snapshot:
+                rid = following[0].update.service.rid
+                start = time.perf_counter()
+                snapshot.train(rid)
+                lookup = time.perf_counter() - start
+
+        cold_state, cold_board = fresh()
+        cold_written = apply(cold_state, cold_board, following)
+        warm_written = apply(warm_state, warm_board, following)
+        received = sum(len(message.locations) for message in following)
+
+        print(
+            f"{rids:>6} rids: {len(state):6d} trains, snapshot {size / 1024 / 1024:6.1f} MiB "
+            f"written in {write * 1e3:6.0f} ms, loaded in {load * 1e3:6.0f} ms, one rid in {lookup * 1e6:5.0f} us; "
+            f"rebuilding from {count} updates {rebuild * 1e3:6.0f} ms; "
+            f"next {after} updates write {cold_written / received:4.0%} of locations cold, "
+            f"{warm_written / received:4.0%} warm"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from darwin.benchmarks.suite import (
+    Corpus,
+    StageResult,
+    best_of,
+    median_of,
+    load_baseline,
+    main,
+    regressions,
+    run_parse_stages,
+    run_writer_stages,
+    save_baseline,
+)
+from darwin.repository.db import engine_for_url
+from click.testing import CliRunner
+import pytest
+
+
+def stage(name: str, messages_per_sec: float, p99_ms: float) -> StageResult:
+    return StageResult(name, int(messages_per_sec), 1.0, [p99_ms / 1000] * 100)
+
+
+class TestSuite:
+
+    def test_stages__cover_every_message(self) -> None:
+
+        corpus = Corpus.generate(60)
+        results = run_parse_stages(corpus) + run_writer_stages(engine_for_url("sqlite://"), corpus)
+
+        counts = {result.name: result.messages for result in results}
+
+        assert counts["RawMessage.parse"] == counts["Message.from_message"] == 60
+        assert counts["TSService.parse"] + counts["ScheduleParser.create"] == 60
+        assert counts["DatabaseRepository"] == counts["BatchedDatabaseRepository"] == len(corpus.ts_messages)
+        assert all(result.messages_per_sec > 0 for result in results)
+
+    @pytest.mark.parametrize(
+        "actual,expected_failures",
+        [
+            (stage("parse", 1000, 1.0), 0),
+            (stage("parse", 850, 1.4), 0),
+            (stage("parse", 700, 1.0), 1),
+            (stage("parse", 1000, 2.0), 1),
+            (stage("parse", 100, 9.0), 2),
+            (stage("unknown", 1, 100.0), 0),
+        ]
+    )
+    def test_regressions(self, actual: StageResult, expected_failures: int) -> None:
+
+        baseline = {"parse": {"messages_per_sec": 1000, "p50_ms": 1.0, "p99_ms": 1.0}}
+
+        assert len(regressions([actual], baseline, tolerance=0.2, p99_tolerance=0.5)) == expected_failures
+
+    def test_best_of(self) -> None:
+
+        runs = [
+            [stage("parse", 900, 1.0), stage("format", 500, 1.0)],
+            [stage("parse", 1000, 2.0), stage("format", 400, 1.0)],
+        ]
+
+        assert [(result.name, result.messages) for result in best_of(runs)] == [("parse", 1000), ("format", 500)]
+
+    def test_median_of(self) -> None:
+
+        runs = [[stage("parse", messages_per_sec, 1.0)] for messages_per_sec in [700, 1000, 900]]
+
+        assert [result.messages for result in median_of(runs)] == [900]
+
+    def test_baseline__round_trip(self, tmp_path) -> None:
+
+        path = f"{tmp_path}/baseline.json"
+        results = [stage("parse", 1000, 1.0)]
+
+        assert load_baseline(path) is None
+
+        save_baseline(path, results)
+
+        assert regressions(results, load_baseline(path), tolerance=0.0, p99_tolerance=0.0) == []
+
+    def test_main__fails_without_a_baseline(self, tmp_path) -> None:
+
+        path = f"{tmp_path}/baseline.json"
+        arguments = ["--messages", "20", "--skip-writers", "--repeat", "1", "--baseline", path]
+
+        missing = CliRunner().invoke(main, arguments)
+
+        assert missing.exit_code == 1
+        assert "--update-baseline" in missing.output
+        assert load_baseline(path) is None
+
+        assert CliRunner().invoke(main, arguments + ["--update-baseline"]).exit_code == 0
+        assert set(load_baseline(path)) == {result.name for result in run_parse_stages(Corpus.generate(20))}
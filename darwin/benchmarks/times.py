@@ -0,0 +1,45 @@
+from __future__ import annotations
+from datetime import datetime
+import timeit
+from typing import Callable
+
+import click
+
+from darwin.messages.src.times import parse_hhmm, parse_hhmmss, parse_pport_timestamp
+
+HHMM = [f"{hour:02d}:{minute:02d}" for hour in range(5, 23) for minute in range(0, 60, 7)]
+HHMMSS = [f"{value}:30" for value in HHMM]
+PPORT = [f"2024-06-18T{value}:{i % 60:02d}.{i * 7919 % 10000000:07d}" for i, value in enumerate(HHMM)]
+
+
+def strptime_pport(value: str) -> datetime:
+    return datetime.strptime(value.split(".")[0], "%Y-%m-%dT%H:%M:%S")
+
+
+def per_call(parse: Callable[[str], datetime], values: list[str], repeat: int) -> float:
+
+    def run() -> None:
+        for value in values:
+            parse(value)
+
+    return min(timeit.repeat(run, number=1, repeat=repeat)) / len(values)
+
+
+@click.command()
+@click.option("--repeat", type=int, default=20)
+def main(repeat: int) -> None:
+
+    cases = [
+        ("HH:MM", HHMM, lambda value: datetime.strptime(value, "%H:%M"), parse_hhmm),
+        ("HH:MM:SS", HHMMSS, lambda value: datetime.strptime(value, "%H:%M:%S"), parse_hhmmss),
+        ("Pport ts", PPORT, strptime_pport, parse_pport_timestamp),
+    ]
+
+    for name, values, baseline, fast in cases:
+        slow = per_call(baseline, values, repeat)
+        quick = per_call(fast, values, repeat)
+        print(f"{name:>10}: strptime {slow * 1e9:8.0f} ns  fast path {quick * 1e9:8.0f} ns  {slow / quick:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
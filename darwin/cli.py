@@ -1,17 +1,52 @@
+from datetime import timedelta
 import os
+import signal
 import socket
+import sys
+import threading
 import time
+from typing import Optional
 import click
 from darwin.messages.src.common import MessageType
-from darwin.repository.db import DatabaseRepository
+from darwin.repository.batch import BatchedDatabaseRepository, FlushPolicy
+from darwin.repository.coalesce import CoalescePolicy, CoalescingRepository
+from darwin.repository.db import (
+    DatabaseRepository,
+    DatabaseRepositoryInterface,
+    LocationSchema,
+    MigrationError,
+    database_engine,
+    engine_for_url,
+    migrate_locations as migrate_location_rows,
+    warm_service_cache,
+)
+from darwin.repository.partitions import (
+    PartitionInterval,
+    PartitionMaintainer,
+    RetentionPolicy,
+    maintain_partitions as maintain_partition_tables,
+)
 import stomp
 
+from darwin.service.src.ingest import IngestQueue, OverflowPolicy
+from darwin.service.src.archive import TrainArchive
+from darwin.service.src.board import BoardServer, LiveStateStore
+from darwin.service.src.capture import FrameCapture
+from darwin.service.src.delta import TrainStateTable
+from darwin.service.src.lag import LagMonitor
 from darwin.service.src.message_service import MessageService
+from darwin.service.src.metrics import MetricsReporter, MetricsServer, default_metrics
+from darwin.service.src.pool import ParsePool
+from darwin.service.src.replay import replay as replay_frames
+from darwin.service.src.shard import ShardPlan
+from darwin.service.src.sink import JsonlSink
+from darwin.service.src.snapshot import SnapshotWriter, load_snapshot
+from darwin.service.src.watch import WatchSet
+from darwin.simulator.broker import StompBroker
+from darwin.simulator.generator import GeneratorConfig, PportGenerator
 
 from darwin.stomp_client import StompClient
 
-USERNAME = os.environ['DARWIN_USERNAME']
-PASSWORD = os.environ['DARWIN_PASSWORD']
 HOSTNAME = 'darwin-dist-44ae45.nationalrail.co.uk'
 HOSTPORT = 61613
 
@@ -20,7 +55,45 @@ TOPIC = '/topic/darwin.pushport-v16'
 CLIENT_ID = socket.getfqdn()
 HEARTBEAT_INTERVAL_MS = 25000
 
-@click.command()
+@click.group()
+def main() -> None:
+    ...
+
+
+def train_state(hours: float) -> Optional[TrainStateTable]:
+    return TrainStateTable(max_age=timedelta(hours=hours)) if hours > 0 else None
+
+
+@main.command()
+@click.option(
+    "--host",
+    type=str,
+    default=HOSTNAME,
+    help="STOMP broker to consume from, e.g. 127.0.0.1 for the simulator"
+)
+@click.option(
+    "--port",
+    type=int,
+    default=HOSTPORT
+)
+@click.option(
+    "--username",
+    type=str,
+    envvar="DARWIN_USERNAME",
+    required=True
+)
+@click.option(
+    "--password",
+    type=str,
+    envvar="DARWIN_PASSWORD",
+    required=True
+)
+@click.option(
+    "--database-url",
+    type=str,
+    required=False,
+    help="SQLAlchemy URL to persist TS messages to instead of the local Postgres"
+)
 @click.option(
     "--message-type",
     "-m",
@@ -33,9 +106,209 @@ HEARTBEAT_INTERVAL_MS = 25000
     type=str,
     required=False
 )
-def main(message_type: str, rid: str) -> None:
+@click.option(
+    "--decoder",
+    type=click.Choice(["streaming", "dict"]),
+    default="streaming"
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=4,
+    help="Processing workers behind the ingest queue, 0 processes on the STOMP receiver thread"
+)
+@click.option(
+    "--processes",
+    type=int,
+    default=0,
+    help="Worker processes to decompress and parse in, sharded by rid, 0 parses in this process"
+)
+@click.option(
+    "--queue-size",
+    type=int,
+    default=10000
+)
+@click.option(
+    "--overflow",
+    type=click.Choice([policy.value for policy in OverflowPolicy]),
+    default=OverflowPolicy.BLOCK.value
+)
+@click.option(
+    "--spill-directory",
+    type=str,
+    default="spill"
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=500,
+    help="TS messages buffered per database transaction, 0 writes each message as it arrives"
+)
+@click.option(
+    "--batch-delay",
+    type=float,
+    default=1.0,
+    help="Seconds a buffered TS message may wait before being flushed"
+)
+@click.option(
+    "--schema",
+    type=click.Choice([schema.value for schema in LocationSchema]),
+    default=LocationSchema.NORMALISED.value,
+    help="Write locations to the location, timestamp and platform tables or one location_flat row each"
+)
+@click.option(
+    "--sink",
+    type=click.Choice(["files", "archive"]),
+    default="files",
+    help="Write train_info as one JSONL file per train or as a segmented, compressed archive"
+)
+@click.option(
+    "--archive-directory",
+    type=str,
+    default="train_archive"
+)
+@click.option(
+    "--station",
+    "-s",
+    "stations",
+    type=str,
+    multiple=True,
+    envvar="DARWIN_STATIONS",
+    help="TIPLOC to watch, repeatable or comma separated, defaults to BRSTLTM running trains and PADTON schedules"
+)
+@click.option(
+    "--stations-file",
+    type=click.Path(exists=True, dir_okay=False),
+    required=False,
+    help="File of TIPLOCs to watch, one per line"
+)
+@click.option(
+    "--priority-station",
+    "priority_stations",
+    type=str,
+    multiple=True,
+    help="TIPLOC still served in degraded mode, required with --lag-threshold"
+)
+@click.option(
+    "--lag-threshold",
+    type=float,
+    default=0.0,
+    help="Seconds behind the feed before shedding schedules and non-priority stations, 0 (the default) disables it"
+)
+@click.option(
+    "--shard",
+    "shards",
+    type=str,
+    multiple=True,
+    envvar="DARWIN_SHARD",
+    help="Only process trains whose rid hashes to shard i of N, as i/N. Repeat as i/N@<ISO time> to "
+         "change layout at a feed timestamp, with - for no slot"
+)
+@click.option(
+    "--node-name",
+    type=str,
+    default=CLIENT_ID,
+    help="Client id and durable subscription name, must differ between nodes on one host"
+)
+@click.option(
+    "--capture-directory",
+    type=str,
+    required=False,
+    help="Also append every raw frame to capture segments in this directory for replay"
+)
+@click.option(
+    "--coalesce-window",
+    type=float,
+    default=0.0,
+    help="Seconds a train's updates are held and merged before they are written, 0 writes each one"
+)
+@click.option(
+    "--train-state-hours",
+    type=float,
+    default=6.0,
+    help="Hours a train's last written locations are kept to skip repeats, 0 writes every location"
+)
+@click.option(
+    "--snapshot-path",
+    type=str,
+    required=False,
+    help="File the train state is restored from before subscribing and periodically written to"
+)
+@click.option(
+    "--snapshot-interval",
+    type=float,
+    default=300.0,
+    help="Seconds between train state snapshots, one is always written at shutdown"
+)
+@click.option(
+    "--partition-interval",
+    type=float,
+    default=3600.0,
+    help="Seconds between creating the coming week's Postgres partitions, also done at startup, 0 disables it"
+)
+@click.option(
+    "--board-port",
+    type=int,
+    default=0,
+    help="Port serving departure and arrival boards as JSON on localhost, 0 disables them"
+)
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=9108,
+    help="Port serving /metrics on localhost, 0 disables it"
+)
+@click.option(
+    "--metrics-interval",
+    type=float,
+    default=60.0,
+    help="Seconds between metric summary logs, 0 disables them"
+)
+def listen(
+    host: str,
+    port: int,
+    username: str,
+    password: str,
+    database_url: str,
+    message_type: str,
+    rid: str,
+    decoder: str,
+    workers: int,
+    processes: int,
+    queue_size: int,
+    overflow: str,
+    spill_directory: str,
+    batch_size: int,
+    batch_delay: float,
+    schema: str,
+    sink: str,
+    archive_directory: str,
+    stations: tuple[str, ...],
+    stations_file: str,
+    priority_stations: tuple[str, ...],
+    lag_threshold: float,
+    shards: tuple[str, ...],
+    node_name: str,
+    capture_directory: str,
+    coalesce_window: float,
+    train_state_hours: float,
+    snapshot_path: str,
+    snapshot_interval: float,
+    partition_interval: float,
+    board_port: int,
+    metrics_port: int,
+    metrics_interval: float
+) -> None:
+    started = time.monotonic()
+
+    if snapshot_path and train_state_hours <= 0:
+        raise click.UsageError("--snapshot-path needs --train-state-hours above 0")
+
+    if lag_threshold > 0 and not priority_stations:
+        raise click.UsageError("--lag-threshold needs at least one --priority-station")
+
     conn = stomp.Connection12(
-        [(HOSTNAME, HOSTPORT)],
+        [(host, port)],
         auto_decode=False,
         heartbeats=(HEARTBEAT_INTERVAL_MS, HEARTBEAT_INTERVAL_MS),
         reconnect_sleep_initial=1, 
@@ -46,16 +319,90 @@ def main(message_type: str, rid: str) -> None:
         heart_beat_receive_scale=2.5
     )
 
-    db_pw = os.environ['DB_PASSWORD']
-    msg_service = MessageService(DatabaseRepository.create(password=db_pw), message_filter=MessageType.TS)
+    shard_plan = ShardPlan.parse(shards)
+
+    if shard_plan:
+        print(f"Processing shard {shard_plan}")
 
-    conn.set_listener('', StompClient(msg_service))
+    engine = engine_for_url(database_url) if database_url else database_engine(os.environ['DB_PASSWORD'])
+    service_cache = warm_service_cache(engine)
+
+    # db.sql has no default partition, so without this inserts start failing a week after it was loaded
+    partitions = None
+
+    if partition_interval > 0 and engine.dialect.name == "postgresql":
+        partitions = PartitionMaintainer(engine, interval_secs=partition_interval)
+        partitions.start()
+
+    if batch_size > 0:
+        repository = BatchedDatabaseRepository(
+            engine,
+            policy=FlushPolicy(max_messages=batch_size, max_delay_secs=batch_delay),
+            service_cache=service_cache,
+            schema=LocationSchema(schema)
+        )
+    else:
+        repository = DatabaseRepository(engine, service_cache=service_cache, schema=LocationSchema(schema))
+
+    if coalesce_window > 0:
+        repository = CoalescingRepository(repository, CoalescePolicy(window_secs=coalesce_window))
+
+    msg_service = MessageService(
+        repository,
+        message_filter=MessageType.TS,
+        streaming=decoder == "streaming",
+        sink=TrainArchive(archive_directory) if sink == "archive" else JsonlSink(),
+        watch=WatchSet.create(stations, stations_file, priority_stations),
+        lag=LagMonitor(lag_threshold) if lag_threshold > 0 else None,
+        shard=shard_plan,
+        state=train_state(train_state_hours),
+        board=LiveStateStore() if board_port else None
+    )
 
-    connect_header = {'client-id': USERNAME + '-' + CLIENT_ID}
-    subscribe_header = {'activemq.subscriptionName': CLIENT_ID}
+    ingest = IngestQueue(
+        workers=workers,
+        maxsize=queue_size,
+        policy=OverflowPolicy(overflow),
+        spill_directory=spill_directory
+    ) if workers > 0 and processes == 0 else None
 
-    conn.connect(username=USERNAME,
-                       passcode=PASSWORD,
+    pool = ParsePool(msg_service, processes=processes, maxsize=queue_size) if processes > 0 else None
+
+    capture = FrameCapture(capture_directory) if capture_directory else None
+
+    conn.set_listener('', StompClient(msg_service, ingest=ingest, capture=capture, pool=pool))
+
+    snapshots = None
+
+    # Loaded before subscribing, so the first frames are already compared against the trains in flight
+    if snapshot_path:
+        loading = time.monotonic()
+        restored = load_snapshot(snapshot_path, msg_service.state, msg_service.board)
+        print(f"Restored {restored} trains from {snapshot_path} in {time.monotonic() - loading:.2f}s")
+
+        snapshots = SnapshotWriter(
+            snapshot_path,
+            msg_service.state,
+            flush=repository.flush,
+            interval_secs=snapshot_interval
+        )
+
+    metrics_server = MetricsServer(("127.0.0.1", metrics_port)) if metrics_port else None
+    board_server = BoardServer(("127.0.0.1", board_port), msg_service.board) if msg_service.board is not None else None
+    reporter = MetricsReporter(interval_secs=metrics_interval) if metrics_interval > 0 else None
+
+    if metrics_server:
+        metrics_server.start()
+    if board_server:
+        board_server.start()
+    if reporter:
+        reporter.start()
+
+    connect_header = {'client-id': username + '-' + node_name}
+    subscribe_header = {'activemq.subscriptionName': node_name}
+
+    conn.connect(username=username,
+                       passcode=password,
                        wait=True,
                        headers=connect_header)
 
@@ -63,7 +410,13 @@ def main(message_type: str, rid: str) -> None:
                          id='1',
                          ack='auto',
                          headers=subscribe_header)
-    print("Connected")
+
+    default_metrics.observe("startup", time.monotonic() - started)
+    print(f"Connected {time.monotonic() - started:.2f}s after starting")
+
+    # docker stop sends SIGTERM, exiting through the finally below still writes every held update
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
     try:
         while True:
             time.sleep(1)
@@ -71,6 +424,319 @@ def main(message_type: str, rid: str) -> None:
         print("Closing connection")
         conn.disconnect()
 
+        if ingest:
+            ingest.close()
+
+        if pool:
+            pool.close()
+
+        if capture:
+            capture.close()
+
+        msg_service.close()
+
+        # The last snapshot flushes the repository before it is written, so it has to come before closing it
+        if snapshots:
+            print(f"Wrote a snapshot of {snapshots.close()} trains to {snapshot_path}")
+
+        repository.close()
+
+        if partitions:
+            partitions.close()
+
+        if msg_service.state is not None:
+            print(f"Train state: {msg_service.state}")
+
+        if reporter:
+            reporter.close()
+        if metrics_server:
+            metrics_server.close()
+        if board_server:
+            board_server.close()
+
+        print(default_metrics.summary())
+
+
+@main.command()
+@click.option(
+    "--capture-directory",
+    type=str,
+    default="capture"
+)
+@click.option(
+    "--speed",
+    type=float,
+    default=0.0,
+    help="Multiple of capture time to replay at, 0 replays as fast as possible"
+)
+@click.option(
+    "--decoder",
+    type=click.Choice(["streaming", "dict"]),
+    default="streaming"
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=0,
+    help="Processing workers behind the ingest queue, 0 processes inline"
+)
+@click.option(
+    "--processes",
+    type=int,
+    default=0,
+    help="Worker processes to decompress and parse in, sharded by rid, 0 parses in this process"
+)
+@click.option(
+    "--queue-size",
+    type=int,
+    default=10000
+)
+@click.option(
+    "--station",
+    "-s",
+    "stations",
+    type=str,
+    multiple=True,
+    envvar="DARWIN_STATIONS",
+    help="TIPLOC to watch, repeatable or comma separated, defaults to BRSTLTM running trains and PADTON schedules"
+)
+@click.option(
+    "--stations-file",
+    type=click.Path(exists=True, dir_okay=False),
+    required=False
+)
+@click.option(
+    "--shard",
+    "shards",
+    type=str,
+    multiple=True,
+    envvar="DARWIN_SHARD",
+    help="Only process trains whose rid hashes to shard i of N, as i/N. Repeat as i/N@<ISO time> to "
+         "change layout at a feed timestamp, with - for no slot"
+)
+@click.option(
+    "--output",
+    type=str,
+    default="replay_info",
+    help="Directory to write train_info into"
+)
+@click.option(
+    "--database-url",
+    type=str,
+    required=False,
+    help="SQLAlchemy URL to persist TS messages to, nothing is persisted when omitted"
+)
+@click.option(
+    "--schema",
+    type=click.Choice([schema.value for schema in LocationSchema]),
+    default=LocationSchema.NORMALISED.value,
+    help="Write locations to the location, timestamp and platform tables or one location_flat row each"
+)
+@click.option(
+    "--coalesce-window",
+    type=float,
+    default=0.0,
+    help="Seconds a train's updates are held and merged before they are written, 0 writes each one"
+)
+@click.option(
+    "--train-state-hours",
+    type=float,
+    default=6.0,
+    help="Hours a train's last written locations are kept to skip repeats, 0 writes every location"
+)
+def replay(
+    capture_directory: str,
+    speed: float,
+    decoder: str,
+    workers: int,
+    processes: int,
+    queue_size: int,
+    stations: tuple[str, ...],
+    stations_file: str,
+    shards: tuple[str, ...],
+    output: str,
+    database_url: str,
+    schema: str,
+    coalesce_window: float,
+    train_state_hours: float
+) -> None:
+
+    repository = DatabaseRepository(
+        engine_for_url(database_url),
+        schema=LocationSchema(schema)
+    ) if database_url else DatabaseRepositoryInterface()
+
+    if coalesce_window > 0:
+        repository = CoalescingRepository(repository, CoalescePolicy(window_secs=coalesce_window))
+
+    msg_service = MessageService(
+        repository,
+        message_filter=MessageType.TS,
+        streaming=decoder == "streaming",
+        sink=JsonlSink(output),
+        watch=WatchSet.create(stations, stations_file),
+        shard=ShardPlan.parse(shards),
+        state=train_state(train_state_hours)
+    )
+
+    ingest = IngestQueue(workers=workers, maxsize=queue_size) if workers > 0 and processes == 0 else None
+    pool = ParsePool(msg_service, processes=processes, maxsize=queue_size) if processes > 0 else None
+    client = StompClient(msg_service, ingest=ingest, pool=pool)
+    drain = pool or ingest
+
+    try:
+        stats = replay_frames(
+            FrameCapture.read(capture_directory),
+            client.on_message,
+            speed=speed,
+            drain=drain.close if drain else None
+        )
+    finally:
+        msg_service.close()
+        repository.close()
+
+    print(stats)
+
+    if msg_service.state is not None:
+        print(f"Train state: {msg_service.state}")
+
+    print(default_metrics.summary())
+
+
+@main.command()
+@click.option("--host", type=str, default="127.0.0.1")
+@click.option("--port", type=int, default=HOSTPORT)
+@click.option(
+    "--rate",
+    type=float,
+    default=0.0,
+    help="Frames per second sent to each subscriber, 0 sends as fast as possible"
+)
+@click.option("--count", type=int, default=0, help="Frames sent to each subscriber, 0 never stops")
+@click.option("--rids", type=int, default=2000, help="Trains running at once")
+@click.option("--skew", type=float, default=1.0, help="Zipf exponent of the TIPLOC distribution, 0 is uniform")
+@click.option(
+    "--tiploc",
+    "tiplocs",
+    type=str,
+    multiple=True,
+    help="TIPLOCs trains call at, busiest first, defaults to the Great Western main line"
+)
+@click.option("--pool", type=int, default=10000, help="Distinct frames generated up front and cycled")
+@click.option("--seed", type=int, required=False)
+def simulate(
+    host: str,
+    port: int,
+    rate: float,
+    count: int,
+    rids: int,
+    skew: float,
+    tiplocs: tuple[str, ...],
+    pool: int,
+    seed: int
+) -> None:
+
+    config = GeneratorConfig(rids=rids, skew=skew, seed=seed)
+
+    if tiplocs:
+        config.tiplocs = tiplocs
+
+    broker = StompBroker((host, port), PportGenerator(config), rate=rate, count=count, pool=pool)
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+    print(f"Serving {pool} generated frames on {host}:{port}")
+
+    last = 0
+    try:
+        while True:
+            time.sleep(5)
+            print(f"Sent {broker.sent} frames, {(broker.sent - last) / 5:.0f} frames/s")
+            last = broker.sent
+    finally:
+        broker.shutdown()
+        broker.server_close()
+
+
+@main.command(
+    "migrate-locations",
+    help=(
+        "Copy the normalised locations into location_flat, creating it partitioned like location if it is missing. "
+        "A database from before partitioning needs db_partition.sql run first. Stop every listen writing to the "
+        "database first, locations written while it runs are either not copied or stop a later run from resuming."
+    )
+)
+@click.option(
+    "--database-url",
+    type=str,
+    required=False,
+    help="SQLAlchemy URL to migrate instead of the local Postgres"
+)
+@click.option("--batch-size", type=int, default=50000, help="Locations copied per transaction")
+def migrate_locations(database_url: str, batch_size: int) -> None:
+
+    engine = engine_for_url(database_url) if database_url else database_engine(os.environ['DB_PASSWORD'])
+
+    try:
+        migrated = migrate_location_rows(engine, batch_size)
+    except MigrationError as e:
+        raise click.ClickException(str(e)) from e
+
+    print(f"Copied {migrated} locations into location_flat, the location, timestamp and platform tables are untouched")
+
+
+@main.command("maintain-partitions")
+@click.option(
+    "--database-url",
+    type=str,
+    required=False,
+    help="SQLAlchemy URL of a Postgres database instead of the local one"
+)
+@click.option(
+    "--interval",
+    type=click.Choice([interval.value for interval in PartitionInterval]),
+    default=PartitionInterval.DAILY.value,
+    help="Range covered by each new partition"
+)
+@click.option(
+    "--ahead-days",
+    type=int,
+    default=7,
+    help="Days of partitions kept ready, there is no default partition so writes fail once these run out"
+)
+@click.option("--retain-days", type=int, default=90, help="Partitions ending before this many days ago are detached")
+@click.option("--drop", is_flag=True, default=False, help="Drop detached partitions rather than keeping them as tables")
+@click.option("--dry-run", is_flag=True, default=False, help="Print the statements without running them")
+def maintain_partitions(
+    database_url: str,
+    interval: str,
+    ahead_days: int,
+    retain_days: int,
+    drop: bool,
+    dry_run: bool
+) -> None:
+
+    engine = engine_for_url(database_url) if database_url else database_engine(os.environ['DB_PASSWORD'])
+    policy = RetentionPolicy(PartitionInterval(interval), ahead_days, retain_days, drop)
+
+    for statement in maintain_partition_tables(engine, policy, execute=not dry_run):
+        print(statement)
+
+
+@main.command("export-archive")
+@click.option(
+    "--archive-directory",
+    type=str,
+    default="train_archive"
+)
+@click.option(
+    "--output",
+    type=str,
+    default="train_info",
+    help="Directory to write one JSONL file per train into"
+)
+def export_archive(archive_directory: str, output: str) -> None:
+    archive = TrainArchive(archive_directory)
+    print(f"Exported {archive.export(output)} files to {output}")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
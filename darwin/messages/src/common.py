@@ -2,11 +2,14 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
-import io
-from typing import Any
+from functools import cached_property
+import re
+from typing import Any, Optional
 import zlib
 import xmltodict
 
+from darwin.messages.src.times import parse_pport_epoch, parse_pport_timestamp
+
 
 class NoValidMessageTypeFound(Exception):
     ...
@@ -31,22 +34,70 @@ class MessageType(str, Enum):
         except Exception:
             raise NoValidMessageTypeFound(f"{type} not found")
 
+RID_PATTERN = re.compile(rb"\brid\s*=\s*[\"']([^\"']+)[\"']")
+HEAD_BYTES = 1024
+PPORT_TS_PATTERN = re.compile(rb"<Pport\b[^>]*?\sts\s*=\s*[\"']([^\"']+)[\"']")
+
 @dataclass
 class RawMessage:
     message_type: str
-    body: dict
+    data: bytes
 
     @classmethod
     def parse(cls, frame: Any) -> RawMessage:
-        message_type = frame.headers['MessageType']
-    
-        bio = io.BytesIO()
-        bio.write(str.encode('utf-16'))
-        bio.seek(0)
-        msg = zlib.decompress(frame.body, zlib.MAX_WBITS | 32)
-        data = xmltodict.parse(msg)
+        return cls(frame.headers['MessageType'], frame.body)
+
+    @cached_property
+    def payload(self) -> bytes:
+        return zlib.decompress(self.data, zlib.MAX_WBITS | 32)
+
+    @cached_property
+    def body(self) -> dict:
+        return xmltodict.parse(self.payload)
+
+    @cached_property
+    def head(self) -> bytes:
+
+        # The Pport ts and the rid sit near the start of the document, so routing a frame
+        # before it is parsed only needs its first few hundred bytes decompressed
+        if "payload" in self.__dict__:
+            return self.payload[:HEAD_BYTES]
+
+        return zlib.decompressobj(zlib.MAX_WBITS | 32).decompress(self.data, HEAD_BYTES)
+
+    def _search(self, pattern: re.Pattern[bytes]) -> Optional[bytes]:
+
+        match = pattern.search(self.head) or pattern.search(self.payload)
+        return match.group(1) if match else None
 
-        return cls(message_type, data) 
+    @cached_property
+    def rid(self) -> Optional[str]:
+        rid = self._search(RID_PATTERN)
+        return rid.decode() if rid else None
+
+    @cached_property
+    def head_rid(self) -> Optional[str]:
+
+        # For routing on the receiver thread, which must never decompress a whole frame or fail on a corrupt one
+        try:
+            match = RID_PATTERN.search(self.head)
+        except zlib.error:
+            return None
+
+        return match.group(1).decode() if match else None
+
+    @cached_property
+    def sent_at(self) -> Optional[float]:
+
+        ts = self._search(PPORT_TS_PATTERN)
+
+        if not ts:
+            return None
+
+        try:
+            return parse_pport_epoch(ts.decode())
+        except ValueError:
+            return None
 
     def __str__(self) -> str:
         return f"[{self.message_type}] {self.body}"
@@ -69,9 +120,8 @@ class Message:
             if uR is None:
                 raise NotURMessage("Message has no uR part")
 
-            split_ts = raw_message.body['Pport']['@ts'].split(".")
-            ts = datetime.strptime(split_ts[0], "%Y-%m-%dT%H:%M:%S")
+            ts = parse_pport_timestamp(raw_message.body['Pport']['@ts'])
         except:
             raise
 
-        return cls(message_type=parsed_message_type, body=uR, timestamp=ts)
\ No newline at end of file
+        return cls(message_type=parsed_message_type, body=uR, timestamp=ts)
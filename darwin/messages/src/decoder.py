@@ -0,0 +1,405 @@
+from __future__ import annotations
+from datetime import datetime
+from sys import intern
+from typing import Optional
+from xml.parsers import expat
+
+from darwin.messages.src.common import NotURMessage
+from darwin.messages.src.schedule import (
+    InvalidCISScheduleException,
+    InvalidDarwinScheduleException,
+    InvalidScheduleException,
+    Location as ScheduleLocation,
+    ScheduleTypeNotSupported,
+    Train,
+    TrainDeactivated,
+    TrainLocations,
+    TrainType,
+    interned,
+)
+from darwin.messages.src.ts import (
+    IncorrectMessageFormat,
+    InvalidLocation,
+    InvalidStoppingLocation,
+    InvalidTimestamp,
+    Location,
+    LocationTimestamp,
+    PassingLocation,
+    Platform,
+    Service,
+    ServiceUpdate,
+    Status,
+    StoppingLocation,
+    TSMessage,
+    working_times,
+)
+from darwin.messages.src.times import parse_minutes, parse_pport_timestamp
+from darwin.service.src.metrics import default_metrics
+
+
+class StreamingDecodeError(Exception): ...
+
+
+class _PportHandler:
+
+    def __init__(self) -> None:
+        self.ts: Optional[str] = None
+        self.update: Optional[dict] = None
+        self.depth = 0
+
+    def start(self, name: str, attrs: dict) -> None:
+        self.depth += 1
+
+        if self.depth == 1:
+            if name != "Pport" or "ts" not in attrs:
+                raise StreamingDecodeError(f"Unexpected root element {name}")
+            self.ts = attrs["ts"]
+        elif self.depth == 2:
+            if name == "uR":
+                if self.update is not None:
+                    raise StreamingDecodeError("Multiple uR elements")
+                self.update = attrs
+        elif self.update is not None:
+            self.start_update(name, attrs)
+
+    def end(self, name: str) -> None:
+        if self.depth > 2 and self.update is not None:
+            self.end_update(name)
+        self.depth -= 1
+
+    def characters(self, data: str) -> None:
+        ...
+
+    def start_update(self, name: str, attrs: dict) -> None:
+        ...
+
+    def end_update(self, name: str) -> None:
+        ...
+
+    def timestamp(self) -> datetime:
+        if self.update is None:
+            raise NotURMessage("Message has no uR part")
+
+        return parse_pport_timestamp(str(self.ts))
+
+    @classmethod
+    def feed(cls, payload: bytes) -> _PportHandler:
+        handler = cls()
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = handler.start
+        parser.EndElementHandler = handler.end
+        parser.CharacterDataHandler = handler.characters
+        parser.Parse(payload, True)
+
+        return handler
+
+
+class _TSHandler(_PportHandler):
+
+    FIELDS = frozenset(["ns5:arr", "ns5:dep", "ns5:pass", "ns5:plat"])
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.service: Optional[dict] = None
+        self.locations: list[tuple[str, Optional[str], dict]] = []
+
+        self._in_ts = False
+        self._fields: Optional[dict] = None
+        self._field: Optional[str] = None
+        self._field_attrs: dict = {}
+        self._text: Optional[list[str]] = None
+
+    def start_update(self, name: str, attrs: dict) -> None:
+
+        if self.depth == 3:
+            if name != "TS":
+                return
+
+            if self.update.get("updateOrigin") != "TD":
+                raise IncorrectMessageFormat(f"Not TD origin message")
+            if self.service is not None:
+                raise StreamingDecodeError("Multiple TS elements")
+
+            self.service = attrs
+            self._in_ts = True
+
+        elif self.depth == 4 and self._in_ts and name == "ns5:Location":
+            if "tpl" not in attrs:
+                raise StreamingDecodeError(f"Location without tpl {attrs}")
+
+            self._fields = {}
+            self.locations.append((
+                attrs["tpl"], working_times(attrs.get("wta"), attrs.get("wtd"), attrs.get("wtp")), self._fields
+            ))
+
+        elif self.depth == 5 and self._fields is not None and name in self.FIELDS:
+            if name in self._fields:
+                raise StreamingDecodeError(f"Repeated {name} in location")
+
+            self._field = name
+            self._field_attrs = attrs
+            self._text = []
+
+        elif self.depth == 6 and self._field is not None:
+            raise StreamingDecodeError(f"Unexpected {name} in {self._field}")
+
+    def end_update(self, name: str) -> None:
+
+        if self.depth == 5 and self._field is not None:
+            text = "".join(self._text).strip()
+
+            if text and not self._field_attrs and self._field != "ns5:plat":
+                raise StreamingDecodeError(f"Unexpected text in {self._field}")
+
+            self._fields[self._field] = (self._field_attrs, text)
+            self._field = None
+            self._text = None
+        elif self.depth == 4:
+            self._fields = None
+        elif self.depth == 3:
+            self._in_ts = False
+
+    def characters(self, data: str) -> None:
+        if self._text is not None:
+            self._text.append(data)
+
+    @staticmethod
+    def _timestamp(attrs: dict) -> Optional[LocationTimestamp]:
+
+        if not attrs:
+            return None
+
+        actual_ts = attrs.get("at")
+        estimated_ts = attrs.get("et") or attrs.get("wet")
+
+        if not actual_ts and not estimated_ts:
+            raise InvalidTimestamp(f"Invalid timestamp {attrs}")
+
+        return LocationTimestamp(
+            minutes=parse_minutes(actual_ts or estimated_ts),
+            src=intern(str(attrs.get("src"))),
+            delayed=bool(attrs.get("delayed", False)),
+            status=Status.ACTUAL if actual_ts else Status.ESTIMATED
+        )
+
+    @staticmethod
+    def _platform(attrs: dict, text: str) -> Optional[Platform]:
+
+        if not attrs:
+            return Platform("unknown", False, intern(text)) if text else None
+
+        return Platform(
+            intern(str(attrs.get("platsrc"))),
+            bool(attrs.get("conf", False)),
+            intern(str(text or None))
+        )
+
+    @classmethod
+    def _passing(cls, tpl: str, attrs: dict, times: Optional[str] = None) -> Location:
+
+        actual_ts = attrs.get("at")
+        estimated_ts = attrs.get("et") or attrs.get("wet")
+
+        if not actual_ts and not estimated_ts:
+            raise StreamingDecodeError(f"Passing location {tpl} has no timestamp")
+
+        src = attrs.get("src")
+
+        return PassingLocation(
+            tpl=intern(tpl),
+            passing=LocationTimestamp(
+                minutes=parse_minutes(actual_ts or estimated_ts),
+                src=intern(src) if src else src,
+                delayed=bool(attrs.get("delayed", False)),
+                status=Status.ACTUAL if actual_ts else Status.ESTIMATED
+            ),
+            working_times=times
+        )
+
+    @classmethod
+    def _stopping(cls, tpl: str, fields: dict, times: Optional[str] = None) -> Location:
+
+        try:
+            arr = cls._timestamp(fields.get("ns5:arr", ({}, ""))[0])
+            dep = cls._timestamp(fields.get("ns5:dep", ({}, ""))[0])
+        except InvalidTimestamp:
+            raise InvalidStoppingLocation(f"Invalid stopping location {tpl}")
+
+        return StoppingLocation(
+            tpl=intern(tpl),
+            arrival=arr,
+            departure=dep,
+            platform=cls._platform(*fields.get("ns5:plat", ({}, ""))),
+            working_times=times
+        )
+
+    @classmethod
+    def create_location(cls, tpl: str, fields: dict, times: Optional[str] = None) -> Location:
+
+        if "ns5:pass" in fields:
+            attrs, _ = fields["ns5:pass"]
+
+            if not attrs:
+                raise StreamingDecodeError(f"Passing location {tpl} has no attributes")
+
+            return cls._passing(tpl, attrs, times)
+
+        try:
+            return cls._stopping(tpl, fields, times)
+        except InvalidStoppingLocation as e:
+            raise InvalidLocation(f"Invalid location") from e
+
+    def build(self) -> TSMessage:
+
+        ts = self.timestamp()
+
+        if self.service is None:
+            raise StreamingDecodeError("Message has no TS part")
+
+        if "rid" not in self.service or "uid" not in self.service:
+            raise StreamingDecodeError(f"TS without rid/uid {self.service}")
+
+        if not self.locations:
+            raise IncorrectMessageFormat(f"Not TS new message: {self.service}")
+
+        locations = []
+
+        for tpl, times, fields in self.locations:
+            try:
+                locations.append(self.create_location(tpl, fields, times))
+            except InvalidLocation as e:
+                default_metrics.count_exception(e)
+
+        return TSMessage(
+            update=ServiceUpdate(
+                service=Service(rid=self.service["rid"], uid=self.service["uid"]),
+                ts=ts
+            ),
+            locations=locations,
+            timestamp=ts
+        )
+
+
+class _ScheduleHandler(_PportHandler):
+
+    LOCATIONS = frozenset(["ns2:OR", "ns2:IP", "ns2:DT"])
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.schedules: list[tuple[dict, dict[str, list[dict]]]] = []
+        self.deactivated: Optional[dict] = None
+
+        self._locations: Optional[dict[str, list[dict]]] = None
+
+    def start_update(self, name: str, attrs: dict) -> None:
+
+        if self.depth == 3:
+            if name == "schedule":
+                self._locations = {loc: [] for loc in self.LOCATIONS}
+                self.schedules.append((attrs, self._locations))
+            elif name == "deactivated":
+                if self.deactivated is not None:
+                    raise StreamingDecodeError("Multiple deactivated elements")
+                self.deactivated = attrs
+
+        elif self.depth == 4 and self._locations is not None and name in self.LOCATIONS:
+            if not attrs:
+                raise StreamingDecodeError(f"Schedule location {name} has no attributes")
+
+            self._locations[name].append(attrs)
+
+    def end_update(self, name: str) -> None:
+        if self.depth == 3:
+            self._locations = None
+
+    @staticmethod
+    def _location(attrs: dict) -> ScheduleLocation:
+
+        try:
+            return ScheduleLocation(
+                wta=interned(attrs.get("wta")),
+                wtd=interned(attrs.get("wtp")),
+                pta=interned(attrs.get("pta")),
+                ptd=interned(attrs.get("ptd")),
+                tpl=intern(attrs["tpl"]),
+                act=intern(attrs["act"]),
+                avg_loading=attrs.get("avg_loading"),
+                cancelled=attrs.get("can", "false") == "true"
+            )
+        except KeyError as e:
+            raise InvalidCISScheduleException(f"Error when extracting data: {attrs}") from e
+
+    @classmethod
+    def _train(cls, attrs: dict, locations: dict[str, list[dict]], ts: datetime) -> Train:
+
+        if "rid" not in attrs:
+            raise InvalidCISScheduleException(f"Error when extracting data: {attrs}")
+
+        rid = attrs["rid"]
+        uid = attrs.get("uid", "")
+        train_id = attrs.get("trainId", "")
+
+        if attrs.get("isPassengerSvc", "true") != "true":
+            return TrainType(rid=rid, uid=uid, train_id=train_id, ts=ts, passenger=False)
+
+        return TrainLocations(
+            ts=ts,
+            rid=rid,
+            uid=uid,
+            train_id=train_id,
+            origin=[cls._location(loc) for loc in locations["ns2:OR"]],
+            destination=[cls._location(loc) for loc in locations["ns2:DT"]],
+            intermediate=[cls._location(loc) for loc in locations["ns2:IP"]]
+        )
+
+    def build(self) -> list[Train]:
+
+        ts = self.timestamp()
+        origin = self.update.get("updateOrigin")
+
+        if origin is None:
+            raise InvalidScheduleException(f"Error when extracting data: {self.update}")
+
+        if origin == "CIS":
+            if not self.schedules:
+                raise InvalidCISScheduleException(f"Error when extracting data: {self.update}")
+
+            return [self._train(attrs, locations, ts) for attrs, locations in self.schedules]
+        elif origin == "Darwin":
+            if self.deactivated is None:
+                raise InvalidDarwinScheduleException(f"Error when extracting schedule from: {self.update}")
+            if "rid" not in self.deactivated:
+                raise InvalidDarwinScheduleException(f"Error when extracting data: {self.deactivated}")
+
+            return [
+                TrainDeactivated(
+                    rid=self.deactivated["rid"],
+                    uid=self.deactivated.get("uid", ""),
+                    train_id=self.deactivated.get("trainId", ""),
+                    deactivated=True,
+                    ts=ts
+                )
+            ]
+        else:
+            raise ScheduleTypeNotSupported(f"Schedule type not supported {origin}")
+
+
+class StreamingDecoder:
+
+    @classmethod
+    def parse_ts(cls, payload: bytes) -> _TSHandler:
+        return _TSHandler.feed(payload)
+
+    @classmethod
+    def parse_schedule(cls, payload: bytes) -> _ScheduleHandler:
+        return _ScheduleHandler.feed(payload)
+
+    @classmethod
+    def decode_ts(cls, payload: bytes) -> TSMessage:
+        return cls.parse_ts(payload).build()
+
+    @classmethod
+    def decode_schedule(cls, payload: bytes) -> list[Train]:
+        return cls.parse_schedule(payload).build()
@@ -0,0 +1,29 @@
+from __future__ import annotations
+import re
+from typing import Iterable
+
+
+class TiplocPrefilter:
+
+    def __init__(self, tiplocs: Iterable[str]) -> None:
+
+        self._tiplocs = frozenset(tiplocs)
+
+        alternatives = b"|".join(re.escape(tpl.encode()) for tpl in sorted(self._tiplocs))
+        self._pattern = re.compile(rb"tpl\s*=\s*[\"'](?:" + alternatives + rb")[\"']")
+
+    @property
+    def tiplocs(self) -> frozenset[str]:
+        return self._tiplocs
+
+    def may_match(self, payload: bytes) -> bool:
+
+        if not self._tiplocs:
+            return False
+
+        # Only plain ASCII-compatible markup can be searched byte-wise, anything
+        # else (BOMs, UTF-16, entity references, DTD defaults) goes on to the full parse
+        if not payload.startswith(b"<") or b"&" in payload or b"<!DOCTYPE" in payload:
+            return True
+
+        return self._pattern.search(payload) is not None
@@ -2,7 +2,10 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 from dataclasses import asdict, dataclass
 from datetime import datetime
-from typing import Optional
+from sys import intern
+from typing import ClassVar, Optional
+
+from darwin.service.src.metrics import default_metrics
 
 class InvalidTrustScheduleException(Exception): ...
 
@@ -16,6 +19,9 @@ class NonPassengerService(Exception): ...
 
 class ScheduleTypeNotSupported(Exception): ...
 
+def interned(value: Optional[str]) -> Optional[str]:
+    return intern(value) if value else value
+
 class ScheduleParser:
     
     @classmethod
@@ -33,7 +39,7 @@ class ScheduleParser:
         else:
             raise ScheduleTypeNotSupported(f"Schedule type not supported {origin}")
 
-@dataclass
+@dataclass(slots=True)
 class CISParser:
     
     @classmethod
@@ -54,8 +60,7 @@ class CISParser:
             try:
                 locations.append(TrainLocations.create(loc, ts))
             except NonPassengerService as e:
-                print(e)
-                pass
+                default_metrics.count_exception(e)
 
         return locations
 
@@ -66,7 +71,7 @@ class DarwinParser:
         return [TrainDeactivated.create(data, ts)]
 
 
-@dataclass
+@dataclass(slots=True)
 class PassingLocation:
 
     wtp: str
@@ -84,7 +89,7 @@ class PassingLocation:
             raise InvalidCISScheduleException(f"Error when extracting data: {data}") from e
 
 
-@dataclass
+@dataclass(slots=True)
 class Location:
 
     wta: Optional[str]
@@ -101,22 +106,26 @@ class Location:
     def create(cls, data: dict) -> Location:
 
         try:
+            # TIPLOCs, activities and clock times repeat across every schedule, so one copy of each is kept
             return Location(
-                wta=data.get("@wta"),
-                wtd=data.get("@wtp"),
-                pta=data.get("@pta"),
-                ptd=data.get("@ptd"),
-                tpl=data["@tpl"],
-                act=data["@act"],
+                wta=interned(data.get("@wta")),
+                wtd=interned(data.get("@wtp")),
+                pta=interned(data.get("@pta")),
+                ptd=interned(data.get("@ptd")),
+                tpl=intern(data["@tpl"]),
+                act=intern(data["@act"]),
                 avg_loading=data.get('@avg_loading'),
                 cancelled=True if data.get("@can", 'false') == 'true' else False
             )
         except (KeyError, AttributeError) as e:
             raise InvalidCISScheduleException(f"Error when extracting data: {data}") from e
 
-@dataclass
+@dataclass(slots=True)
 class Train(ABC):
 
+    # Deactivations and train types name no station, so they are kept once rather than under each one
+    per_station: ClassVar[bool] = True
+
     rid: str
     uid: str
     train_id: str
@@ -131,13 +140,18 @@ class Train(ABC):
         ...
 
     @abstractmethod
-    def filter(self, tiploc: str) -> bool:
+    def stations(self, watched: frozenset[str]) -> frozenset[str]:
         ...
 
+    def filter(self, tiploc: str) -> bool:
+        return bool(self.stations(frozenset([tiploc])))
+
 
-@dataclass
+@dataclass(slots=True)
 class TrainDeactivated(Train):
 
+    per_station: ClassVar[bool] = False
+
     deactivated: bool
 
     @classmethod
@@ -170,12 +184,14 @@ class TrainDeactivated(Train):
     def as_type(self) -> str:
         return "deactivated"
 
-    def filter(self, tiploc: str) -> bool:
-        return True
+    def stations(self, watched: frozenset[str]) -> frozenset[str]:
+        return watched
 
-@dataclass
+@dataclass(slots=True)
 class TrainType(Train):
 
+    per_station: ClassVar[bool] = False
+
     passenger: bool
 
     @classmethod
@@ -203,10 +219,10 @@ class TrainType(Train):
     def as_type(self) -> str:
         return "type"
 
-    def filter(self, tiploc: str) -> bool:
-        return True
+    def stations(self, watched: frozenset[str]) -> frozenset[str]:
+        return watched
 
-@dataclass
+@dataclass(slots=True)
 class TrainLocations(Train):
 
     origin: list[Location]
@@ -310,19 +326,8 @@ class TrainLocations(Train):
     def as_type(self) -> str:
         return "locations"
 
-    def filter(self, tiploc: str) -> bool:
-
-        for location in self.origin:
-            if location.tpl == tiploc:
-                return True
-
-        for location in self.intermediate:
-            if location.tpl == tiploc:
-                return True
-
-        for location in self.destination:
-            if location.tpl == tiploc:
-                return True
-
-        return False
+    def stations(self, watched: frozenset[str]) -> frozenset[str]:
+        return watched.intersection(
+            [location.tpl for locations in (self.origin, self.intermediate, self.destination) for location in locations]
+        )
 
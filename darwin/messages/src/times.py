@@ -0,0 +1,99 @@
+from __future__ import annotations
+from datetime import datetime, time
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+try:
+    _LONDON: Optional[ZoneInfo] = ZoneInfo("Europe/London")
+except ZoneInfoNotFoundError:
+    _LONDON = None
+
+# strptime with only a time fills in 1900-01-01, datetimes are immutable so one per minute can be shared
+_CLOCK: dict[str, datetime] = {
+    f"{hour:02d}:{minute:02d}": datetime(1900, 1, 1, hour, minute)
+    for hour in range(24)
+    for minute in range(60)
+}
+
+# Clock times are held as minutes past midnight, these map them back for output and the database
+_MINUTES: dict[str, int] = {
+    f"{hour:02d}:{minute:02d}": hour * 60 + minute
+    for hour in range(24)
+    for minute in range(60)
+}
+_HHMM: tuple[str, ...] = tuple(_MINUTES)
+_TIMES: tuple[time, ...] = tuple(time(minutes // 60, minutes % 60) for minutes in range(24 * 60))
+
+_HOURS: dict[str, int] = {f"{hour:02d}": hour for hour in range(24)}
+_SIXTY: dict[str, int] = {f"{value:02d}": value for value in range(60)}
+
+
+def parse_hhmm(value: str) -> datetime:
+
+    parsed = _CLOCK.get(value)
+
+    if parsed is not None:
+        return parsed
+
+    # Unpadded or malformed values keep strptime's behaviour and errors
+    return datetime.strptime(value, "%H:%M")
+
+
+def parse_minutes(value: str) -> int:
+
+    minutes = _MINUTES.get(value)
+
+    if minutes is not None:
+        return minutes
+
+    parsed = datetime.strptime(value, "%H:%M")
+    return parsed.hour * 60 + parsed.minute
+
+
+def format_minutes(minutes: int) -> str:
+    return _HHMM[minutes]
+
+
+def minutes_time(minutes: int) -> time:
+    return _TIMES[minutes]
+
+
+def parse_hhmmss(value: str) -> datetime:
+
+    if len(value) == 8 and value[2] == ":" and value[5] == ":":
+        hour = _HOURS.get(value[:2])
+        minute = _SIXTY.get(value[3:5])
+        second = _SIXTY.get(value[6:])
+
+        if hour is not None and minute is not None and second is not None:
+            return datetime(1900, 1, 1, hour, minute, second)
+
+    return datetime.strptime(value, "%H:%M:%S")
+
+
+def parse_clock(value: str) -> datetime:
+    return parse_hhmm(value) if len(value) <= 5 else parse_hhmmss(value)
+
+
+def parse_pport_timestamp(value: str) -> datetime:
+
+    # Pport timestamps are local time with up to seven fractional digits and sometimes an
+    # offset, only the wall clock part down to the second is kept
+    if len(value) >= 19 and value[10] == "T" and (len(value) == 19 or value[19] in ".+-Z"):
+        try:
+            return datetime.fromisoformat(value[:19])
+        except ValueError:
+            pass
+
+    return datetime.strptime(value.split(".")[0], "%Y-%m-%dT%H:%M:%S")
+
+
+def parse_pport_epoch(value: str) -> float:
+
+    # Unlike parse_pport_timestamp the offset matters here, values without one are UK local time
+    parsed = datetime.fromisoformat(value)
+
+    if parsed.tzinfo is None and _LONDON is not None:
+        parsed = parsed.replace(tzinfo=_LONDON)
+
+    return parsed.timestamp()
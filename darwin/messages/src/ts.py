@@ -1,15 +1,17 @@
 from __future__ import annotations
 from abc import ABC, abstractclassmethod, abstractmethod
-from dataclasses import asdict, dataclass
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from enum import Enum
+from sys import intern
 import time
-import traceback
 from typing import Optional
 import darwin.service.src.model as db_model
 
 
 from darwin.messages.src.common import Message
+from darwin.messages.src.times import format_minutes, minutes_time, parse_hhmm, parse_minutes
+from darwin.service.src.metrics import default_metrics
 
 class InvalidPassingLocation(Exception): ...
 
@@ -25,6 +27,18 @@ class InvalidStoppingLocation(Exception): ...
 
 class InvalidLocation(Exception): ...
 
+_NO_TIMESTAMP = (None, None, None, None)
+_NO_PLATFORM = (None, None, None)
+
+def working_times(wta: Optional[str], wtd: Optional[str], wtp: Optional[str]) -> Optional[str]:
+
+    # Darwin's identity for a call, the same TIPLOC twice in one schedule never has the same working times
+    if not (wta or wtd or wtp):
+        return None
+
+    return intern(f"{wta or ''}/{wtd or ''}/{wtp or ''}")
+
+
 class LocationType(Enum):
     
     ORIGIN = "O"
@@ -32,7 +46,7 @@ class LocationType(Enum):
     INTERMEDIATE = "I"
     DESTINATION = "D"
 
-@dataclass
+@dataclass(slots=True)
 class Service:
 
     rid: str
@@ -45,7 +59,7 @@ class Service:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class ServiceUpdate:
 
     service: Service
@@ -58,32 +72,43 @@ class ServiceUpdate:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class LocationTimestamp:
 
-    ts: datetime
+    # Darwin clock times have no date or seconds, so minutes past midnight is all that's kept
+    minutes: int
     src: str
     delayed: bool
     status: Status
 
+    @property
+    def ts(self) -> datetime:
+        return parse_hhmm(format_minutes(self.minutes))
+
     def format(self) -> dict:
 
         return {
-            "ts": datetime.strftime(self.ts, "%H:%M"),
+            "ts": format_minutes(self.minutes),
             "src": self.src,
             "delayed": self.delayed,
             "status": self.status.value
         }
 
     def to_orm(self) -> db_model.Timestamp:
-        return db_model.Timestamp(
-            ts=self.ts,
-            src=self.src,
-            delayed=self.delayed,
-            status=self.status.value
-        )
+        return db_model.Timestamp(**self.to_row())
 
-@dataclass
+    def to_row(self) -> dict:
+        return {
+            "ts": minutes_time(self.minutes),
+            "src": self.src,
+            "delayed": self.delayed,
+            "status": self.status.value
+        }
+
+    def columns(self) -> tuple:
+        return minutes_time(self.minutes), self.src, self.delayed, self.status.value
+
+@dataclass(slots=True)
 class Platform:
 
     src: str
@@ -91,11 +116,17 @@ class Platform:
     text: str
 
     def to_orm(self) -> db_model.Platform:
-        return db_model.Platform(
-            src=self.src,
-            confirmed=self.confirmed,
-            text=self.text
-        )
+        return db_model.Platform(**self.to_row())
+
+    def to_row(self) -> dict:
+        return {
+            "src": self.src,
+            "confirmed": self.confirmed,
+            "text": self.text
+        }
+
+    def columns(self) -> tuple:
+        return self.src, self.confirmed, self.text
 
 class Status(Enum):
     ESTIMATED = "estimated"
@@ -139,7 +170,7 @@ class TSService:
             try:
                 locations.append(cls.create_location(loc))
             except InvalidLocation as e:
-                print(traceback.format_exc())
+                default_metrics.count_exception(e)
                 
         return TSMessage(
             update=ServiceUpdate(service=Service(rid=rid, uid=uid), ts=msg.timestamp),
@@ -147,7 +178,7 @@ class TSService:
             timestamp=msg.timestamp
         )
 
-@dataclass
+@dataclass(slots=True)
 class TSMessage:
 
     update: ServiceUpdate
@@ -158,12 +189,11 @@ class TSMessage:
         ts = self.timestamp.strftime("%H:%M:%S")
         return f"{ts},{self.update.service.rid}," + ",".join([str(loc) for loc in self.locations])
 
-    def filter_for(self, tiploc: str) -> bool:
-        for location in self.locations:
-            if location.tpl == tiploc:
-                return True
+    def stations(self, watched: frozenset[str]) -> frozenset[str]:
+        return watched.intersection([location.tpl for location in self.locations])
 
-        return False
+    def filter_for(self, tiploc: str) -> bool:
+        return bool(self.stations(frozenset([tiploc])))
 
     @property
     def destination(self) -> str:
@@ -189,26 +219,60 @@ class TSMessage:
             for loc in self.locations
         ]
 
-@dataclass
+@dataclass(slots=True)
 class Location(ABC):
     
     tpl: str
+    working_times: Optional[str] = field(default=None, kw_only=True)
 
     @abstractmethod
     def format(self) -> dict:
         ...
 
     @abstractmethod
-    def to_orm(self, update_id: int) -> db_model.Location:
+    def to_orm(self, update_id: int, ts: datetime) -> db_model.Location:
         ...
 
+    @abstractmethod
+    def parts(self) -> tuple[Optional[LocationTimestamp], Optional[LocationTimestamp], Optional[Platform]]:
+        ...
+
+    def to_flat_row(self, update_id: int, ts: datetime) -> dict:
+
+        arrival, departure, platform = self.parts()
+
+        arrival_ts, arrival_src, arrival_delayed, arrival_status = arrival.columns() if arrival else _NO_TIMESTAMP
+        departure_ts, departure_src, departure_delayed, departure_status = \
+            departure.columns() if departure else _NO_TIMESTAMP
+        platform_src, platform_confirmed, platform_text = platform.columns() if platform else _NO_PLATFORM
+
+        return {
+            "update_id": update_id,
+            "ts": ts,
+            "tpl": self.tpl,
+            "arrival_ts": arrival_ts,
+            "arrival_src": arrival_src,
+            "arrival_delayed": arrival_delayed,
+            "arrival_status": arrival_status,
+            "departure_ts": departure_ts,
+            "departure_src": departure_src,
+            "departure_delayed": departure_delayed,
+            "departure_status": departure_status,
+            "platform_src": platform_src,
+            "platform_confirmed": platform_confirmed,
+            "platform_text": platform_text
+        }
+
+    def to_flat_orm(self, update_id: int, ts: datetime) -> db_model.FlatLocation:
+        return db_model.FlatLocation(**self.to_flat_row(update_id, ts))
+
     @classmethod
     @abstractmethod
     def create(cls, msg: dict) -> Location:
         ...
 
 
-@dataclass
+@dataclass(slots=True)
 class PassingLocation(Location):
 
     passing: LocationTimestamp
@@ -216,7 +280,7 @@ class PassingLocation(Location):
     @classmethod
     def create(cls, msg: dict) -> Location:
 
-        tpl = msg['@tpl']
+        tpl = intern(msg['@tpl'])
     
         if 'ns5:pass' not in msg:
             raise InvalidPassingLocation(f"Invalid message, no ns5:pass {msg}")
@@ -232,11 +296,12 @@ class PassingLocation(Location):
         return PassingLocation(
             tpl=tpl,
             passing=LocationTimestamp(
-                ts=datetime.strptime(actual_ts, "%H:%M") if actual_ts else datetime.strptime(estimated_ts, "%H:%M"),
-                src=src,
+                minutes=parse_minutes(actual_ts or estimated_ts),
+                src=intern(src) if src else src,
                 delayed=delayed,
                 status=Status.ACTUAL if actual_ts else Status.ESTIMATED
-            )
+            ),
+            working_times=working_times(msg.get('@wta'), msg.get('@wtd'), msg.get('@wtp'))
         )
 
     def format(self) -> dict:
@@ -246,14 +311,18 @@ class PassingLocation(Location):
             "departure": self.passing.format() if self.passing else None
         }
 
-    def to_orm(self, update_id: int) -> db_model.Location:
+    def to_orm(self, update_id: int, ts: datetime) -> db_model.Location:
         return db_model.Location(
             tpl=self.tpl,
             update_id=update_id,
+            ts=ts,
             departure=self.passing.to_orm()
         )
 
-@dataclass
+    def parts(self) -> tuple[Optional[LocationTimestamp], Optional[LocationTimestamp], Optional[Platform]]:
+        return None, self.passing, None
+
+@dataclass(slots=True)
 class StoppingLocation(Location):
 
     arrival: Optional[LocationTimestamp]
@@ -278,8 +347,8 @@ class StoppingLocation(Location):
         
 
         return LocationTimestamp(
-            ts=datetime.strptime(actual_ts, "%H:%M") if actual_ts else datetime.strptime(estimated_ts, "%H:%M"),
-            src=str(src),
+            minutes=parse_minutes(actual_ts or estimated_ts),
+            src=intern(str(src)),
             delayed=delayed,
             status=Status.ACTUAL if actual_ts else Status.ESTIMATED
         )
@@ -291,18 +360,18 @@ class StoppingLocation(Location):
             return None
 
         if type(platform) == str:
-            return Platform("unknown", False, str(platform))
+            return Platform("unknown", False, intern(str(platform)))
 
         src = platform.get('@platsrc')
         confirmed = bool(platform.get('@conf', False))
         text = platform.get('#text')
 
-        return Platform(str(src), confirmed, str(text))
+        return Platform(intern(str(src)), confirmed, intern(str(text)))
 
     @classmethod
     def create(cls, msg: dict) -> Location:
 
-        tpl = msg['@tpl']
+        tpl = intern(msg['@tpl'])
 
         try:
             arr = cls.parse_timestamp(msg.get('ns5:arr'))
@@ -316,7 +385,8 @@ class StoppingLocation(Location):
             tpl=tpl,
             arrival=arr,
             departure=dep,
-            platform=plat
+            platform=plat,
+            working_times=working_times(msg.get('@wta'), msg.get('@wtd'), msg.get('@wtp'))
         )
 
     def _type(self) -> LocationType:
@@ -337,11 +407,15 @@ class StoppingLocation(Location):
             "platform": asdict(self.platform) if self.platform else None
         }
 
-    def to_orm(self, update_id: int) -> db_model.Location:
+    def to_orm(self, update_id: int, ts: datetime) -> db_model.Location:
         return db_model.Location(
             tpl=self.tpl,
             update_id=update_id,
+            ts=ts,
             departure=self.departure.to_orm() if self.departure else None,
             arrival=self.arrival.to_orm() if self.arrival else None,
             platform=self.platform.to_orm() if self.platform else None
-        )
\ No newline at end of file
+        )
+
+    def parts(self) -> tuple[Optional[LocationTimestamp], Optional[LocationTimestamp], Optional[Platform]]:
+        return self.arrival, self.departure, self.platform
\ No newline at end of file
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import gzip
+import os
+import sys
+from typing import Callable
+
+from darwin.messages.src.common import Message, NotURMessage, RawMessage
+from darwin.messages.src.decoder import StreamingDecodeError, StreamingDecoder
+from darwin.messages.src.schedule import InvalidDarwinScheduleException, ScheduleParser, ScheduleTypeNotSupported
+from darwin.messages.src.ts import IncorrectMessageFormat, TSService
+import pytest
+
+
+def get_xml_fixture(file_name: str) -> bytes:
+    path = os.path.join(os.path.dirname(__file__), "pport_fixtures", file_name)
+
+    with open(path, 'rb') as _file:
+        return _file.read()
+
+
+def dict_ts(payload: bytes):
+    return TSService.parse(Message.from_message(RawMessage("TS", gzip.compress(payload))))
+
+
+def dict_schedule(payload: bytes):
+    msg = Message.from_message(RawMessage("SC", gzip.compress(payload)))
+    return ScheduleParser.create(msg.body, msg.timestamp)
+
+
+def outcome(func: Callable, payload: bytes):
+    try:
+        return func(payload)
+    except Exception as e:
+        return type(e)
+
+
+class TestStreamingDecoder:
+
+    @pytest.mark.parametrize(
+        "file_name",
+        [
+            "ts_stopping.xml",
+            "ts_passing.xml",
+            "ts_invalid_location.xml",
+        ]
+    )
+    def test_decode_ts__matches_dict_path(self, file_name: str) -> None:
+
+        payload = get_xml_fixture(file_name)
+
+        assert StreamingDecoder.decode_ts(payload) == dict_ts(payload)
+
+    def test_decode_ts__working_times(self) -> None:
+
+        payload = get_xml_fixture("ts_stopping.xml")
+
+        for message in [StreamingDecoder.decode_ts(payload), dict_ts(payload)]:
+            assert [location.working_times for location in message.locations] == [
+                "14:05/14:08/", "//14:20:30", "14:33/14:34/"
+            ]
+
+    def test_decode_ts__compact_locations(self) -> None:
+
+        payload = get_xml_fixture("ts_stopping.xml")
+
+        for message in [StreamingDecoder.decode_ts(payload), dict_ts(payload)]:
+            for location in message.locations:
+                assert not hasattr(location, "__dict__")
+                assert location.tpl is sys.intern(location.tpl)
+
+                for part in location.parts():
+                    if part is not None:
+                        assert not hasattr(part, "__dict__")
+                        assert part.src is sys.intern(part.src)
+
+    @pytest.mark.parametrize(
+        "file_name",
+        [
+            "sc_cis.xml",
+            "sc_cis_multiple.xml",
+            "sc_deactivated.xml",
+        ]
+    )
+    def test_decode_schedule__matches_dict_path(self, file_name: str) -> None:
+
+        payload = get_xml_fixture(file_name)
+
+        assert StreamingDecoder.decode_schedule(payload) == dict_schedule(payload)
+
+    @pytest.mark.parametrize(
+        "file_name,expected",
+        [
+            ("ts_not_td.xml", IncorrectMessageFormat),
+            ("ts_no_locations.xml", IncorrectMessageFormat),
+            ("ts_snapshot.xml", NotURMessage),
+        ]
+    )
+    def test_decode_ts__invalid(self, file_name: str, expected: type) -> None:
+
+        payload = get_xml_fixture(file_name)
+
+        assert outcome(StreamingDecoder.decode_ts, payload) == expected
+        assert outcome(dict_ts, payload) == expected
+
+    @pytest.mark.parametrize(
+        "file_name,expected",
+        [
+            ("sc_darwin_schedule.xml", InvalidDarwinScheduleException),
+            ("sc_unsupported.xml", ScheduleTypeNotSupported),
+        ]
+    )
+    def test_decode_schedule__invalid(self, file_name: str, expected: type) -> None:
+
+        payload = get_xml_fixture(file_name)
+
+        assert outcome(StreamingDecoder.decode_schedule, payload) == expected
+        assert outcome(dict_schedule, payload) == expected
+
+    def test_decode_ts__unsupported_shape(self) -> None:
+
+        payload = get_xml_fixture("ts_passing.xml").replace(b"<ns5:pass at=\"09:11\" src=\"TD\"/>", b"<ns5:pass/>")
+
+        with pytest.raises(StreamingDecodeError):
+            StreamingDecoder.decode_ts(payload)
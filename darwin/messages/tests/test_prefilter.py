@@ -0,0 +1,65 @@
+from __future__ import annotations
+import os
+import re
+
+from darwin.messages.src.decoder import StreamingDecoder
+from darwin.messages.src.prefilter import TiplocPrefilter
+import pytest
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "pport_fixtures")
+
+TS_FIXTURES = ["ts_stopping.xml", "ts_passing.xml", "ts_invalid_location.xml"]
+
+
+def get_xml_fixture(file_name: str) -> bytes:
+    with open(os.path.join(FIXTURE_DIR, file_name), 'rb') as _file:
+        return _file.read()
+
+
+def variants(payload: bytes) -> list[bytes]:
+    return [
+        payload,
+        re.sub(rb'tpl="([A-Z]*)"', rb"tpl='\1'", payload),
+        payload.replace(b'tpl="', b'tpl = "'),
+        payload.replace(b'tpl="B', b'tpl="&#66;'),
+    ]
+
+
+class TestTiplocPrefilter:
+
+    @pytest.mark.parametrize("file_name", TS_FIXTURES)
+    @pytest.mark.parametrize(
+        "tiplocs",
+        [
+            ["BRSTLTM"],
+            ["PADTON"],
+            ["READING", "SWINDON"],
+            ["BATHSPA", "DIDCOTP", "PADTON"],
+            ["BRSTLT", "RSTLTM"],
+            ["NOWHERE"],
+        ]
+    )
+    def test_may_match__no_false_negatives(self, file_name: str, tiplocs: list[str]) -> None:
+
+        prefilter = TiplocPrefilter(tiplocs)
+
+        for payload in variants(get_xml_fixture(file_name)):
+            ts_msg = StreamingDecoder.decode_ts(payload)
+
+            if any(ts_msg.filter_for(tpl) for tpl in tiplocs):
+                assert prefilter.may_match(payload)
+
+    @pytest.mark.parametrize(
+        "file_name,tiplocs,expected",
+        [
+            ("ts_stopping.xml", ["BRSTLTM"], True),
+            ("ts_stopping.xml", ["CHPNHAM", "PADTON"], True),
+            ("ts_stopping.xml", ["PADTON"], False),
+            ("ts_stopping.xml", ["BRSTLT"], False),
+            ("ts_passing.xml", ["BRSTLTM"], False),
+            ("ts_passing.xml", [], False),
+        ]
+    )
+    def test_may_match(self, file_name: str, tiplocs: list[str], expected: bool) -> None:
+
+        assert TiplocPrefilter(tiplocs).may_match(get_xml_fixture(file_name)) == expected
@@ -0,0 +1,140 @@
+from __future__ import annotations
+from datetime import datetime
+import glob
+import os
+import re
+
+from darwin.messages.src.times import (
+    format_minutes,
+    minutes_time,
+    parse_clock,
+    parse_hhmm,
+    parse_hhmmss,
+    parse_minutes,
+    parse_pport_timestamp,
+)
+import pytest
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "pport_fixtures")
+
+
+def strptime_pport(value: str) -> datetime:
+    return datetime.strptime(value.split(".")[0], "%Y-%m-%dT%H:%M:%S")
+
+
+def fixture_attributes(pattern: bytes) -> list[str]:
+
+    values = []
+
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.xml"))):
+        with open(path, "rb") as f:
+            values.extend(value.decode() for value in re.findall(pattern, f.read()))
+
+    return values
+
+
+class TestParseHHMM:
+
+    def test_parse_hhmm__every_minute(self) -> None:
+
+        for hour in range(24):
+            for minute in range(60):
+                value = f"{hour:02d}:{minute:02d}"
+                assert parse_hhmm(value) == datetime.strptime(value, "%H:%M")
+
+    def test_parse_hhmm__fixtures(self) -> None:
+
+        values = fixture_attributes(rb'\b(?:at|et|wet)="([^"]+)"')
+
+        assert values
+        for value in values:
+            assert parse_hhmm(value) == datetime.strptime(value, "%H:%M")
+
+    @pytest.mark.parametrize("value", ["9:05", "09:5", "9:5"])
+    def test_parse_hhmm__unpadded(self, value: str) -> None:
+        assert parse_hhmm(value) == datetime.strptime(value, "%H:%M")
+
+    @pytest.mark.parametrize("value", ["24:00", "12:60", "12:30:15", "", "ab:cd", " 12:30"])
+    def test_parse_hhmm__invalid(self, value: str) -> None:
+        with pytest.raises(ValueError):
+            parse_hhmm(value)
+
+
+class TestMinutes:
+
+    def test_round_trip__every_minute(self) -> None:
+
+        for hour in range(24):
+            for minute in range(60):
+                value = f"{hour:02d}:{minute:02d}"
+                minutes = parse_minutes(value)
+
+                assert minutes == hour * 60 + minute
+                assert format_minutes(minutes) == value
+                assert minutes_time(minutes) == datetime.strptime(value, "%H:%M").time()
+
+    @pytest.mark.parametrize("value,expected", [("9:05", 545), ("0:0", 0)])
+    def test_parse_minutes__unpadded(self, value: str, expected: int) -> None:
+        assert parse_minutes(value) == expected
+
+    @pytest.mark.parametrize("value", ["24:00", "12:60", "", "ab:cd"])
+    def test_parse_minutes__invalid(self, value: str) -> None:
+        with pytest.raises(ValueError):
+            parse_minutes(value)
+
+
+class TestParseHHMMSS:
+
+    @pytest.mark.parametrize("value", ["00:00:00", "14:20:30", "23:59:59", "9:05:07"])
+    def test_parse_hhmmss(self, value: str) -> None:
+        assert parse_hhmmss(value) == datetime.strptime(value, "%H:%M:%S")
+
+    @pytest.mark.parametrize("value", ["14:20:60", "14:20", "14:20:3a", "14-20-30"])
+    def test_parse_hhmmss__invalid(self, value: str) -> None:
+        with pytest.raises(ValueError):
+            parse_hhmmss(value)
+
+    @pytest.mark.parametrize(
+        "value,expected",
+        [
+            ("14:20", datetime(1900, 1, 1, 14, 20)),
+            ("14:20:30", datetime(1900, 1, 1, 14, 20, 30)),
+        ]
+    )
+    def test_parse_clock(self, value: str, expected: datetime) -> None:
+        assert parse_clock(value) == expected
+
+
+class TestParsePportTimestamp:
+
+    def test_parse_pport_timestamp__fixtures(self) -> None:
+
+        values = fixture_attributes(rb'<Pport[^>]*\bts="([^"]+)"')
+
+        assert values
+        for value in values:
+            assert parse_pport_timestamp(value) == strptime_pport(value)
+
+    @pytest.mark.parametrize(
+        "value",
+        [
+            "2024-06-18T14:05:12",
+            "2024-06-18T14:05:12.1",
+            "2024-06-18T14:05:12.4711243+01:00",
+            "2024-06-18T00:00:00.0000000",
+        ]
+    )
+    def test_parse_pport_timestamp(self, value: str) -> None:
+        assert parse_pport_timestamp(value) == strptime_pport(value)
+
+    @pytest.mark.parametrize(
+        "value",
+        ["2024-06-18T14:05:12+01:00", "2024-06-18T14:05:12Z", "2024-06-18T14:05:12-05:00"]
+    )
+    def test_parse_pport_timestamp__offset(self, value: str) -> None:
+        assert parse_pport_timestamp(value) == datetime(2024, 6, 18, 14, 5, 12)
+
+    @pytest.mark.parametrize("value", ["2024-06-18 14:05:12", "2024-06-18T25:05:12.1", "2024-06-18", ""])
+    def test_parse_pport_timestamp__invalid(self, value: str) -> None:
+        with pytest.raises(ValueError):
+            parse_pport_timestamp(value)
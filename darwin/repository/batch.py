@@ -0,0 +1,182 @@
+from __future__ import annotations
+from dataclasses import dataclass
+import json
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import sessionmaker
+
+from darwin.messages.src.ts import TSMessage
+from darwin.repository.cache import ServiceCache
+from darwin.repository.db import (
+    DatabaseRepositoryInterface,
+    LocationSchema,
+    database_engine,
+    warm_service_cache,
+    write_ts_messages,
+)
+from darwin.service.src.metrics import default_metrics
+
+
+@dataclass
+class FlushPolicy:
+
+    max_messages: int = 500
+    max_locations: int = 10000
+    max_delay_secs: float = 1.0
+    max_attempts: int = 3
+
+
+def print_dead_letter(message: TSMessage, error: Exception) -> None:
+    print(
+        f"Dead-lettered TS message for {message.update.service.rid} at {message.update.ts}: {error!r} "
+        f"{json.dumps(message.format(), default=str)}"
+    )
+
+
+class BatchedDatabaseRepository(DatabaseRepositoryInterface):
+
+    def __init__(
+        self,
+        engine: Engine,
+        policy: Optional[FlushPolicy] = None,
+        service_cache: Optional[ServiceCache] = None,
+        schema: LocationSchema = LocationSchema.NORMALISED,
+        dead_letter: Callable[[TSMessage, Exception], None] = print_dead_letter
+    ) -> None:
+        self._engine = engine
+        self._schema = schema
+        self._session = sessionmaker(engine)
+        self._policy = policy or FlushPolicy()
+        self.service_cache = service_cache or ServiceCache()
+        self._dead_letter = dead_letter
+        self._failures = 0
+        self._dead_lettered = 0
+
+        self._buffer: list[TSMessage] = []
+        self._buffered_locations = 0
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, name="batch-flush", daemon=True)
+        self._timer.start()
+
+    @classmethod
+    def create(cls, password: str, policy: Optional[FlushPolicy] = None) -> BatchedDatabaseRepository:
+        engine = database_engine(password)
+        return cls(engine=engine, policy=policy, service_cache=warm_service_cache(engine))
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def dead_lettered(self) -> int:
+        return self._dead_lettered
+
+    def save_ts_message(self, message: TSMessage) -> None:
+
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+
+            self._buffer.append(message)
+            self._buffered_locations += len(message.locations)
+
+            full = len(self._buffer) >= self._policy.max_messages or \
+                self._buffered_locations >= self._policy.max_locations
+
+        if full:
+            self.flush()
+
+    def _take(self) -> list[TSMessage]:
+
+        with self._lock:
+            batch = self._buffer
+            self._buffer = []
+            self._buffered_locations = 0
+            self._oldest = None
+
+            return batch
+
+    def _restore(self, batch: list[TSMessage]) -> None:
+
+        with self._lock:
+            self._buffer = batch + self._buffer
+            self._buffered_locations = sum(len(msg.locations) for msg in self._buffer)
+            self._oldest = time.monotonic()
+
+    def _write(self, batch: list[TSMessage]) -> None:
+
+        with default_metrics.time("db_flush"), self._session.begin() as session:
+            rids = write_ts_messages(session, self._engine, batch, self.service_cache, self._schema)
+
+        default_metrics.inc("db_flushed_messages", len(batch))
+
+        self.service_cache.add(rids)
+
+    def _isolate(self, batch: list[TSMessage], error: Exception) -> None:
+
+        # Halved until the messages the database refuses are on their own, the rest still gets written
+        if len(batch) == 1:
+            self._dead_lettered += 1
+            default_metrics.inc("db_dead_letters")
+            self._dead_letter(batch[0], error)
+            return
+
+        middle = len(batch) // 2
+
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                self._write(half)
+            except Exception as e:
+                self._isolate(half, e)
+
+    def flush(self) -> None:
+
+        with self._flush_lock:
+            batch = self._take()
+
+            if not batch:
+                return
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                self._failures += 1
+
+                # Retried whole while the failure may be the database's, past that one bad row
+                # must not hold back every later write
+                if self._failures < self._policy.max_attempts:
+                    self._restore(batch)
+                    raise
+
+                default_metrics.count_exception(e)
+                print(f"Batch of {len(batch)} messages failed {self._failures} times, isolating the failures")
+                self._isolate(batch, e)
+
+            self._failures = 0
+
+    def _flush_periodically(self) -> None:
+
+        while not self._closed.wait(self._policy.max_delay_secs / 4):
+            oldest = self._oldest
+
+            if oldest is None or time.monotonic() - oldest < self._policy.max_delay_secs:
+                continue
+
+            try:
+                self.flush()
+            except Exception as e:
+                default_metrics.count_exception(e)
+                print(traceback.format_exc())
+
+    def close(self) -> None:
+        self._closed.set()
+        self._timer.join()
+        self.flush()
@@ -0,0 +1,58 @@
+from __future__ import annotations
+from collections import OrderedDict
+import threading
+from typing import Iterable
+
+
+class ServiceCache:
+
+    def __init__(self, maxsize: int = 50000) -> None:
+        self._maxsize = maxsize
+        self._rids: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._rids)
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self._hits + self._misses
+        return self._hits / lookups if lookups else 0.0
+
+    def contains(self, rid: str) -> bool:
+
+        with self._lock:
+            if rid in self._rids:
+                self._rids.move_to_end(rid)
+                self._hits += 1
+                return True
+
+            self._misses += 1
+            return False
+
+    def add(self, rids: Iterable[str]) -> None:
+
+        with self._lock:
+            for rid in rids:
+                self._rids[rid] = None
+                self._rids.move_to_end(rid)
+
+            while len(self._rids) > self._maxsize:
+                self._rids.popitem(last=False)
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    def __str__(self) -> str:
+        return f"size={len(self)} hits={self._hits} misses={self._misses} hit_rate={self.hit_rate:.3f}"
@@ -0,0 +1,176 @@
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+from darwin.messages.src.ts import Location, ServiceUpdate, TSMessage
+from darwin.repository.db import DatabaseRepositoryInterface
+from darwin.service.src.delta import LocationKey, location_key
+from darwin.service.src.metrics import default_metrics
+
+
+@dataclass
+class CoalescePolicy:
+
+    window_secs: float = 0.5
+    max_trains: int = 10000
+
+
+@dataclass(slots=True)
+class _Pending:
+
+    since: float
+    update: ServiceUpdate
+    timestamp: datetime
+    locations: dict[LocationKey, Location]
+
+    def add(self, message: TSMessage) -> None:
+        self.update = message.update
+        self.timestamp = message.timestamp
+        # Keyed on each call's own identity, the delta-filtered subsets handed in put a call anywhere in the list
+        self.locations.update((location_key(location), location) for location in message.locations)
+
+    def merge(self, newer: _Pending) -> None:
+        self.update = newer.update
+        self.timestamp = newer.timestamp
+        self.locations.update(newer.locations)
+
+    def message(self) -> TSMessage:
+        return TSMessage(update=self.update, locations=list(self.locations.values()), timestamp=self.timestamp)
+
+
+class CoalescingRepository(DatabaseRepositoryInterface):
+
+    def __init__(
+        self,
+        repository: DatabaseRepositoryInterface,
+        policy: Optional[CoalescePolicy] = None,
+        clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self._repository = repository
+        self._policy = policy or CoalescePolicy()
+        self._clock = clock
+        self.service_cache = repository.service_cache
+
+        self._pending: OrderedDict[str, _Pending] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._merged = 0
+
+        default_metrics.gauge("coalesce_pending", lambda: len(self._pending))
+
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, name="coalesce-flush", daemon=True)
+        self._timer.start()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def merged(self) -> int:
+        return self._merged
+
+    def save_service_update(self, service_update: ServiceUpdate) -> int:
+        return self._repository.save_service_update(service_update)
+
+    def save_location(self, locations: list[Location], update_id: int) -> None:
+        self._repository.save_location(locations, update_id)
+
+    def save_ts_message(self, message: TSMessage) -> None:
+
+        rid = message.update.service.rid
+
+        with self._lock:
+            pending = self._pending.get(rid)
+
+            # The window runs from a train's first held update, so later ones never push its write back
+            if pending is None:
+                self._pending[rid] = _Pending(
+                    since=self._clock(),
+                    update=message.update,
+                    timestamp=message.timestamp,
+                    locations={location_key(location): location for location in message.locations}
+                )
+            else:
+                pending.add(message)
+                self._merged += 1
+
+            full = len(self._pending) > self._policy.max_trains
+
+        if pending is not None:
+            default_metrics.inc("coalesce_merged")
+
+        if full:
+            self.flush(force=False)
+
+    def _take(self, force: bool) -> list[tuple[str, _Pending]]:
+
+        due = self._clock() - self._policy.window_secs
+        taken = []
+
+        with self._lock:
+            while self._pending:
+                rid, pending = next(iter(self._pending.items()))
+
+                # Past max_trains the oldest trains are written early to bound the memory held
+                if not force and pending.since > due and len(self._pending) <= self._policy.max_trains:
+                    break
+
+                self._pending.popitem(last=False)
+                taken.append((rid, pending))
+
+        return taken
+
+    def _restore(self, taken: list[tuple[str, _Pending]]) -> None:
+
+        with self._lock:
+            for rid, pending in reversed(taken):
+                newer = self._pending.pop(rid, None)
+
+                if newer is not None:
+                    pending.merge(newer)
+
+                self._pending[rid] = pending
+                self._pending.move_to_end(rid, last=False)
+
+    def flush(self, force: bool = True) -> None:
+
+        with self._flush_lock:
+            taken = self._take(force)
+
+            for i, (_, pending) in enumerate(taken):
+                try:
+                    self._repository.save_ts_message(pending.message())
+                except Exception:
+                    self._restore(taken[i:])
+                    raise
+
+                default_metrics.observe("coalesce_hold", self._clock() - pending.since)
+
+            # A forced flush means everything held so far must be in the database when it returns
+            if force:
+                self._repository.flush()
+
+    def _flush_periodically(self) -> None:
+
+        # Updates are written within a quarter of a window of it closing
+        while not self._closed.wait(self._policy.window_secs / 4):
+            try:
+                self.flush(force=False)
+            except Exception as e:
+                default_metrics.count_exception(e)
+                print(traceback.format_exc())
+
+    def close(self) -> None:
+        self._closed.set()
+        self._timer.join()
+
+        try:
+            self.flush()
+        finally:
+            self._repository.close()
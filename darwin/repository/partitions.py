@@ -0,0 +1,208 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import date, timedelta
+from enum import Enum
+import re
+import threading
+import traceback
+from typing import Optional
+
+from sqlalchemy import Connection, Engine, text
+
+from darwin.service.src.metrics import default_metrics
+
+PARTITIONED_TABLES = ("service_update", "location", "location_flat")
+
+BOUNDS_PATTERN = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})[^']*'\) TO \('(\d{4}-\d{2}-\d{2})[^']*'\)")
+
+PARTITIONS_QUERY = text(
+    "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+    "FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+    "WHERE pg_inherits.inhparent = to_regclass(:table)"
+)
+PARTITIONED_QUERY = text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)")
+
+# Held for the maintenance transaction, so nodes starting together don't race to create the same partition
+LOCK_QUERY = text("SELECT pg_advisory_xact_lock(hashtext('darwin.maintain_partitions'))")
+
+
+class PartitionInterval(str, Enum):
+
+    DAILY = "daily"
+    WEEKLY = "weekly"
+
+    def start(self, day: date) -> date:
+        if self == PartitionInterval.WEEKLY:
+            return day - timedelta(days=day.weekday())
+        return day
+
+    def end(self, start: date) -> date:
+        return start + timedelta(days=7 if self == PartitionInterval.WEEKLY else 1)
+
+
+@dataclass(frozen=True)
+class Partition:
+
+    table: str
+    name: str
+    start: date
+    end: date
+
+    @classmethod
+    def create(cls, table: str, start: date, end: date) -> Partition:
+        return cls(table=table, name=f"{table}_{start:%Y%m%d}", start=start, end=end)
+
+    @classmethod
+    def parse(cls, table: str, name: str, bounds: str) -> Optional[Partition]:
+        match = BOUNDS_PATTERN.search(bounds)
+
+        # The DEFAULT partition has no range and is never created or retired here
+        if match is None:
+            return None
+
+        return cls(table, name, date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2)))
+
+    def overlaps(self, start: date, end: date) -> bool:
+        return self.start < end and start < self.end
+
+    def create_sql(self) -> str:
+        return (
+            f'CREATE TABLE IF NOT EXISTS "{self.name}" PARTITION OF "{self.table}" '
+            f"FOR VALUES FROM ('{self.start.isoformat()}') TO ('{self.end.isoformat()}')"
+        )
+
+    def detach_sql(self) -> str:
+        return f'ALTER TABLE "{self.table}" DETACH PARTITION "{self.name}"'
+
+    def drop_sql(self) -> str:
+        return f'DROP TABLE "{self.name}"'
+
+
+@dataclass
+class RetentionPolicy:
+
+    interval: PartitionInterval = PartitionInterval.DAILY
+    ahead_days: int = 7
+    # None keeps every partition, only partitions ahead are created
+    retain_days: Optional[int] = 90
+    drop: bool = False
+
+
+def plan_partitions(table: str, existing: list[Partition], today: date, policy: RetentionPolicy) -> list[str]:
+
+    statements = []
+
+    start = policy.interval.start(today)
+    horizon = today + timedelta(days=policy.ahead_days)
+
+    while start < horizon:
+        end = policy.interval.end(start)
+
+        # Ranges already covered, even by partitions of another interval, are left as they are
+        if not any(partition.overlaps(start, end) for partition in existing):
+            statements.append(Partition.create(table, start, end).create_sql())
+
+        start = end
+
+    if policy.retain_days is None:
+        return statements
+
+    cutoff = today - timedelta(days=policy.retain_days)
+
+    for partition in sorted(existing, key=lambda partition: partition.start):
+        if partition.end <= cutoff:
+            statements.append(partition.detach_sql())
+            if policy.drop:
+                statements.append(partition.drop_sql())
+
+    return statements
+
+
+def existing_partitions(connection: Connection, table: str) -> Optional[list[Partition]]:
+
+    if not connection.scalar(PARTITIONED_QUERY, {"table": table}):
+        return None
+
+    partitions = [
+        Partition.parse(table, name, bounds)
+        for name, bounds in connection.execute(PARTITIONS_QUERY, {"table": table})
+    ]
+    return [partition for partition in partitions if partition is not None]
+
+
+def maintain_partitions(
+    engine: Engine,
+    policy: RetentionPolicy,
+    today: Optional[date] = None,
+    execute: bool = True
+) -> list[str]:
+
+    if engine.dialect.name != "postgresql":
+        raise NotImplementedError(f"Partitions are not supported by {engine.dialect.name}")
+
+    today = today or date.today()
+    planned = []
+
+    with engine.begin() as connection:
+        connection.execute(LOCK_QUERY)
+
+        for table in PARTITIONED_TABLES:
+            existing = existing_partitions(connection, table)
+
+            if existing is None:
+                print(f"Skipping {table}, it is not partitioned")
+                continue
+
+            for statement in plan_partitions(table, existing, today, policy):
+                if execute:
+                    connection.execute(text(statement))
+                planned.append(statement)
+
+    return planned
+
+
+class PartitionMaintainer:
+
+    def __init__(
+        self,
+        engine: Engine,
+        policy: Optional[RetentionPolicy] = None,
+        interval_secs: float = 3600.0
+    ) -> None:
+        self._engine = engine
+        self._policy = policy or RetentionPolicy(retain_days=None)
+        self._interval_secs = interval_secs
+
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._maintain_periodically, name="partition-maintain", daemon=True)
+
+    def maintain(self) -> list[str]:
+
+        statements = maintain_partitions(self._engine, self._policy)
+
+        for statement in statements:
+            print(statement)
+
+        default_metrics.inc("partition_statements", len(statements))
+        return statements
+
+    def start(self) -> None:
+
+        # Run before anything is written, a database without today's partitions rejects every insert
+        self.maintain()
+        self._timer.start()
+
+    def _maintain_periodically(self) -> None:
+
+        while not self._closed.wait(self._interval_secs):
+            try:
+                self.maintain()
+            except Exception as e:
+                default_metrics.count_exception(e)
+                print(traceback.format_exc())
+
+    def close(self) -> None:
+        self._closed.set()
+
+        if self._timer.is_alive():
+            self._timer.join()
@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+import darwin.service.src.model as db_model
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+
+@pytest.fixture
+def engine():
+    # One shared connection, so the in-memory database is the same for the writer's thread
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    db_model.Base.metadata.create_all(engine)
+    return engine
@@ -0,0 +1,41 @@
+from __future__ import annotations
+from datetime import datetime
+
+from darwin.messages.src.ts import (
+    LocationTimestamp,
+    PassingLocation,
+    Platform,
+    Service,
+    ServiceUpdate,
+    Status,
+    StoppingLocation,
+    TSMessage,
+)
+import darwin.service.src.model as db_model
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+
+def ts_message(rid: str, minute: int) -> TSMessage:
+    ts = datetime(2024, 6, 18, 14, minute)
+    return TSMessage(
+        update=ServiceUpdate(service=Service(rid=rid, uid=f"U{rid}"), ts=ts),
+        locations=[
+            StoppingLocation(
+                tpl="BRSTLTM",
+                arrival=LocationTimestamp(14 * 60 + minute, "TD", False, Status.ACTUAL),
+                departure=None,
+                platform=Platform("A", True, "13")
+            ),
+            PassingLocation(
+                tpl="BATHSPA",
+                passing=LocationTimestamp(14 * 60 + minute + 1, "TD", False, Status.ESTIMATED)
+            )
+        ],
+        timestamp=ts
+    )
+
+
+def count(engine, table: type[db_model.Base]) -> int:
+    with Session(engine) as session:
+        return session.scalar(select(func.count()).select_from(table))
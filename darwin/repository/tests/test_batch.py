@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from darwin.repository import batch as batch_module
+from darwin.repository.batch import BatchedDatabaseRepository, FlushPolicy
+from darwin.repository.db import write_ts_messages
+from darwin.repository.tests.helpers import count, ts_message
+import darwin.service.src.model as db_model
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+
+class TestBatchedDatabaseRepository:
+
+    def test_save_ts_message__flushes_on_size(self, engine) -> None:
+
+        repository = BatchedDatabaseRepository(engine, FlushPolicy(max_messages=3, max_delay_secs=60))
+
+        for minute in range(5):
+            repository.save_ts_message(ts_message(f"rid{minute % 2}", minute))
+
+        assert count(engine, db_model.ServiceUpdate) == 3
+        assert repository.pending == 2
+
+        repository.close()
+
+        assert count(engine, db_model.Service) == 2
+        assert count(engine, db_model.ServiceUpdate) == 5
+        assert count(engine, db_model.Location) == 10
+        assert count(engine, db_model.Timestamp) == 10
+        assert count(engine, db_model.Platform) == 5
+
+    def test_save_ts_message__links_rows(self, engine) -> None:
+
+        repository = BatchedDatabaseRepository(engine, FlushPolicy(max_messages=10, max_delay_secs=60))
+
+        for minute in range(4):
+            repository.save_ts_message(ts_message(f"rid{minute}", minute * 10))
+
+        repository.close()
+
+        with Session(engine) as session:
+            for update in session.scalars(select(db_model.ServiceUpdate)):
+                minute = update.ts.minute
+                locations = session.scalars(
+                    select(db_model.Location).where(db_model.Location.update_id == update.update_id)
+                ).all()
+
+                assert update.rid == f"rid{minute // 10}"
+                assert [loc.tpl for loc in locations] == ["BRSTLTM", "BATHSPA"]
+                assert locations[0].arrival.ts.minute == minute
+                assert locations[0].platform.text == "13"
+                assert locations[1].departure.ts.minute == minute + 1
+                assert locations[1].arrival is None
+
+    def test_flush__keeps_rows_on_failure(self, engine) -> None:
+
+        repository = BatchedDatabaseRepository(engine, FlushPolicy(max_messages=10, max_delay_secs=60))
+        repository.save_ts_message(ts_message("rid1", 0))
+
+        db_model.Location.__table__.drop(engine)
+
+        with pytest.raises(Exception):
+            repository.flush()
+
+        assert repository.pending == 1
+
+        db_model.Location.__table__.create(engine)
+        repository.close()
+
+        assert count(engine, db_model.Location) == 2
+
+    def test_flush__dead_letters_rows_that_keep_failing(self, engine, monkeypatch) -> None:
+
+        def refuse_bad_rid(session, engine, batch, *args):
+            if any(message.update.service.rid == "bad" for message in batch):
+                raise ValueError("value too long for type character varying(16)")
+
+            return write_ts_messages(session, engine, batch, *args)
+
+        monkeypatch.setattr(batch_module, "write_ts_messages", refuse_bad_rid)
+
+        dead = []
+        repository = BatchedDatabaseRepository(
+            engine,
+            FlushPolicy(max_messages=100, max_delay_secs=60, max_attempts=2),
+            dead_letter=lambda message, error: dead.append(message.update.service.rid)
+        )
+
+        for minute, rid in enumerate(["rid1", "rid2", "bad", "rid3", "rid4"]):
+            repository.save_ts_message(ts_message(rid, minute))
+
+        with pytest.raises(ValueError):
+            repository.flush()
+
+        assert repository.pending == 5
+
+        repository.flush()
+
+        assert dead == ["bad"]
+        assert repository.dead_lettered == 1
+        assert repository.pending == 0
+        assert count(engine, db_model.ServiceUpdate) == 4
+
+        # Later writes are no longer held back behind the refused row
+        repository.save_ts_message(ts_message("rid5", 10))
+        repository.close()
+
+        assert count(engine, db_model.ServiceUpdate) == 5
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import time
+
+from darwin.messages.src.ts import LocationTimestamp, PassingLocation, Status, TSMessage
+from darwin.repository.coalesce import CoalescePolicy, CoalescingRepository
+from darwin.repository.db import DatabaseRepositoryInterface
+from darwin.repository.tests.helpers import ts_message
+import pytest
+
+
+class RecordingRepository(DatabaseRepositoryInterface):
+
+    def __init__(self, failures: int = 0) -> None:
+        self.messages: list[TSMessage] = []
+        self.closed = False
+        self.flushes = 0
+        self._failures = failures
+
+    def save_ts_message(self, message: TSMessage) -> None:
+        if self._failures:
+            self._failures -= 1
+            raise RuntimeError("database unavailable")
+
+        self.messages.append(message)
+
+    def flush(self) -> None:
+        self.flushes += 1
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class Clock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def delayed(rid: str, minute: int, delay: int) -> TSMessage:
+
+    message = ts_message(rid, minute)
+    message.locations[1].passing = LocationTimestamp(14 * 60 + minute + delay, "TD", True, Status.ESTIMATED)
+    return message
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+@pytest.fixture
+def inner() -> RecordingRepository:
+    return RecordingRepository()
+
+
+@pytest.fixture
+def repository(inner, clock):
+    # A window long enough that only the explicit flushes in each test write anything
+    repository = CoalescingRepository(inner, CoalescePolicy(window_secs=60), clock=clock)
+    yield repository
+    repository.close()
+
+
+class TestCoalescingRepository:
+
+    def test_save_ts_message__merges_locations(self, repository, inner, clock) -> None:
+
+        repository.save_ts_message(ts_message("rid1", 0))
+        repository.save_ts_message(delayed("rid1", 1, 5))
+        repository.save_ts_message(ts_message("rid2", 0))
+
+        assert repository.pending == 2
+        assert repository.merged == 1
+
+        clock.now = 61
+        repository.flush(force=False)
+
+        first, second = inner.messages
+        assert first.update.ts.minute == 1
+        assert [loc.tpl for loc in first.locations] == ["BRSTLTM", "BATHSPA"]
+        assert first.locations[0].arrival.minutes == 14 * 60 + 1
+        assert first.locations[1].passing.minutes == 14 * 60 + 6
+        assert second.update.service.rid == "rid2"
+
+    def test_save_ts_message__keeps_both_calls_at_a_looped_tiploc(self, repository, inner, clock) -> None:
+
+        def passing(minutes: int, wtp: str) -> PassingLocation:
+            return PassingLocation(
+                tpl="BATHSPA",
+                passing=LocationTimestamp(minutes, "TD", False, Status.ESTIMATED),
+                working_times=f"//{wtp}"
+            )
+
+        # Each update holds only the call that changed, both first in their message
+        first = ts_message("rid1", 0)
+        first.locations = [passing(14 * 60 + 10, "14:10")]
+        second = ts_message("rid1", 1)
+        second.locations = [passing(15 * 60 + 10, "15:10")]
+
+        repository.save_ts_message(first)
+        repository.save_ts_message(second)
+
+        clock.now = 61
+        repository.flush(force=False)
+
+        (message,) = inner.messages
+        assert [location.passing.minutes for location in message.locations] == [14 * 60 + 10, 15 * 60 + 10]
+
+    def test_flush__only_due_trains(self, repository, inner, clock) -> None:
+
+        repository.save_ts_message(ts_message("rid1", 0))
+        clock.now = 30
+        repository.save_ts_message(ts_message("rid2", 0))
+
+        # A later update leaves rid1's window where it started
+        clock.now = 59
+        repository.save_ts_message(ts_message("rid1", 1))
+
+        clock.now = 61
+        repository.flush(force=False)
+
+        assert [msg.update.service.rid for msg in inner.messages] == ["rid1"]
+        assert repository.pending == 1
+
+    def test_save_ts_message__bounded_trains(self, inner, clock) -> None:
+
+        repository = CoalescingRepository(inner, CoalescePolicy(window_secs=60, max_trains=2), clock=clock)
+
+        for rid in ["rid1", "rid2", "rid3"]:
+            repository.save_ts_message(ts_message(rid, 0))
+
+        assert [msg.update.service.rid for msg in inner.messages] == ["rid1"]
+        assert repository.pending == 2
+
+        repository.close()
+
+    def test_flush__restores_on_failure(self, clock) -> None:
+
+        inner = RecordingRepository(failures=1)
+        repository = CoalescingRepository(inner, CoalescePolicy(window_secs=60), clock=clock)
+
+        repository.save_ts_message(ts_message("rid1", 0))
+        repository.save_ts_message(ts_message("rid2", 0))
+
+        with pytest.raises(RuntimeError):
+            repository.flush()
+
+        repository.save_ts_message(delayed("rid1", 0, 5))
+        repository.close()
+
+        assert [msg.update.service.rid for msg in inner.messages] == ["rid1", "rid2"]
+        assert inner.messages[0].locations[1].passing.minutes == 14 * 60 + 5
+
+    def test_flush__forced_flushes_inner(self, repository, inner, clock) -> None:
+
+        repository.save_ts_message(ts_message("rid1", 0))
+
+        clock.now = 61
+        repository.flush(force=False)
+        assert inner.flushes == 0
+
+        repository.flush()
+        assert inner.flushes == 1
+
+    def test_close__flushes_and_closes(self, repository, inner) -> None:
+
+        repository.save_ts_message(ts_message("rid1", 0))
+        repository.close()
+
+        assert len(inner.messages) == 1
+        assert inner.closed
+
+    def test_flush_periodically__latency_bound(self, inner) -> None:
+
+        repository = CoalescingRepository(inner, CoalescePolicy(window_secs=0.05))
+        repository.save_ts_message(ts_message("rid1", 0))
+
+        deadline = time.monotonic() + 5
+        while not inner.messages and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert len(inner.messages) == 1
+        repository.close()
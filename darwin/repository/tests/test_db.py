@@ -0,0 +1,254 @@
+from __future__ import annotations
+from datetime import datetime, time
+
+from darwin.messages.src.ts import Service, ServiceUpdate
+from darwin.repository.cache import ServiceCache
+from darwin.repository.batch import BatchedDatabaseRepository
+from darwin.repository.db import (
+    DatabaseRepository,
+    LocationSchema,
+    MigrationError,
+    create_location_flat,
+    migrate_locations,
+    rid_window,
+    train_locations,
+    warm_service_cache,
+)
+from darwin.repository.tests.helpers import count, ts_message
+import darwin.service.src.model as db_model
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+
+def service_update(rid: str) -> ServiceUpdate:
+    return ServiceUpdate(service=Service(rid=rid, uid=f"U{rid}"), ts=datetime(2024, 6, 18, 14, 0))
+
+
+class TestDatabaseRepository:
+
+    def test_save_service_update__caches_known_services(self, engine) -> None:
+
+        repository = DatabaseRepository(engine)
+
+        first = repository.save_service_update(service_update("rid1"))
+        second = repository.save_service_update(service_update("rid1"))
+
+        assert count(engine, db_model.Service) == 1
+
+        assert second > first
+        assert repository.service_cache.hits == 1
+        assert repository.service_cache.misses == 1
+        assert repository.service_cache.hit_rate == 0.5
+
+    def test_save_service_update__existing_service_not_cached(self, engine) -> None:
+
+        DatabaseRepository(engine).save_service_update(service_update("rid1"))
+
+        repository = DatabaseRepository(engine)
+        repository.save_service_update(service_update("rid1"))
+
+        assert count(engine, db_model.ServiceUpdate) == 2
+
+    def test_save_ts_message(self, engine) -> None:
+
+        repository = DatabaseRepository(engine)
+        repository.save_ts_message(ts_message("rid1", 0))
+        repository.save_ts_message(ts_message("rid1", 5))
+
+        assert count(engine, db_model.Service) == 1
+        assert count(engine, db_model.ServiceUpdate) == 2
+        assert count(engine, db_model.Location) == 4
+        assert repository.service_cache.hits == 1
+
+    def test_save_ts_message__atomic(self, engine) -> None:
+
+        repository = DatabaseRepository(engine)
+        db_model.Location.__table__.drop(engine)
+
+        with pytest.raises(Exception):
+            repository.save_ts_message(ts_message("rid1", 0))
+
+        assert count(engine, db_model.Service) == 0
+        assert count(engine, db_model.ServiceUpdate) == 0
+        assert len(repository.service_cache) == 0
+
+    @pytest.mark.parametrize("schema", list(LocationSchema))
+    def test_save_location__copies_update_ts(self, engine, schema: LocationSchema) -> None:
+
+        repository = DatabaseRepository(engine, schema=schema)
+        message = ts_message("rid1", 5)
+
+        update_id = repository.save_service_update(message.update)
+        repository.save_location(message.locations, update_id)
+        repository.save_ts_message(ts_message("rid1", 7))
+
+        table = db_model.FlatLocation if schema == LocationSchema.FLAT else db_model.Location
+
+        with Session(engine) as session:
+            assert [ts.minute for ts in session.scalars(select(table.ts).order_by(table.loc_id))] == [5, 5, 7, 7]
+
+    def test_train_locations__bounded_by_rid_date(self, engine) -> None:
+
+        repository = DatabaseRepository(engine)
+        repository.save_ts_message(ts_message("202406180001", 0))
+
+        stale = ts_message("202406180001", 0)
+        stale.update.ts = datetime(2024, 6, 10, 14, 0)
+        repository.save_ts_message(stale)
+
+        with Session(engine) as session:
+            assert len(train_locations(session, "202406180001")) == 2
+            assert count(engine, db_model.Location) == 4
+
+    @pytest.mark.parametrize(
+        "rid, expected",
+        [
+            ("202406187143949", (datetime(2024, 6, 17), datetime(2024, 6, 20))),
+            ("rid1", None),
+        ]
+    )
+    def test_rid_window(self, rid: str, expected) -> None:
+        assert rid_window(rid) == expected
+
+    def test_warm_service_cache(self, engine) -> None:
+
+        repository = DatabaseRepository(engine)
+        for rid in ["202406170001", "202406180001", "202406180002"]:
+            repository.save_service_update(service_update(rid))
+
+        cache = warm_service_cache(engine, maxsize=2)
+
+        assert len(cache) == 2
+        assert cache.contains("202406180002")
+        assert cache.contains("202406180001")
+        assert not cache.contains("202406170001")
+
+
+def flat_rows(engine) -> list[dict]:
+
+    with Session(engine) as session:
+        rows = session.scalars(select(db_model.FlatLocation).order_by(db_model.FlatLocation.loc_id)).all()
+
+    columns = [column.name for column in db_model.FlatLocation.__table__.columns if column.name != "loc_id"]
+    return [{column: getattr(row, column) for column in columns} for row in rows]
+
+
+class TestFlatLocations:
+
+    def test_save_ts_message(self, engine) -> None:
+
+        repository = DatabaseRepository(engine, schema=LocationSchema.FLAT)
+        repository.save_ts_message(ts_message("rid1", 0))
+
+        assert count(engine, db_model.FlatLocation) == 2
+        assert count(engine, db_model.Location) == 0
+        assert count(engine, db_model.Timestamp) == 0
+        assert count(engine, db_model.Platform) == 0
+
+        stopping, passing = flat_rows(engine)
+
+        assert stopping["tpl"] == "BRSTLTM"
+        assert stopping["arrival_ts"] == time(14, 0)
+        assert stopping["arrival_status"] == "actual"
+        assert stopping["departure_ts"] is None
+        assert (stopping["platform_src"], stopping["platform_confirmed"], stopping["platform_text"]) == ("A", True, "13")
+
+        assert passing["tpl"] == "BATHSPA"
+        assert passing["arrival_ts"] is None
+        assert passing["departure_ts"] == time(14, 1)
+        assert passing["platform_text"] is None
+
+    def test_write_paths__agree(self, engine) -> None:
+
+        two_step = create_engine("sqlite://")
+        db_model.Base.metadata.create_all(two_step)
+
+        DatabaseRepository(engine, schema=LocationSchema.FLAT).save_ts_message(ts_message("rid1", 0))
+
+        batched = BatchedDatabaseRepository(two_step, schema=LocationSchema.FLAT)
+        batched.save_ts_message(ts_message("rid1", 0))
+        batched.close()
+
+        assert flat_rows(engine) == flat_rows(two_step)
+
+    def test_migrate_locations(self, engine) -> None:
+
+        normalised = DatabaseRepository(engine)
+        for minute in range(7):
+            normalised.save_ts_message(ts_message(f"rid{minute % 3}", minute))
+
+        expected = create_engine("sqlite://")
+        db_model.Base.metadata.create_all(expected)
+        flat = DatabaseRepository(expected, schema=LocationSchema.FLAT)
+        for minute in range(7):
+            flat.save_ts_message(ts_message(f"rid{minute % 3}", minute))
+
+        assert migrate_locations(engine, batch_size=3) == 14
+        assert flat_rows(engine) == flat_rows(expected)
+
+        # Rerunning resumes after the last migrated location rather than copying again
+        normalised.save_ts_message(ts_message("rid0", 9))
+
+        assert migrate_locations(engine, batch_size=3) == 2
+        assert count(engine, db_model.FlatLocation) == count(engine, db_model.Location) == 16
+
+        with Session(engine) as session:
+            for rid in ["rid0", "rid1", "rid2"]:
+                normalised_rows = train_locations(session, rid)
+                assert normalised_rows
+                assert sorted(normalised_rows) == sorted(train_locations(session, rid, LocationSchema.FLAT))
+
+    def test_migrate_locations__resumes_past_flat_ingestion(self, engine) -> None:
+
+        normalised = DatabaseRepository(engine)
+        for minute in range(3):
+            normalised.save_ts_message(ts_message("rid0", minute))
+
+        assert migrate_locations(engine, batch_size=2) == 6
+
+        # Written after the copy, so numbered past every location and never mistaken for the copy's progress
+        DatabaseRepository(engine, schema=LocationSchema.FLAT).save_ts_message(ts_message("rid1", 5))
+
+        assert migrate_locations(engine, batch_size=2) == 0
+        assert count(engine, db_model.FlatLocation) == 8
+
+    def test_migrate_locations__refuses_overlapping_flat_rows(self, engine) -> None:
+
+        normalised = DatabaseRepository(engine)
+        for minute in range(3):
+            normalised.save_ts_message(ts_message("rid0", minute))
+
+        DatabaseRepository(engine, schema=LocationSchema.FLAT).save_ts_message(ts_message("rid1", 5))
+
+        with pytest.raises(MigrationError):
+            migrate_locations(engine)
+
+        assert count(engine, db_model.FlatLocation) == 2
+
+    def test_migrate_locations__creates_location_flat(self, engine) -> None:
+
+        normalised = DatabaseRepository(engine)
+        for minute in range(3):
+            normalised.save_ts_message(ts_message("rid0", minute))
+
+        # A database from before location_flat existed
+        db_model.FlatLocation.__table__.drop(engine)
+
+        assert migrate_locations(engine) == 6
+        assert not create_location_flat(engine)
+        assert count(engine, db_model.FlatLocation) == 6
+
+
+class TestServiceCache:
+
+    def test_add__evicts_least_recently_used(self) -> None:
+
+        cache = ServiceCache(maxsize=2)
+        cache.add(["rid1", "rid2"])
+        cache.contains("rid1")
+        cache.add(["rid3"])
+
+        assert cache.contains("rid1")
+        assert cache.contains("rid3")
+        assert not cache.contains("rid2")
@@ -0,0 +1,100 @@
+from __future__ import annotations
+from datetime import date
+
+from darwin.repository.partitions import Partition, PartitionInterval, RetentionPolicy, plan_partitions
+import pytest
+
+
+def daily(table: str, day: int) -> Partition:
+    return Partition.create(table, date(2024, 6, day), date(2024, 6, day + 1))
+
+
+class TestPartition:
+
+    def test_create(self) -> None:
+
+        partition = daily("service_update", 18)
+
+        assert partition.name == "service_update_20240618"
+        assert partition.create_sql() == (
+            'CREATE TABLE IF NOT EXISTS "service_update_20240618" PARTITION OF "service_update" '
+            "FOR VALUES FROM ('2024-06-18') TO ('2024-06-19')"
+        )
+        assert partition.detach_sql() == 'ALTER TABLE "service_update" DETACH PARTITION "service_update_20240618"'
+        assert partition.drop_sql() == 'DROP TABLE "service_update_20240618"'
+
+    @pytest.mark.parametrize(
+        "bounds, expected",
+        [
+            (
+                "FOR VALUES FROM ('2024-06-18 00:00:00') TO ('2024-06-19 00:00:00')",
+                daily("location", 18)
+            ),
+            (
+                "FOR VALUES FROM ('2024-06-17') TO ('2024-06-24')",
+                Partition("location", "location_20240618", date(2024, 6, 17), date(2024, 6, 24))
+            ),
+            ("DEFAULT", None),
+        ]
+    )
+    def test_parse(self, bounds: str, expected: Partition) -> None:
+        assert Partition.parse("location", "location_20240618", bounds) == expected
+
+
+class TestPartitionInterval:
+
+    @pytest.mark.parametrize(
+        "interval, day, start, end",
+        [
+            (PartitionInterval.DAILY, date(2024, 6, 20), date(2024, 6, 20), date(2024, 6, 21)),
+            (PartitionInterval.WEEKLY, date(2024, 6, 20), date(2024, 6, 17), date(2024, 6, 24)),
+            (PartitionInterval.WEEKLY, date(2024, 6, 17), date(2024, 6, 17), date(2024, 6, 24)),
+        ]
+    )
+    def test_bounds(self, interval: PartitionInterval, day: date, start: date, end: date) -> None:
+        assert interval.start(day) == start
+        assert interval.end(interval.start(day)) == end
+
+
+class TestPlanPartitions:
+
+    def test_creates_missing_partitions_ahead(self) -> None:
+
+        existing = [daily("location", 18), daily("location", 19)]
+        statements = plan_partitions("location", existing, date(2024, 6, 18), RetentionPolicy(ahead_days=4))
+
+        assert statements == [daily("location", day).create_sql() for day in [20, 21]]
+
+    def test_weekly_skips_covered_ranges(self) -> None:
+
+        existing = [Partition.create("location", date(2024, 6, 17), date(2024, 6, 24))]
+        policy = RetentionPolicy(interval=PartitionInterval.WEEKLY, ahead_days=10)
+
+        assert plan_partitions("location", existing, date(2024, 6, 20), policy) == [
+            Partition.create("location", date(2024, 6, 24), date(2024, 7, 1)).create_sql()
+        ]
+
+    @pytest.mark.parametrize("drop", [False, True])
+    def test_retires_old_partitions(self, drop: bool) -> None:
+
+        existing = [daily("service_update", day) for day in [1, 2, 3, 18]]
+        policy = RetentionPolicy(ahead_days=1, retain_days=15, drop=drop)
+
+        statements = plan_partitions("service_update", existing, date(2024, 6, 18), policy)
+
+        retired = []
+        for partition in existing[:2]:
+            retired.append(partition.detach_sql())
+            if drop:
+                retired.append(partition.drop_sql())
+
+        assert statements == retired
+
+    def test_keeps_old_partitions_without_retention(self) -> None:
+
+        existing = [daily("service_update", day) for day in [1, 2, 3, 18]]
+        policy = RetentionPolicy(ahead_days=2, retain_days=None)
+
+        assert plan_partitions("service_update", existing, date(2024, 6, 18), policy) == [
+            daily("service_update", 19).create_sql()
+        ]
@@ -0,0 +1,149 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+import os
+import re
+from typing import Optional
+
+from darwin.repository.partitions import PARTITIONED_TABLES
+from darwin.service.src.model import Base
+from sqlalchemy.dialects import postgresql
+import pytest
+
+DB_SQL = os.path.join(os.path.dirname(__file__), "..", "..", "..", "db.sql")
+
+TABLE_PATTERN = re.compile(r"create table (\w+) \((.*?)\n\)(?: partition by range \((\w+)\))?;", re.DOTALL)
+INDEX_PATTERN = re.compile(r"create index (\w+) on (\w+)\(([^)]*)\);")
+FOREIGN_KEY_PATTERN = re.compile(r"FOREIGN KEY\((\w+)\)\s+REFERENCES (\w+)\((\w+)\)")
+KEY_PATTERN = re.compile(r"PRIMARY KEY\(([^)]*)\)")
+
+# How the types used in db.sql are spelt when SQLAlchemy compiles the models for Postgres
+TYPES = {"TIMESTAMP": "TIMESTAMP WITHOUT TIME ZONE", "TIME": "TIME WITHOUT TIME ZONE"}
+
+
+@dataclass
+class Table:
+
+    columns: dict[str, tuple[str, bool, bool]] = field(default_factory=dict)
+    primary_key: set[str] = field(default_factory=set)
+    foreign_keys: set[tuple[str, str, str]] = field(default_factory=set)
+    indexes: dict[str, tuple[str, ...]] = field(default_factory=dict)
+    partition_key: Optional[str] = None
+
+
+def split(body: str) -> list[str]:
+
+    # Commas inside PRIMARY KEY(a, b) don't end a definition
+    parts, depth, current = [], 0, ""
+
+    for char in body:
+        depth += {"(": 1, ")": -1}.get(char, 0)
+
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += char
+
+    return parts + [current.strip()]
+
+
+def columns(names: str) -> list[str]:
+    return [name.strip() for name in names.split(",")]
+
+
+def parse_ddl(sql: str) -> dict[str, Table]:
+
+    sql = re.sub(r"--[^\n]*", "", sql)
+    tables = {}
+
+    for name, body, partition_key in TABLE_PATTERN.findall(sql):
+        table = tables[name] = Table(partition_key=partition_key or None)
+
+        for definition in split(body):
+            if definition.startswith("CONSTRAINT"):
+                table.foreign_keys.add(FOREIGN_KEY_PATTERN.search(definition).groups())
+            elif definition.startswith("PRIMARY KEY"):
+                table.primary_key.update(columns(KEY_PATTERN.search(definition).group(1)))
+            else:
+                column, type_, rest = (definition.split(None, 2) + [""])[:3]
+
+                if "PRIMARY KEY" in rest:
+                    table.primary_key.add(column)
+
+                type_ = type_.upper()
+                table.columns[column] = (TYPES.get(type_, type_), "NOT NULL" in rest, "IDENTITY" in rest)
+
+        # Primary key columns are NOT NULL however the key is declared
+        for column in table.primary_key:
+            type_, _, identity = table.columns[column]
+            table.columns[column] = (type_, True, identity)
+
+    for name, table, names in INDEX_PATTERN.findall(sql):
+        tables[table].indexes[name] = tuple(columns(names))
+
+    return tables
+
+
+def parse_models() -> dict[str, Table]:
+
+    dialect = postgresql.dialect()
+    tables = {}
+
+    for name, model in Base.metadata.tables.items():
+        table = tables[name] = Table()
+
+        for column in model.columns:
+            table.columns[column.name] = (
+                column.type.compile(dialect=dialect),
+                not column.nullable,
+                column.identity is not None
+            )
+
+        table.primary_key = {column.name for column in model.primary_key.columns}
+        table.foreign_keys = {
+            (key.parent.name, key.column.table.name, key.column.name)
+            for key in model.foreign_keys
+        }
+        table.indexes = {index.name: tuple(column.name for column in index.columns) for index in model.indexes}
+
+    return tables
+
+
+@pytest.fixture(scope="module")
+def ddl() -> dict[str, Table]:
+    with open(DB_SQL) as f:
+        return parse_ddl(f.read())
+
+
+@pytest.fixture(scope="module")
+def models() -> dict[str, Table]:
+    return parse_models()
+
+
+class TestSchema:
+
+    def test_tables(self, ddl, models) -> None:
+        assert set(ddl) == set(models)
+
+    @pytest.mark.parametrize("table", sorted(Base.metadata.tables))
+    def test_columns(self, ddl, models, table: str) -> None:
+        assert models[table].columns == ddl[table].columns
+
+    @pytest.mark.parametrize("table", sorted(Base.metadata.tables))
+    def test_keys(self, ddl, models, table: str) -> None:
+        assert models[table].primary_key == ddl[table].primary_key
+        assert models[table].foreign_keys == ddl[table].foreign_keys
+
+    @pytest.mark.parametrize("table", sorted(Base.metadata.tables))
+    def test_indexes(self, ddl, models, table: str) -> None:
+        assert models[table].indexes == ddl[table].indexes
+
+    def test_partitioned_tables(self, ddl) -> None:
+
+        partitioned = {name for name, table in ddl.items() if table.partition_key}
+
+        assert partitioned == set(PARTITIONED_TABLES)
+
+        # Postgres requires the partition key in every unique constraint, the primary key included
+        for name in partitioned:
+            assert ddl[name].partition_key in ddl[name].primary_key
@@ -0,0 +1,335 @@
+from __future__ import annotations
+from collections import OrderedDict
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from typing import IO, NamedTuple, Optional
+
+SegmentIndex = dict[str, list["IndexEntry"]]
+
+from darwin.service.src.sink import TrainSink
+
+
+class IndexEntry(NamedTuple):
+
+    segment: str
+    block_offset: int
+    block_length: int
+    offset: int
+    length: int
+
+
+class TrainArchive(TrainSink):
+
+    def __init__(
+        self,
+        directory: str = "train_archive",
+        rotate_secs: float = 3600.0,
+        max_segment_bytes: int = 256 * 1024 * 1024,
+        block_size: int = 65536,
+        flush_interval_secs: float = 5.0,
+        cached_segments: int = 4
+    ) -> None:
+        self._directory = directory
+        self._rotate_secs = rotate_secs
+        self._max_segment_bytes = max_segment_bytes
+        self._block_size = block_size
+        self._flush_interval_secs = flush_interval_secs
+        self._cached_segments = cached_segments
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Indexes of closed segments are read from their .idx files when a lookup needs them,
+        # and only the last few are kept, so startup and memory don't grow with the archive
+        self._segments = self._find_segments()
+        self._cache: OrderedDict[str, SegmentIndex] = OrderedDict()
+        self._current: SegmentIndex = {}
+        self._lock = threading.Lock()
+
+        # Which segments hold each key, so a read only opens those. Segments already on disk
+        # are added by the first lookup, the ones written here as their blocks are flushed
+        self._key_segments: dict[str, list[str]] = {}
+        self._unmapped = list(self._segments)
+        self._map_lock = threading.Lock()
+
+        self._segment_name: Optional[str] = None
+        self._segment: Optional[IO[bytes]] = None
+        self._segment_index: Optional[IO[str]] = None
+        self._segment_started = 0.0
+
+        self._block = bytearray()
+        self._pending: list[tuple[str, int, int]] = []
+        self._last_flush = time.monotonic()
+
+    def _find_segments(self) -> list[str]:
+
+        segments = []
+
+        for path in sorted(glob.glob(f"{self._directory}/segment-*.idx")):
+            segment = os.path.basename(path)[:-len(".idx")]
+
+            # An index can outlive its data file when segments are pruned by hand
+            if os.path.exists(f"{self._directory}/{segment}.jsonl.gz"):
+                segments.append(segment)
+
+        return segments
+
+    def _load_segment(self, segment: str, key: Optional[str] = None) -> SegmentIndex:
+
+        index: SegmentIndex = {}
+        prefix = None if key is None else f"{key}\t"
+
+        try:
+            segment_size = os.path.getsize(f"{self._directory}/{segment}.jsonl.gz")
+            f = open(f"{self._directory}/{segment}.idx", "r")
+        except FileNotFoundError:
+            return index
+
+        with f:
+            for line in f:
+                # A lookup of one key only splits the lines that belong to it
+                if prefix is not None and not line.startswith(prefix):
+                    continue
+
+                fields = line.rstrip("\n").split("\t")
+
+                # A crash can leave a torn final line or an entry whose block never made it to disk
+                if len(fields) != 5:
+                    continue
+
+                name, block_offset, block_length, offset, length = fields
+                entry = IndexEntry(segment, int(block_offset), int(block_length), int(offset), int(length))
+
+                if entry.block_offset + entry.block_length <= segment_size:
+                    index.setdefault(name, []).append(entry)
+
+        return index
+
+    def _index_of(self, segment: str) -> SegmentIndex:
+
+        with self._lock:
+            # The open segment's index keeps growing, callers copy what they take from it
+            if segment == self._segment_name:
+                return self._current
+
+            index = self._cache.get(segment)
+
+            if index is not None:
+                self._cache.move_to_end(segment)
+                return index
+
+        # Parsed outside the lock so a lookup into old segments doesn't hold up appends
+        index = self._load_segment(segment)
+
+        with self._lock:
+            self._cache[segment] = index
+
+            while len(self._cache) > self._cached_segments:
+                self._cache.popitem(last=False)
+
+        return index
+
+    def _entries(self, segment: str, key: str) -> list[IndexEntry]:
+
+        with self._lock:
+            index = self._current if segment == self._segment_name else self._cache.get(segment)
+
+            if index is not None:
+                return list(index.get(key, []))
+
+        # Older segments are scanned for the key rather than cached whole, so reading an old
+        # train doesn't push the recent segments out of the cache
+        return self._load_segment(segment, key).get(key, [])
+
+    def _open_segment(self) -> None:
+
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        sequence = 0
+
+        while os.path.exists(f"{self._directory}/segment-{stamp}-{sequence:04d}.jsonl.gz"):
+            sequence += 1
+
+        self._segment_name = f"segment-{stamp}-{sequence:04d}"
+        self._segment = open(f"{self._directory}/{self._segment_name}.jsonl.gz", "ab")
+        self._segment_index = open(f"{self._directory}/{self._segment_name}.idx", "a")
+        self._segment_started = time.monotonic()
+        self._segments.append(self._segment_name)
+        self._current = {}
+
+    def _close_segment(self) -> None:
+
+        if self._segment is None:
+            return
+
+        self._segment.close()
+        self._segment_index.close()
+        self._segment = None
+        self._segment_index = None
+
+        # The closed segment's index is complete, it stays cached until newer lookups push it out
+        self._cache[self._segment_name] = self._current
+        self._segment_name = None
+        self._current = {}
+
+        while len(self._cache) > self._cached_segments:
+            self._cache.popitem(last=False)
+
+    def _rotate_due(self) -> bool:
+        return self._segment is None or \
+            self._segment.tell() >= self._max_segment_bytes or \
+            time.monotonic() - self._segment_started >= self._rotate_secs
+
+    def _flush_block(self) -> None:
+
+        self._last_flush = time.monotonic()
+
+        if not self._pending:
+            return
+
+        if self._rotate_due():
+            self._close_segment()
+            self._open_segment()
+
+        compressed = gzip.compress(bytes(self._block), compresslevel=6, mtime=0)
+        block_offset = self._segment.tell()
+
+        self._segment.write(compressed)
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+        entries = [
+            (key, IndexEntry(self._segment_name, block_offset, len(compressed), offset, length))
+            for key, offset, length in self._pending
+        ]
+
+        self._segment_index.write("".join(
+            f"{key}\t{entry.block_offset}\t{entry.block_length}\t{entry.offset}\t{entry.length}\n"
+            for key, entry in entries
+        ))
+        self._segment_index.flush()
+
+        for key, entry in entries:
+            self._current.setdefault(key, []).append(entry)
+            segments = self._key_segments.setdefault(key, [])
+
+            if not segments or segments[-1] != self._segment_name:
+                segments.append(self._segment_name)
+
+        self._block = bytearray()
+        self._pending = []
+
+    def append(self, key: str, rows: list[dict]) -> None:
+
+        if not rows:
+            return
+
+        data = "\n".join([json.dumps(x) for x in rows]).encode()
+
+        with self._lock:
+            self._pending.append((key, len(self._block), len(data)))
+            self._block += data
+            self._block += b"\n"
+
+            if len(self._block) >= self._block_size or \
+                    time.monotonic() - self._last_flush >= self._flush_interval_secs:
+                self._flush_block()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_block()
+
+    def _segments_to_read(self) -> list[str]:
+
+        with self._lock:
+            self._flush_block()
+            return list(self._segments)
+
+    def _map_keys(self) -> None:
+
+        with self._map_lock:
+            if not self._unmapped:
+                return
+
+            mapped: dict[str, list[str]] = {}
+
+            for segment in self._unmapped:
+                for key in self._index_of(segment):
+                    mapped.setdefault(key, []).append(segment)
+
+            with self._lock:
+                # Everything on disk at startup is older than what has been written since
+                for key, segments in self._key_segments.items():
+                    mapped.setdefault(key, []).extend(segments)
+
+                self._key_segments = mapped
+                self._unmapped = []
+
+    def keys(self) -> list[str]:
+
+        self._map_keys()
+
+        with self._lock:
+            self._flush_block()
+            return list(self._key_segments)
+
+    def _chunks(self, entries: list[IndexEntry]) -> list[bytes]:
+
+        chunks = []
+        block_key: Optional[tuple[str, int]] = None
+        block = b""
+
+        for entry in entries:
+            if block_key != (entry.segment, entry.block_offset):
+                with open(f"{self._directory}/{entry.segment}.jsonl.gz", "rb") as f:
+                    f.seek(entry.block_offset)
+                    block = gzip.decompress(f.read(entry.block_length))
+
+                block_key = (entry.segment, entry.block_offset)
+
+            chunks.append(block[entry.offset:entry.offset + entry.length])
+
+        return chunks
+
+    def read(self, key: str) -> list[dict]:
+
+        self._map_keys()
+
+        # The open block is written out first, or the key's latest rows would wait for the next append
+        with self._lock:
+            self._flush_block()
+            segments = list(self._key_segments.get(key, []))
+
+        entries = []
+
+        for segment in segments:
+            entries.extend(self._entries(segment, key))
+
+        return [json.loads(line) for chunk in self._chunks(entries) for line in chunk.split(b"\n")]
+
+    def export(self, directory: str) -> int:
+
+        exported: set[str] = set()
+
+        # Segment by segment, so each index is read once however many keys the archive holds
+        for segment in self._segments_to_read():
+            for key, entries in list(self._index_of(segment).items()):
+                path = f"{directory}/{key}"
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+                with open(path, "ab" if key in exported else "wb") as f:
+                    if key in exported:
+                        f.write(b"\n")
+                    f.write(b"\n".join(self._chunks(list(entries))))
+
+                exported.add(key)
+
+        return len(exported)
+
+    def close(self) -> None:
+
+        with self._lock:
+            self._flush_block()
+            self._close_segment()
@@ -0,0 +1,362 @@
+from __future__ import annotations
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from typing import Iterable, Iterator, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from darwin.messages.src.times import parse_minutes
+from darwin.messages.src.ts import LocationTimestamp, PassingLocation, Platform, TSMessage
+from darwin.service.src.delta import LocationKey, location_key
+from darwin.service.src.metrics import Metrics, default_metrics
+
+DAY_MINUTES = 24 * 60
+
+# Trains are dropped a few at a time as updates arrive rather than in one sweep that stalls readers
+EVICT_BATCH = 32
+
+# A board query copies out every entry it returns, so one request can't ask for the whole store
+MAX_BOARD_LIMIT = 200
+
+
+class BoardKind(str, Enum):
+
+    DEPARTURES = "departures"
+    ARRIVALS = "arrivals"
+
+
+def board_limit(value: str) -> int:
+
+    limit = int(value)
+
+    if limit < 1:
+        raise ValueError(f"Board limit must be at least 1, got {limit}")
+
+    return min(limit, MAX_BOARD_LIMIT)
+
+
+def absolute_minutes(ts: datetime, minutes: int) -> int:
+
+    # Darwin times carry no date, so each is placed within twelve hours of the update that sent it
+    now = ts.hour * 60 + ts.minute
+
+    if minutes - now < -DAY_MINUTES // 2:
+        minutes += DAY_MINUTES
+    elif minutes - now >= DAY_MINUTES // 2:
+        minutes -= DAY_MINUTES
+
+    return ts.toordinal() * DAY_MINUTES + minutes
+
+
+@dataclass(slots=True)
+class BoardEntry:
+
+    rid: str
+    uid: str
+    tpl: str
+    kind: BoardKind
+    at: int
+    timestamp: LocationTimestamp
+    platform: Optional[Platform]
+
+    def format(self) -> dict:
+        day = datetime.fromordinal(self.at // DAY_MINUTES).date()
+
+        return {
+            "rid": self.rid,
+            "uid": self.uid,
+            "tpl": self.tpl,
+            "kind": self.kind.value,
+            "date": day.isoformat(),
+            **self.timestamp.format(),
+            "platform": self.platform.text if self.platform else None,
+            "platform_confirmed": self.platform.confirmed if self.platform else None
+        }
+
+
+@dataclass(slots=True)
+class _Train:
+
+    uid: str
+    seen: datetime
+    events: dict[tuple[BoardKind, LocationKey], tuple[int, LocationTimestamp, Optional[Platform]]]
+
+
+class LiveStateStore:
+
+    def __init__(
+        self,
+        max_age: timedelta = timedelta(hours=3),
+        maxsize: int = 50000,
+        metrics: Optional[Metrics] = None
+    ) -> None:
+        self._max_age = max_age
+        self._maxsize = maxsize
+        self._metrics = metrics or default_metrics
+
+        self._trains: OrderedDict[str, _Train] = OrderedDict()
+        self._boards: dict[tuple[str, BoardKind], list[tuple[int, str, str]]] = {}
+        self._latest: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._evicted = 0
+
+        self._metrics.gauge("board_trains", lambda: len(self._trains))
+        self._metrics.gauge("board_events", lambda: self.events)
+
+    def __len__(self) -> int:
+        return len(self._trains)
+
+    @property
+    def events(self) -> int:
+        return sum(len(events) for events in self._boards.values())
+
+    @property
+    def evicted(self) -> int:
+        return self._evicted
+
+    @property
+    def latest(self) -> Optional[datetime]:
+        return self._latest
+
+    def _insert(self, tpl: str, kind: BoardKind, event: tuple[int, str, str]) -> None:
+        insort(self._boards.setdefault((tpl, kind), []), event)
+
+    def _remove(self, tpl: str, kind: BoardKind, event: tuple[int, str, str]) -> None:
+
+        board = self._boards[(tpl, kind)]
+        i = bisect_left(board, event)
+
+        if i < len(board) and board[i] == event:
+            del board[i]
+
+        if not board:
+            del self._boards[(tpl, kind)]
+
+    @staticmethod
+    def _events(message: TSMessage) -> Iterator[tuple[BoardKind, LocationKey, int, LocationTimestamp, Optional[Platform]]]:
+
+        ts = message.update.ts
+
+        for location in message.locations:
+            key = location_key(location)
+
+            # Passes have no one boarding or alighting, so never show on a board
+            if isinstance(location, PassingLocation):
+                continue
+
+            arrival, departure, platform = location.parts()
+
+            for kind, timestamp in ((BoardKind.ARRIVALS, arrival), (BoardKind.DEPARTURES, departure)):
+                if timestamp is not None:
+                    yield kind, key, absolute_minutes(ts, timestamp.minutes), timestamp, platform
+
+    def update(self, message: TSMessage) -> None:
+
+        rid = message.update.service.rid
+        ts = message.update.ts
+
+        with self._lock:
+            train = self._trains.pop(rid, None) or _Train(message.update.service.uid, ts, {})
+            train.seen = max(train.seen, ts)
+
+            for kind, key, at, timestamp, platform in self._events(message):
+                known = train.events.get((kind, key))
+
+                if known is None or known[0] != at:
+                    if known is not None:
+                        self._remove(key[0], kind, (known[0], rid, key[1]))
+                    self._insert(key[0], kind, (at, rid, key[1]))
+
+                train.events[(kind, key)] = (at, timestamp, platform or (known[2] if known else None))
+
+            self._trains[rid] = train
+            self._latest = ts if self._latest is None else max(self._latest, ts)
+            self._expire()
+
+    def restore(self, messages: Iterable[TSMessage]) -> int:
+
+        # Each board is appended to and sorted once at the end rather than kept sorted train by train
+        messages = sorted(messages, key=lambda message: message.update.ts, reverse=True)
+
+        if not messages:
+            return 0
+
+        with self._lock:
+            latest = messages[0].update.ts if self._latest is None else max(self._latest, messages[0].update.ts)
+            cutoff = latest - self._max_age
+            restored = 0
+            touched = set()
+
+            # Newest first, each going in ahead of the last, so the oldest stay at the front
+            for message in messages:
+                rid = message.update.service.rid
+
+                if message.update.ts < cutoff or len(self._trains) >= self._maxsize:
+                    break
+
+                if rid in self._trains:
+                    continue
+
+                train = _Train(message.update.service.uid, message.update.ts, {})
+
+                for kind, key, at, timestamp, platform in self._events(message):
+                    self._boards.setdefault((key[0], kind), []).append((at, rid, key[1]))
+                    train.events[(kind, key)] = (at, timestamp, platform)
+                    touched.add((key[0], kind))
+
+                self._trains[rid] = train
+                self._trains.move_to_end(rid, last=False)
+                restored += 1
+
+            for board in touched:
+                self._boards[board].sort()
+
+            self._latest = latest
+
+        return restored
+
+    def _drop(self, rid: str) -> None:
+
+        train = self._trains.pop(rid)
+
+        for (kind, (tpl, times)), (at, _, _) in train.events.items():
+            self._remove(tpl, kind, (at, rid, times))
+
+        self._evicted += 1
+
+    def _expire(self) -> None:
+
+        cutoff = self._latest - self._max_age
+
+        for _ in range(EVICT_BATCH):
+            if not self._trains:
+                return
+
+            rid, train = next(iter(self._trains.items()))
+
+            if train.seen >= cutoff and len(self._trains) <= self._maxsize:
+                return
+
+            self._drop(rid)
+
+    def evict(self, rids: Iterable[str]) -> None:
+
+        with self._lock:
+            for rid in rids:
+                if rid in self._trains:
+                    self._drop(rid)
+
+    def board(
+        self,
+        tpl: str,
+        kind: BoardKind = BoardKind.DEPARTURES,
+        at: Optional[datetime] = None,
+        limit: int = 10
+    ) -> list[BoardEntry]:
+
+        with self._metrics.time("board_query"), self._lock:
+            at = at or self._latest
+
+            if at is None:
+                return []
+
+            board = self._boards.get((tpl, kind), [])
+            start = bisect_left(board, (absolute_minutes(at, at.hour * 60 + at.minute),))
+            entries = []
+
+            for minute, rid, times in board[start:start + limit]:
+                train = self._trains[rid]
+                _, timestamp, platform = train.events[(kind, (tpl, times))]
+                entries.append(BoardEntry(rid, train.uid, tpl, kind, minute, timestamp, platform))
+
+            return entries
+
+    def train(self, rid: str) -> list[BoardEntry]:
+
+        with self._lock:
+            train = self._trains.get(rid)
+
+            if train is None:
+                return []
+
+            entries = [
+                BoardEntry(rid, train.uid, tpl, kind, at, timestamp, platform)
+                for (kind, (tpl, _)), (at, timestamp, platform) in train.events.items()
+            ]
+
+        return sorted(entries, key=lambda entry: entry.at)
+
+
+class _BoardHandler(BaseHTTPRequestHandler):
+
+    server: BoardServer
+
+    def do_GET(self) -> None:
+
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        try:
+            if len(parts) in (2, 3) and parts[0] == "board":
+                kind = BoardKind(parts[2]) if len(parts) == 3 else BoardKind.DEPARTURES
+                body = self.board(parts[1].upper(), kind, query)
+            elif len(parts) == 2 and parts[0] == "train":
+                body = {"rid": parts[1], "locations": [entry.format() for entry in self.server.store.train(parts[1])]}
+            else:
+                self.send_error(404)
+                return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+
+        data = json.dumps(body).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def board(self, tpl: str, kind: BoardKind, query: dict[str, str]) -> dict:
+
+        store = self.server.store
+        at = store.latest
+
+        # A clock time is taken on the feed's current day, the default is the feed's current time
+        if "at" in query and at is not None:
+            minutes = parse_minutes(query["at"])
+            at = at.replace(hour=minutes // 60, minute=minutes % 60, second=0)
+
+        entries = store.board(tpl, kind, at, board_limit(query.get("limit", "10")))
+
+        return {
+            "tpl": tpl,
+            "kind": kind.value,
+            "at": at.isoformat() if at else None,
+            "services": [entry.format() for entry in entries]
+        }
+
+    def log_message(self, format: str, *args) -> None:
+        ...
+
+
+class BoardServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], store: LiveStateStore) -> None:
+        super().__init__(address, _BoardHandler)
+        self.store = store
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, name="board-http", daemon=True).start()
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,162 @@
+from __future__ import annotations
+import bisect
+import glob
+import json
+import os
+import struct
+import threading
+import time
+from typing import IO, Iterator, NamedTuple, Optional
+
+_RECORD = struct.Struct("!dII")
+
+
+class CapturedFrame(NamedTuple):
+
+    received: float
+    headers: dict[str, str]
+    body: bytes
+
+
+class FrameCapture:
+
+    def __init__(
+        self,
+        directory: str = "capture",
+        rotate_secs: float = 3600.0,
+        max_segment_bytes: int = 1024 * 1024 * 1024
+    ) -> None:
+        self._directory = directory
+        self._rotate_secs = rotate_secs
+        self._max_segment_bytes = max_segment_bytes
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._segment: Optional[IO[bytes]] = None
+        self._segment_index: Optional[IO[str]] = None
+        self._segment_started = 0.0
+        self._indexed_second: Optional[int] = None
+        self._frames = 0
+
+    @property
+    def frames(self) -> int:
+        return self._frames
+
+    def _open_segment(self) -> None:
+
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        sequence = 0
+
+        while os.path.exists(f"{self._directory}/capture-{stamp}-{sequence:04d}.frames"):
+            sequence += 1
+
+        name = f"{self._directory}/capture-{stamp}-{sequence:04d}"
+        self._segment = open(f"{name}.frames", "ab")
+        self._segment_index = open(f"{name}.idx", "a")
+        self._segment_started = time.monotonic()
+        self._indexed_second = None
+
+    def _close_segment(self) -> None:
+
+        if self._segment is None:
+            return
+
+        self._segment.close()
+        self._segment_index.close()
+        self._segment = None
+        self._segment_index = None
+
+    def _rotate_due(self) -> bool:
+        return self._segment is None or \
+            self._segment.tell() >= self._max_segment_bytes or \
+            time.monotonic() - self._segment_started >= self._rotate_secs
+
+    def record(self, headers: dict[str, str], body: bytes, received: Optional[float] = None) -> None:
+
+        received = time.time() if received is None else received
+        encoded_headers = json.dumps(headers).encode()
+
+        with self._lock:
+            if self._rotate_due():
+                self._close_segment()
+                self._open_segment()
+
+            offset = self._segment.tell()
+
+            # The index holds the first frame of every second, enough to seek close to a start time
+            if self._indexed_second != int(received):
+                self._indexed_second = int(received)
+                self._segment_index.write(f"{received!r}\t{offset}\n")
+
+            self._segment.write(_RECORD.pack(received, len(encoded_headers), len(body)))
+            self._segment.write(encoded_headers)
+            self._segment.write(body)
+            self._frames += 1
+
+    def flush(self) -> None:
+
+        with self._lock:
+            if self._segment is not None:
+                self._segment.flush()
+                self._segment_index.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+    @staticmethod
+    def _seek_offset(index_path: str, start: float) -> int:
+
+        times: list[float] = []
+        offsets: list[int] = []
+
+        try:
+            with open(index_path, "r") as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+
+                    if len(fields) == 2:
+                        times.append(float(fields[0]))
+                        offsets.append(int(fields[1]))
+        except FileNotFoundError:
+            return 0
+
+        position = bisect.bisect_right(times, start) - 1
+        return offsets[position] if position >= 0 else 0
+
+    @classmethod
+    def read(
+        cls,
+        directory: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None
+    ) -> Iterator[CapturedFrame]:
+
+        for path in sorted(glob.glob(f"{directory}/capture-*.frames")):
+            offset = cls._seek_offset(path[:-len(".frames")] + ".idx", start) if start is not None else 0
+
+            with open(path, "rb") as f:
+                f.seek(offset)
+
+                while True:
+                    prefix = f.read(_RECORD.size)
+
+                    # A short read is the end of the segment or a frame torn by a crash
+                    if len(prefix) < _RECORD.size:
+                        break
+
+                    received, headers_length, body_length = _RECORD.unpack(prefix)
+                    headers = f.read(headers_length)
+                    body = f.read(body_length)
+
+                    if len(headers) < headers_length or len(body) < body_length:
+                        break
+
+                    if end is not None and received > end:
+                        return
+
+                    if start is not None and received < start:
+                        continue
+
+                    yield CapturedFrame(received, json.loads(headers), body)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import threading
+from typing import Iterable, Optional
+
+from darwin.messages.src.ts import Location, TSMessage
+
+LocationKey = tuple[str, str]
+
+
+def location_key(location: Location) -> LocationKey:
+
+    # Darwin sends only the locations that changed, so a TIPLOC called at twice on a loop is told apart by
+    # the working times every TS location carries, never by where it falls in the message
+    return location.tpl, location.working_times or ""
+
+
+def location_keys(locations: list[Location]) -> list[LocationKey]:
+    return [location_key(location) for location in locations]
+
+
+@dataclass(slots=True)
+class TrainState:
+
+    uid: str
+    seen: datetime
+    locations: dict[LocationKey, Location]
+
+
+class TrainStateTable:
+
+    def __init__(self, max_age: timedelta = timedelta(hours=6), maxsize: int = 50000) -> None:
+        self._max_age = max_age
+        self._maxsize = maxsize
+        self._trains: OrderedDict[str, TrainState] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._received = 0
+        self._written = 0
+        self._unchanged = 0
+        self._evicted_stale = 0
+        self._evicted_deactivated = 0
+
+    def __len__(self) -> int:
+        return len(self._trains)
+
+    @property
+    def received(self) -> int:
+        return self._received
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    @property
+    def unchanged(self) -> int:
+        return self._unchanged
+
+    @property
+    def evicted_stale(self) -> int:
+        return self._evicted_stale
+
+    @property
+    def evicted_deactivated(self) -> int:
+        return self._evicted_deactivated
+
+    @property
+    def write_amplification(self) -> float:
+        # Locations that would have been written without the table for each one that was
+        return self._received / self._written if self._written else 1.0
+
+    def delta(self, message: TSMessage) -> Optional[TSMessage]:
+
+        keys = location_keys(message.locations)
+
+        with self._lock:
+            entry = self._trains.get(message.update.service.rid)
+            known = entry.locations if entry else {}
+            changed = [location for key, location in zip(keys, message.locations) if known.get(key) != location]
+
+            self._received += len(message.locations)
+
+            if not changed:
+                self._unchanged += 1
+
+                # Repeats still show the train is running, so they keep it from going stale
+                if entry:
+                    entry.seen = message.update.ts
+                    self._trains.move_to_end(message.update.service.rid)
+
+                return None
+
+        return TSMessage(update=message.update, locations=changed, timestamp=message.timestamp)
+
+    def record(self, message: TSMessage, written: int) -> None:
+
+        rid = message.update.service.rid
+
+        with self._lock:
+            entry = self._trains.pop(rid, None) or TrainState(message.update.service.uid, message.update.ts, {})
+            entry.seen = message.update.ts
+            entry.locations.update(zip(location_keys(message.locations), message.locations))
+
+            self._trains[rid] = entry
+            self._written += written
+            self._expire(message.update.ts)
+
+    def _expire(self, now: datetime) -> None:
+
+        # Trains are kept in the order they were last updated, so the stale ones are all at the front
+        cutoff = now - self._max_age
+
+        while self._trains:
+            entry = next(iter(self._trains.values()))
+
+            if entry.seen >= cutoff and len(self._trains) <= self._maxsize:
+                return
+
+            self._trains.popitem(last=False)
+            self._evicted_stale += 1
+
+    def trains(self) -> list[tuple[str, TrainState]]:
+
+        # Copied under the lock so a snapshot is consistent while workers carry on recording
+        with self._lock:
+            return [
+                (rid, TrainState(entry.uid, entry.seen, dict(entry.locations)))
+                for rid, entry in self._trains.items()
+            ]
+
+    def restore(self, trains: Iterable[tuple[str, TrainState]]) -> int:
+
+        restored = 0
+
+        with self._lock:
+            # Newest first, each going in ahead of the last, so the table stays oldest first
+            for rid, entry in sorted(trains, key=lambda train: train[1].seen, reverse=True):
+                # Anything already heard from the feed is newer than the snapshot
+                if rid in self._trains:
+                    continue
+
+                self._trains[rid] = entry
+                self._trains.move_to_end(rid, last=False)
+                restored += 1
+
+            if self._trains:
+                self._expire(max(entry.seen for entry in self._trains.values()))
+
+        return restored
+
+    def evict(self, rids: Iterable[str]) -> None:
+
+        with self._lock:
+            for rid in rids:
+                if self._trains.pop(rid, None) is not None:
+                    self._evicted_deactivated += 1
+
+    def __str__(self) -> str:
+        return (
+            f"trains={len(self)} received={self._received} written={self._written} unchanged={self._unchanged} "
+            f"write_amplification={self.write_amplification:.2f} evicted_stale={self._evicted_stale} "
+            f"evicted_deactivated={self._evicted_deactivated}"
+        )
@@ -0,0 +1,264 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from enum import Enum
+import os
+import queue
+import struct
+import threading
+import traceback
+from typing import Callable, Optional
+import zlib
+
+from darwin.messages.src.common import RawMessage
+from darwin.service.src.metrics import default_metrics
+
+
+class IngestQueueClosed(Exception): ...
+
+
+class OverflowPolicy(str, Enum):
+
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    SPILL = "spill"
+
+
+@dataclass
+class IngestStats:
+
+    depth: int
+    max_depth: int
+    worker_depths: list[int]
+    processed: int
+    dropped: int
+    spilled: int
+
+    def __str__(self) -> str:
+        return (
+            f"depth={self.depth} max_depth={self.max_depth} workers={self.worker_depths} "
+            f"processed={self.processed} dropped={self.dropped} spilled={self.spilled}"
+        )
+
+
+class SpillFile:
+
+    HEADER = struct.Struct("!HI")
+
+    def __init__(self, path: str) -> None:
+        self._writer = open(path, "wb")
+        self._reader = open(path, "rb")
+        self._pending = 0
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def append(self, raw_message: RawMessage) -> None:
+
+        message_type = raw_message.message_type.encode()
+
+        self._writer.write(self.HEADER.pack(len(message_type), len(raw_message.data)))
+        self._writer.write(message_type)
+        self._writer.write(raw_message.data)
+        self._writer.flush()
+        self._pending += 1
+
+    def pop(self) -> Optional[RawMessage]:
+
+        if not self._pending:
+            return None
+
+        type_len, data_len = self.HEADER.unpack(self._reader.read(self.HEADER.size))
+        message_type = self._reader.read(type_len).decode()
+        data = self._reader.read(data_len)
+        self._pending -= 1
+
+        if not self._pending:
+            self._writer.seek(0)
+            self._writer.truncate()
+            self._reader.seek(0)
+
+        return RawMessage(message_type, data)
+
+    def close(self) -> None:
+        self._writer.close()
+        self._reader.close()
+
+
+class _Worker:
+
+    def __init__(self, maxsize: int, spill: Optional[SpillFile]) -> None:
+        self.queue: queue.Queue[Optional[RawMessage]] = queue.Queue(maxsize)
+        self.spill = spill
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.thread: Optional[threading.Thread] = None
+
+    def depth(self) -> int:
+        return self.queue.qsize() + (len(self.spill) if self.spill else 0)
+
+    def pop_spill(self) -> Optional[RawMessage]:
+
+        if not self.spill:
+            return None
+
+        with self.lock:
+            return self.spill.pop()
+
+
+class IngestQueue:
+
+    def __init__(
+        self,
+        workers: int = 4,
+        maxsize: int = 10000,
+        policy: OverflowPolicy = OverflowPolicy.BLOCK,
+        spill_directory: str = "spill"
+    ) -> None:
+
+        if workers < 1:
+            raise ValueError(f"At least one worker is required, got {workers}")
+
+        if policy == OverflowPolicy.SPILL and not os.path.exists(spill_directory):
+            os.makedirs(spill_directory)
+
+        self._policy = policy
+        self._workers = [
+            _Worker(
+                max(1, maxsize // workers),
+                SpillFile(f"{spill_directory}/worker-{i}.spill") if policy == OverflowPolicy.SPILL else None
+            )
+            for i in range(workers)
+        ]
+        self._closed = False
+        self._max_depth = 0
+        self._dropped = 0
+        self._spilled = 0
+
+    def start(self, process: Callable[[RawMessage], None]) -> None:
+
+        for i, worker in enumerate(self._workers):
+            worker.thread = threading.Thread(
+                target=self._run, args=(worker, process), name=f"ingest-worker-{i}", daemon=True
+            )
+            worker.thread.start()
+
+    def _worker_for(self, raw_message: RawMessage) -> _Worker:
+
+        rid = raw_message.head_rid
+
+        # Frames with no rid in their head, corrupt ones included, all go to the first worker to be dealt with there
+        if rid is None:
+            return self._workers[0]
+
+        return self._workers[zlib.crc32(rid.encode()) % len(self._workers)]
+
+    def submit(self, raw_message: RawMessage) -> None:
+
+        if self._closed:
+            raise IngestQueueClosed("Ingest queue has been closed")
+
+        worker = self._worker_for(raw_message)
+
+        if self._policy == OverflowPolicy.BLOCK:
+            worker.queue.put(raw_message)
+        elif self._policy == OverflowPolicy.DROP_OLDEST:
+            self._put_drop_oldest(worker, raw_message)
+        else:
+            self._put_spill(worker, raw_message)
+
+        self._max_depth = max(self._max_depth, self.depth())
+
+    def _put_drop_oldest(self, worker: _Worker, raw_message: RawMessage) -> None:
+
+        while True:
+            try:
+                worker.queue.put_nowait(raw_message)
+                return
+            except queue.Full:
+                pass
+
+            try:
+                worker.queue.get_nowait()
+                self._dropped += 1
+            except queue.Empty:
+                pass
+
+    def _put_spill(self, worker: _Worker, raw_message: RawMessage) -> None:
+
+        with worker.lock:
+            # Once anything has spilled, later messages follow it to disk so
+            # each worker still sees its rids in arrival order
+            if len(worker.spill) or worker.queue.full():
+                worker.spill.append(raw_message)
+                self._spilled += 1
+            else:
+                worker.queue.put_nowait(raw_message)
+
+    def _next(self, worker: _Worker) -> Optional[RawMessage]:
+
+        try:
+            return worker.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        spilled = worker.pop_spill()
+
+        if spilled is not None:
+            return spilled
+
+        return worker.queue.get()
+
+    def _process(self, worker: _Worker, process: Callable[[RawMessage], None], raw_message: RawMessage) -> None:
+
+        try:
+            process(raw_message)
+        except Exception as e:
+            default_metrics.count_exception(e)
+            print(traceback.format_exc())
+
+        worker.processed += 1
+
+    def _run(self, worker: _Worker, process: Callable[[RawMessage], None]) -> None:
+
+        while True:
+            raw_message = self._next(worker)
+
+            if raw_message is None:
+                break
+
+            self._process(worker, process, raw_message)
+
+        while (raw_message := worker.pop_spill()) is not None:
+            self._process(worker, process, raw_message)
+
+    def depth(self) -> int:
+        return sum(worker.depth() for worker in self._workers)
+
+    def stats(self) -> IngestStats:
+
+        worker_depths = [worker.depth() for worker in self._workers]
+
+        return IngestStats(
+            depth=sum(worker_depths),
+            max_depth=self._max_depth,
+            worker_depths=worker_depths,
+            processed=sum(worker.processed for worker in self._workers),
+            dropped=self._dropped,
+            spilled=self._spilled
+        )
+
+    def close(self) -> None:
+
+        if self._closed:
+            return
+
+        self._closed = True
+
+        for worker in self._workers:
+            worker.queue.put(None)
+
+        for worker in self._workers:
+            if worker.thread:
+                worker.thread.join()
+            if worker.spill:
+                worker.spill.close()
@@ -0,0 +1,77 @@
+from __future__ import annotations
+import threading
+import time
+from multiprocessing.sharedctypes import Synchronized
+from typing import Callable, Optional
+
+
+class LagMonitor:
+
+    def __init__(
+        self,
+        threshold_secs: float = 120.0,
+        recover_secs: Optional[float] = None,
+        smoothing: float = 0.05,
+        clock: Callable[[], float] = time.time
+    ) -> None:
+        self._threshold_secs = threshold_secs
+        self._recover_secs = threshold_secs / 2 if recover_secs is None else recover_secs
+        self._smoothing = smoothing
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._lag: Optional[float] = None
+        self._last_lag = 0.0
+        self._degraded = False
+        self._transitions = 0
+
+    @property
+    def lag(self) -> float:
+        return self._lag or 0.0
+
+    @property
+    def last_lag(self) -> float:
+        return self._last_lag
+
+    @property
+    def degraded(self) -> bool:
+        return self._degraded
+
+    @property
+    def transitions(self) -> int:
+        return self._transitions
+
+    def observe(self, sent_at: float) -> None:
+
+        lag = self._clock() - sent_at
+
+        with self._lock:
+            self._last_lag = lag
+            self._lag = lag if self._lag is None else self._lag + self._smoothing * (lag - self._lag)
+
+            # Separate enter and recover thresholds stop the mode flapping around a single value
+            if not self._degraded and self._lag > self._threshold_secs:
+                self._degraded = True
+            elif self._degraded and self._lag < self._recover_secs:
+                self._degraded = False
+            else:
+                return
+
+            self._transitions += 1
+            degraded, smoothed = self._degraded, self._lag
+
+        print(f"{'Entering' if degraded else 'Leaving'} degraded mode, ingest lag {smoothed:.1f}s")
+
+
+class DegradedFlag:
+
+    # Parse pool workers see no lag of their own and follow the mode the parent's monitor sets
+    def __init__(self, flag: Synchronized) -> None:
+        self._flag = flag
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self._flag.value)
+
+    def observe(self, sent_at: float) -> None:
+        ...
@@ -1,69 +1,222 @@
 from __future__ import annotations
-from dataclasses import asdict
-import json
-import os
-from typing import Optional
+from typing import Callable, Optional, Union
 
-from darwin.messages.src.schedule import InvalidDarwinScheduleException, ScheduleParser, ScheduleTypeNotSupported, Train
+from darwin.messages.src.schedule import (
+    InvalidDarwinScheduleException,
+    ScheduleParser,
+    ScheduleTypeNotSupported,
+    Train,
+    TrainDeactivated,
+)
+from darwin.messages.src.decoder import StreamingDecodeError, StreamingDecoder
+from darwin.messages.src.prefilter import TiplocPrefilter
 from darwin.messages.src.ts import TSMessage, TSService
-from darwin.messages.src.common import MessageType, Message
-from darwin.repository.db import DatabaseRepository
+from darwin.messages.src.common import MessageType, Message, RawMessage
+from darwin.repository.cache import ServiceCache
+from darwin.repository.db import DatabaseRepositoryInterface
+from darwin.service.src.board import LiveStateStore
+from darwin.service.src.delta import TrainStateTable
+from darwin.service.src.lag import DegradedFlag, LagMonitor
+from darwin.service.src.metrics import Metrics, default_metrics
+from darwin.service.src.shard import ShardPlan
+from darwin.service.src.sink import JsonlSink, TrainSink
+from darwin.service.src.watch import WatchSet
+
+Decoded = Union[TSMessage, list[Train]]
 
 
 class MessageService:
 
-    def __init__(self, repository: DatabaseRepository, message_filter: Optional[MessageType] = None) -> None:
+    def __init__(
+        self,
+        repository: DatabaseRepositoryInterface,
+        message_filter: Optional[MessageType] = None,
+        streaming: bool = True,
+        sink: Optional[TrainSink] = None,
+        watch: Optional[WatchSet] = None,
+        metrics: Optional[Metrics] = None,
+        lag: Optional[LagMonitor | DegradedFlag] = None,
+        shard: Optional[ShardPlan] = None,
+        state: Optional[TrainStateTable] = None,
+        board: Optional[LiveStateStore] = None
+    ) -> None:
 
         self._message_filter = message_filter
-        self._save_directory = "train_info"
+        self._streaming = streaming
         self._repository = repository
+        self._sink = sink or JsonlSink()
+        self._watch = watch or WatchSet.create()
+
+        if lag is not None and not self._watch.priority:
+            raise ValueError("Degraded mode needs at least one priority station")
+
+        self._metrics = metrics or default_metrics
+        self._lag = lag
+        self._shard = shard
+        self._state = state
+        self._board = board
+        self._dropped_frames = 0
+        self._unowned_frames = 0
+        self._ts_prefilter = TiplocPrefilter(self._watch.stations)
+        self._priority_prefilter = TiplocPrefilter(self._watch.priority)
+        self._prefiltered_frames = 0
+
+        handlers = {
+            MessageType.TS: self._decode_ts_frame,
+            MessageType.SC: self._decode_schedule_frame
+        }
+        self._handlers: dict[str, Callable[[RawMessage], Optional[Decoded]]] = {
+            message_type.value: handler
+            for message_type, handler in handlers.items()
+            if not message_filter or message_filter == message_type
+        }
+
+        for station in self._watch.matches():
+            self._metrics.gauge("station_matches", lambda station=station: self._watch.matches()[station], station=station)
+
+        if isinstance(lag, LagMonitor):
+            self._metrics.gauge("ingest_lag_seconds", lambda: lag.lag)
+            self._metrics.gauge("degraded", lambda: int(lag.degraded))
+
+        if state is not None:
+            self._metrics.gauge("train_state_trains", lambda: len(state))
+            self._metrics.gauge("write_amplification", lambda: state.write_amplification)
+            self._metrics.gauge("train_state_evicted", lambda: state.evicted_stale, reason="stale")
+            self._metrics.gauge("train_state_evicted", lambda: state.evicted_deactivated, reason="deactivated")
+
+    @property
+    def dropped_frames(self) -> int:
+        return self._dropped_frames
+
+    @property
+    def unowned_frames(self) -> int:
+        return self._unowned_frames
+
+    @property
+    def prefiltered_frames(self) -> int:
+        return self._prefiltered_frames
+
+    @property
+    def watch(self) -> WatchSet:
+        return self._watch
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def message_filter(self) -> Optional[MessageType]:
+        return self._message_filter
+
+    @property
+    def streaming(self) -> bool:
+        return self._streaming
+
+    @property
+    def degraded(self) -> bool:
+        return self._lag is not None and self._lag.degraded
+
+    @property
+    def state(self) -> Optional[TrainStateTable]:
+        return self._state
+
+    @property
+    def board(self) -> Optional[LiveStateStore]:
+        return self._board
+
+    @property
+    def service_cache(self) -> Optional[ServiceCache]:
+        return self._repository.service_cache
 
     def _save_schedule(self, message: list[Train]) -> None:
 
         for msg in message:
 
-            if not msg.filter("PADTON"):
+            with self._metrics.time("filter"):
+                stations = msg.stations(self._watch.schedule_stations)
+
+            if not stations:
                 continue
-                    
-            print(f"{msg.ts}: {msg}")
-            msg_name = msg.as_type()
 
-            if not os.path.exists(f"{self._save_directory}/{msg_name}"):
-                os.makedirs(f"{self._save_directory}/{msg_name}")
+            self._metrics.inc("trains_saved", type=msg.as_type())
 
-            try:
-                with open(f"{self._save_directory}/{msg_name}/{msg.rid}.json", "r") as f:
-                    data = [json.loads(line) for line in f]
-                    print(f"Updating file wth lines {len(data)}")
-            except FileNotFoundError:
-                data = []
-                print(f"Starting new file {len(data)}")
-            
-            data.extend(msg.as_dict())
+            if not msg.per_station:
+                with self._metrics.time("file_write"):
+                    self._sink.append(f"{msg.as_type()}/{msg.rid}.json", msg.as_dict())
+                continue
+
+            self._watch.record(stations)
 
-            with open(f"{self._save_directory}/{msg_name}/{msg.rid}.json", "w") as f:
-                f.write("\n".join([json.dumps(x) for x in data]))
+            with self._metrics.time("file_write"):
+                rows = msg.as_dict()
 
-    def _save_ts(self, message: TSMessage) -> None:
+                for station in sorted(stations):
+                    self._sink.append(f"{station}/{msg.as_type()}/{msg.rid}.json", rows)
 
-        if not message.filter_for("BRSTLTM"):
+    def _save_ts(self, message: TSMessage, stations: frozenset[str]) -> None:
+
+        rows = message.format()
+
+        for station in sorted(stations):
+            self._sink.append(f"{station}/{message.update.service.uid}.json", rows)
+
+    def _parse_ts(self, ts_msg: TSMessage) -> None:
+
+        with self._metrics.time("filter"):
+            stations = ts_msg.stations(self._watch.stations)
+
+            if stations and self.degraded:
+                shed = stations - self._watch.priority
+                stations = stations & self._watch.priority
+
+                if shed:
+                    self._metrics.inc("shed", type=MessageType.TS.value)
+
+        if not stations:
             return
-        
-        if not os.path.exists(f"{self._save_directory}/"):
-            os.makedirs(f"{self._save_directory}/")
 
-        try:
-            with open(f"{self._save_directory}/{message.update.service.uid}.json", "r") as f:
-                data = [json.loads(line) for line in f]
-                print(f"Updating file wth lines {len(data)}")
-        except FileNotFoundError:
-            data = []
-            print(f"Starting new file {len(data)}")
-        
-        data.extend(message.format())
+        self._watch.record(stations)
+
+        if self._board is not None:
+            with self._metrics.time("board_update"):
+                self._board.update(ts_msg)
+
+        with self._metrics.time("file_write"):
+            self._save_ts(ts_msg, stations)
+
+        self._persist_ts(ts_msg)
+
+    def _persist_ts(self, ts_msg: TSMessage) -> None:
+
+        # Darwin repeats forecasts it has already sent, only locations that changed since are written
+        changed = self._state.delta(ts_msg) if self._state is not None else ts_msg
+
+        self._metrics.inc("locations_received", len(ts_msg.locations))
+
+        if changed is None:
+            self._metrics.inc("ts_unchanged")
+            return
+
+        with self._metrics.time("db_write"):
+            self._repository.save_ts_message(changed)
+
+        if self._state is not None:
+            self._state.record(ts_msg, len(changed.locations))
+
+        self._metrics.inc("locations_written", len(changed.locations))
+        self._metrics.inc("ts_saved")
+
+    def _parse_schedule(self, msg: list[Train]) -> None:
+
+        deactivated = [train.rid for train in msg if isinstance(train, TrainDeactivated)]
 
-        with open(f"{self._save_directory}/{message.update.service.uid}.json", "w") as f:
-            f.write("\n".join([json.dumps(x) for x in data]))
+        if self._state is not None:
+            self._state.evict(deactivated)
+        if self._board is not None:
+            self._board.evict(deactivated)
+
+        if msg:
+            self._save_schedule(msg)
 
     def parse(self, message: Message) -> None: 
 
@@ -71,24 +224,139 @@ class MessageService:
             return
 
         if message.message_type == MessageType.TS:
-            ts_msg = TSService.parse(message)
-
-            self._save_ts(ts_msg)
-            
-            if ts_msg.filter_for("BRSTLTM"):
-                print(f"{ts_msg.update.service.uid}: {ts_msg.current} -> {ts_msg.destination}")
-                update = self._repository.save_service_update(ts_msg.update)
-                self._repository.save_location(ts_msg.locations, update)
+            self._parse_ts(TSService.parse(message))
         
         elif message.message_type == MessageType.SC:
             
             try:
-                msg = ScheduleParser.create(message.body, message.timestamp)
+                self._parse_schedule(ScheduleParser.create(message.body, message.timestamp))
+            except (ScheduleTypeNotSupported, InvalidDarwinScheduleException) as e:
+                self._metrics.count_exception(e)
+
+    def _decode_ts(self, raw_message: RawMessage) -> TSMessage:
+
+        if self._streaming:
+            try:
+                with self._metrics.time("xml_parse"):
+                    handler = StreamingDecoder.parse_ts(raw_message.payload)
+
+                with self._metrics.time("message_parse"):
+                    return handler.build()
+            except StreamingDecodeError as e:
+                self._metrics.count_exception(e)
+
+        with self._metrics.time("xml_parse"):
+            message = Message.from_message(raw_message)
+
+        with self._metrics.time("message_parse"):
+            return TSService.parse(message)
+
+    def _decode_schedule(self, raw_message: RawMessage) -> list[Train]:
+
+        if self._streaming:
+            try:
+                with self._metrics.time("xml_parse"):
+                    handler = StreamingDecoder.parse_schedule(raw_message.payload)
+
+                with self._metrics.time("message_parse"):
+                    return handler.build()
+            except StreamingDecodeError as e:
+                self._metrics.count_exception(e)
+
+        with self._metrics.time("xml_parse"):
+            message = Message.from_message(raw_message)
+
+        with self._metrics.time("message_parse"):
+            return ScheduleParser.create(message.body, message.timestamp)
+
+    def observe_lag(self, sent_at: Optional[float]) -> None:
+        if self._lag and sent_at is not None:
+            self._lag.observe(sent_at)
+
+    def _decompress(self, raw_message: RawMessage) -> bytes:
+
+        with self._metrics.time("decompress"):
+            payload = raw_message.payload
+
+        if isinstance(self._lag, LagMonitor):
+            self.observe_lag(raw_message.sent_at)
+
+        return payload
+
+    def _decode_ts_frame(self, raw_message: RawMessage) -> Optional[Decoded]:
+
+        payload = self._decompress(raw_message)
+        prefilter = self._priority_prefilter if self.degraded else self._ts_prefilter
+
+        with self._metrics.time("prefilter"):
+            may_match = prefilter.may_match(payload)
+
+        if not may_match:
+            self._prefiltered_frames += 1
+            self._metrics.inc("frames_prefiltered")
+            return None
+
+        return self._decode_ts(raw_message)
+
+    def _shed_schedule(self) -> bool:
+
+        # Schedules only feed train_info files, so they are the first work dropped when behind
+        if self.degraded:
+            self._metrics.inc("shed", type=MessageType.SC.value)
+            return True
+
+        return False
+
+    def _decode_schedule_frame(self, raw_message: RawMessage) -> Optional[Decoded]:
+
+        self._decompress(raw_message)
+
+        if self._shed_schedule():
+            return None
+
+        try:
+            return self._decode_schedule(raw_message)
+        except (ScheduleTypeNotSupported, InvalidDarwinScheduleException) as e:
+            self._metrics.count_exception(e)
+            return None
+
+    def admit(self, raw_message: RawMessage) -> bool:
+
+        if raw_message.message_type not in self._handlers:
+            self._dropped_frames += 1
+            self._metrics.inc("frames_dropped")
+            return False
+
+        # Only the frame's head is decompressed to find its rid, so other nodes' trains
+        # are dropped before they reach a queue or a parser
+        if self._shard and not self._shard.owns(raw_message):
+            self._unowned_frames += 1
+            self._metrics.inc("frames_unowned")
+            return False
+
+        return True
+
+    def parse_raw(self, raw_message: RawMessage) -> None:
+
+        if not self.admit(raw_message):
+            return
+
+        self._metrics.inc("frames", type=raw_message.message_type)
+
+        decoded = self.decode_raw(raw_message)
+
+        if decoded is not None:
+            self.apply(decoded)
+
+    def decode_raw(self, raw_message: RawMessage) -> Optional[Decoded]:
+        return self._handlers[raw_message.message_type](raw_message)
+
+    def apply(self, decoded: Decoded) -> None:
 
-                if msg:
-                    self._save_schedule(msg)
-            except ScheduleTypeNotSupported as e:
-                print(e)
-            except InvalidDarwinScheduleException as e:
-                pass
+        if isinstance(decoded, TSMessage):
+            self._parse_ts(decoded)
+        elif not self._shed_schedule():
+            self._parse_schedule(decoded)
 
+    def close(self) -> None:
+        self._sink.close()
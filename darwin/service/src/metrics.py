@@ -0,0 +1,308 @@
+from __future__ import annotations
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+# Exponential buckets from 1us to ~8s cover everything from a dict lookup to a stalled database write
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(24))
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+
+    pairs = labels + extra
+
+    if not pairs:
+        return ""
+
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def percentile(values: list[float], q: float) -> float:
+
+    # Exact, for timings kept as raw samples rather than observed into a Histogram
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class Histogram:
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS) -> None:
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self._buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q: float) -> float:
+
+        if not self.count:
+            return 0.0
+
+        # Reports the upper bound of the bucket holding the percentile, at most 2x out
+        rank = q / 100 * self.count
+        seen = 0
+
+        for bound, count in zip(self._buckets, self._counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return self._buckets[-1]
+
+    def merge(self, other: Histogram) -> None:
+
+        for i, count in enumerate(other._counts):
+            self._counts[i] += count
+
+        self.count += other.count
+        self.sum += other.sum
+
+    def cumulative(self) -> list[tuple[float, int]]:
+
+        seen = 0
+        counts = []
+
+        for bound, count in zip(self._buckets, self._counts):
+            seen += count
+            counts.append((bound, seen))
+
+        return counts
+
+
+class Metrics:
+
+    def __init__(self, prefix: str = "darwin") -> None:
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._histograms: dict[str, Histogram] = {}
+        self._gauges: dict[tuple[str, Labels], Callable[[], float]] = {}
+        self._started = time.monotonic()
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+
+        key = (name, _labels(labels))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def count_exception(self, exc: BaseException) -> None:
+        self.inc("exceptions", type=type(exc).__name__)
+
+    def counter(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get((name, _labels(labels)), 0)
+
+    def observe(self, stage: str, secs: float) -> None:
+
+        with self._lock:
+            histogram = self._histograms.get(stage)
+
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+
+            histogram.observe(secs)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def histogram(self, stage: str) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(stage)
+
+    def gauge(self, name: str, read: Callable[[], float], **labels: str) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = read
+
+    def drain(self) -> tuple[dict[tuple[str, Labels], float], dict[str, Histogram]]:
+
+        # Hands over everything recorded since the last drain, used to ship a worker
+        # process's metrics back to the registry that serves them
+        with self._lock:
+            counters, histograms = self._counters, self._histograms
+            self._counters, self._histograms = {}, {}
+
+        return counters, histograms
+
+    def merge(self, counters: dict[tuple[str, Labels], float], histograms: dict[str, Histogram]) -> None:
+
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+
+            for stage, histogram in histograms.items():
+                existing = self._histograms.get(stage)
+
+                if existing is None:
+                    self._histograms[stage] = histogram
+                else:
+                    existing.merge(histogram)
+
+    def reset(self) -> None:
+
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+            self._started = time.monotonic()
+
+    def _read_gauges(self) -> list[tuple[str, Labels, float]]:
+
+        with self._lock:
+            gauges = list(self._gauges.items())
+
+        values = []
+
+        for (name, labels), read in gauges:
+            try:
+                values.append((name, labels, float(read())))
+            except Exception as e:
+                self.count_exception(e)
+
+        return values
+
+    def render(self) -> str:
+
+        lines = []
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (stage, histogram.cumulative(), histogram.count, histogram.sum)
+                for stage, histogram in self._histograms.items()
+            )
+
+        lines.append(f"# TYPE {self._prefix}_stage_seconds histogram")
+        for stage, cumulative, count, total in histograms:
+            stage_label = (("stage", stage),)
+
+            for bound, seen in cumulative:
+                lines.append(f"{self._prefix}_stage_seconds_bucket{_format_labels(stage_label, (('le', f'{bound:g}'),))} {seen}")
+
+            lines.append(f"{self._prefix}_stage_seconds_bucket{_format_labels(stage_label, (('le', '+Inf'),))} {count}")
+            lines.append(f"{self._prefix}_stage_seconds_sum{_format_labels(stage_label)} {total}")
+            lines.append(f"{self._prefix}_stage_seconds_count{_format_labels(stage_label)} {count}")
+
+        typed: set[str] = set()
+
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {self._prefix}_{name}_total counter")
+                typed.add(name)
+
+            lines.append(f"{self._prefix}_{name}_total{_format_labels(labels)} {value:g}")
+
+        for name, labels, value in sorted(self._read_gauges()):
+            if name not in typed:
+                lines.append(f"# TYPE {self._prefix}_{name} gauge")
+                typed.add(name)
+
+            lines.append(f"{self._prefix}_{name}{_format_labels(labels)} {value:g}")
+
+        lines.append(f"# TYPE {self._prefix}_uptime_seconds gauge")
+        lines.append(f"{self._prefix}_uptime_seconds {time.monotonic() - self._started:.0f}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+
+        with self._lock:
+            stages = [
+                f"{stage} n={histogram.count} p50={histogram.percentile(50) * 1000:.3f}ms "
+                f"p99={histogram.percentile(99) * 1000:.3f}ms"
+                for stage, histogram in sorted(self._histograms.items())
+            ]
+            counters = [
+                f"{name}{_format_labels(labels)}={value:g}"
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+
+        gauges = [f"{name}{_format_labels(labels)}={value:g}" for name, labels, value in sorted(self._read_gauges())]
+
+        return " | ".join([f"uptime={time.monotonic() - self._started:.0f}s"] + stages + counters + gauges)
+
+
+default_metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    server: MetricsServer
+
+    def do_GET(self) -> None:
+
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.render().encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        ...
+
+
+class MetricsServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], metrics: Metrics = default_metrics) -> None:
+        super().__init__(address, _MetricsHandler)
+        self.metrics = metrics
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, name="metrics-http", daemon=True).start()
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class MetricsReporter:
+
+    def __init__(self, metrics: Metrics = default_metrics, interval_secs: float = 60.0) -> None:
+        self._metrics = metrics
+        self._interval_secs = interval_secs
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._report, name="metrics-report", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _report(self) -> None:
+        while not self._closed.wait(self._interval_secs):
+            print(self._metrics.summary())
+
+    def close(self) -> None:
+        self._closed.set()
+
+        if self._thread.is_alive():
+            self._thread.join()
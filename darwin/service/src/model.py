@@ -1,11 +1,41 @@
 from __future__ import annotations
 from datetime import datetime, time
-from typing import Any
-from sqlalchemy import ForeignKey
-from sqlalchemy import String, DateTime, Boolean, BigInteger, Time
+from typing import Any, Optional
+from sqlalchemy import ForeignKey, Identity, Index, PrimaryKeyConstraint
+from sqlalchemy import String, DateTime, Boolean, BigInteger, Integer, Time
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column, relationship
+from sqlalchemy.schema import Column, CreateColumn
+
+
+# SQLite only auto-increments INTEGER primary keys, used when testing against an in-memory database
+BigIntegerPK = BigInteger().with_variant(Integer(), "sqlite")
+
+
+def _composite_autoincrement(column: Column) -> bool:
+    return column is column.table.autoincrement_column and len(column.table.primary_key.columns) > 1
+
+
+# The partitioned tables are keyed on (id, ts) as in db.sql. SQLite can only generate ids for a lone
+# INTEGER PRIMARY KEY, so there the id is the rowid and the composite key is kept as a unique constraint
+@compiles(CreateColumn, "sqlite")
+def _sqlite_column(element: CreateColumn, compiler, **kw) -> str:
+
+    if _composite_autoincrement(element.element):
+        return f"{compiler.preparer.format_column(element.element)} INTEGER PRIMARY KEY"
+
+    return compiler.visit_create_column(element, **kw)
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_primary_key(constraint: PrimaryKeyConstraint, compiler, **kw) -> str:
+
+    if len(constraint.columns) > 1 and constraint.table.autoincrement_column is not None:
+        return f"UNIQUE ({', '.join(compiler.preparer.format_column(column) for column in constraint.columns)})"
+
+    return compiler.visit_primary_key_constraint(constraint, **kw)
 
 
 class Base(DeclarativeBase):
@@ -24,12 +54,16 @@ class Service(Base):
 
 class ServiceUpdate(Base):
     __tablename__ = "service_update"
+    __table_args__ = (Index("service_update_rid_ts", "rid", "ts"), Index("service_update_ts", "ts"))
 
-    update_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True)
+    update_id: Mapped[int] = mapped_column(BigIntegerPK, Identity(), primary_key=True, autoincrement=True)
+    ts: Mapped[datetime] = mapped_column(DateTime(), primary_key=True)
     rid: Mapped[str] = mapped_column(ForeignKey("service.rid"))
-    ts: Mapped[datetime] = mapped_column(DateTime(timezone=True))
 
-    location: Mapped["Location"] = relationship(back_populates="update")
+    location: Mapped["Location"] = relationship(
+        primaryjoin="and_(ServiceUpdate.update_id == foreign(Location.update_id), ServiceUpdate.ts == foreign(Location.ts))",
+        viewonly=True
+    )
 
     def __repr__(self) -> str:
         return f"ServiceUpdate(update_id={self.update_id!r}, rid={self.rid!r}, ts={self.ts!r})"
@@ -38,11 +72,11 @@ class ServiceUpdate(Base):
 class Timestamp(Base):
     __tablename__ = "timestamp"
 
-    ts_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True)
+    ts_id: Mapped[int] = mapped_column(BigIntegerPK, Identity(), primary_key=True)
     ts: Mapped[time] = mapped_column(Time())
-    src: Mapped[str] = mapped_column(String(30))
-    delayed: Mapped[bool] = mapped_column(Boolean())
-    status: Mapped[str] = mapped_column(String(30))
+    src: Mapped[Optional[str]] = mapped_column(String(30))
+    delayed: Mapped[Optional[bool]] = mapped_column(Boolean())
+    status: Mapped[Optional[str]] = mapped_column(String(30))
 
     def __repr__(self) -> str:
         return f"Timestamp(id={self.id!r}, status={self.status!r}, ts={self.ts!r})"
@@ -51,10 +85,10 @@ class Timestamp(Base):
 class Platform(Base):
     __tablename__ = "platform"
 
-    plat_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True)
-    src: Mapped[str] = mapped_column(String(30))
-    confirmed: Mapped[bool] = mapped_column(Boolean())
-    text: Mapped[str] = mapped_column(String(30))
+    plat_id: Mapped[int] = mapped_column(BigIntegerPK, Identity(), primary_key=True)
+    src: Mapped[Optional[str]] = mapped_column(String(30))
+    confirmed: Mapped[Optional[bool]] = mapped_column(Boolean())
+    text: Mapped[Optional[str]] = mapped_column(String(30))
 
     location: Mapped["Location"] = relationship(back_populates="platform")
 
@@ -64,22 +98,56 @@ class Platform(Base):
 
 class Location(Base):
     __tablename__ = "location"
+    __table_args__ = (Index("location_update_id", "update_id"), Index("location_tpl_ts", "tpl", "ts"))
 
-    loc_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True)
-    update_id: Mapped[str] = mapped_column(ForeignKey("service_update.update_id"))
+    loc_id: Mapped[int] = mapped_column(BigIntegerPK, Identity(), primary_key=True, autoincrement=True)
+    # No foreign key, service_update's key includes ts and both tables are retired by day together
+    update_id: Mapped[int] = mapped_column(BigInteger())
+    # The update's ts, copied down so the table can be partitioned and pruned on it like service_update
+    ts: Mapped[datetime] = mapped_column(DateTime(), primary_key=True)
     tpl: Mapped[str] = mapped_column(String(10))
 
-    arrival_id: Mapped[str] = mapped_column(ForeignKey("timestamp.ts_id"))
-    arrival: Mapped["Timestamp"] = relationship(foreign_keys=arrival_id)
+    arrival_id: Mapped[Optional[int]] = mapped_column(ForeignKey("timestamp.ts_id"))
+    arrival: Mapped[Optional["Timestamp"]] = relationship(foreign_keys=arrival_id)
+
+    departure_id: Mapped[Optional[int]] = mapped_column(ForeignKey("timestamp.ts_id"))
+    departure: Mapped[Optional["Timestamp"]] = relationship(foreign_keys=departure_id)
+
+    platform_id: Mapped[Optional[int]] = mapped_column(ForeignKey("platform.plat_id"))
+    platform: Mapped[Optional["Platform"]] = relationship(back_populates="location")
+
+    update: Mapped["ServiceUpdate"] = relationship(
+        primaryjoin="and_(ServiceUpdate.update_id == foreign(Location.update_id), ServiceUpdate.ts == foreign(Location.ts))",
+        viewonly=True
+    )
+
 
-    departure_id: Mapped[str] = mapped_column(ForeignKey("timestamp.ts_id"))
-    departure: Mapped["Timestamp"] = relationship(foreign_keys=departure_id)
+    def __repr__(self) -> str:
+        return f"Location(update_id={self.update_id!r}, toc={self.tpl!r})"
+
+
+class FlatLocation(Base):
+    __tablename__ = "location_flat"
+    __table_args__ = (Index("location_flat_update_id", "update_id"), Index("location_flat_tpl_ts", "tpl", "ts"))
+
+    loc_id: Mapped[int] = mapped_column(BigIntegerPK, Identity(), primary_key=True, autoincrement=True)
+    update_id: Mapped[int] = mapped_column(BigInteger())
+    ts: Mapped[datetime] = mapped_column(DateTime(), primary_key=True)
+    tpl: Mapped[str] = mapped_column(String(10))
 
-    platform_id: Mapped[str] = mapped_column(ForeignKey("platform.plat_id"))
-    platform: Mapped["Platform"] = relationship(back_populates="location")
+    arrival_ts: Mapped[Optional[time]] = mapped_column(Time())
+    arrival_src: Mapped[Optional[str]] = mapped_column(String(30))
+    arrival_delayed: Mapped[Optional[bool]] = mapped_column(Boolean())
+    arrival_status: Mapped[Optional[str]] = mapped_column(String(30))
 
-    update: Mapped["ServiceUpdate"] = relationship(back_populates="location")
+    departure_ts: Mapped[Optional[time]] = mapped_column(Time())
+    departure_src: Mapped[Optional[str]] = mapped_column(String(30))
+    departure_delayed: Mapped[Optional[bool]] = mapped_column(Boolean())
+    departure_status: Mapped[Optional[str]] = mapped_column(String(30))
 
+    platform_src: Mapped[Optional[str]] = mapped_column(String(30))
+    platform_confirmed: Mapped[Optional[bool]] = mapped_column(Boolean())
+    platform_text: Mapped[Optional[str]] = mapped_column(String(30))
 
     def __repr__(self) -> str:
-        return f"Location(update_id={self.update_id!r}, toc={self.tpl!r})"
\ No newline at end of file
+        return f"FlatLocation(update_id={self.update_id!r}, tpl={self.tpl!r})"
@@ -0,0 +1,372 @@
+from __future__ import annotations
+from dataclasses import dataclass
+import multiprocessing
+from multiprocessing.queues import Queue
+from multiprocessing.sharedctypes import Synchronized
+import queue
+import threading
+import time
+import traceback
+from typing import Optional
+import zlib
+
+from darwin.messages.src.common import MessageType, RawMessage
+from darwin.repository.db import DatabaseRepositoryInterface
+from darwin.service.src.lag import DegradedFlag
+from darwin.service.src.message_service import Decoded, MessageService
+from darwin.service.src.metrics import Histogram, Labels, Metrics
+from darwin.service.src.sink import TrainSink
+from darwin.service.src.watch import WatchSet
+
+
+class ParsePoolClosed(Exception): ...
+
+
+class ParsePoolStalled(Exception): ...
+
+
+@dataclass(frozen=True)
+class WorkerConfig:
+
+    stations: frozenset[str]
+    priority: frozenset[str]
+    schedule_stations: frozenset[str]
+    message_filter: Optional[MessageType]
+    streaming: bool
+
+    @classmethod
+    def create(cls, message_service: MessageService) -> WorkerConfig:
+        return cls(
+            stations=message_service.watch.stations,
+            priority=message_service.watch.priority,
+            schedule_stations=message_service.watch.schedule_stations,
+            message_filter=message_service.message_filter,
+            streaming=message_service.streaming
+        )
+
+
+@dataclass
+class ParseResult:
+
+    worker: int
+    frames: int
+    decoded: Optional[list[Decoded]]
+    sent_at: Optional[float]
+    counters: dict[tuple[str, Labels], float]
+    histograms: dict[str, Histogram]
+
+
+@dataclass
+class PoolStats:
+
+    submitted: int
+    completed: int
+    dropped: int
+    died: int
+    worker_frames: list[int]
+
+    @property
+    def depth(self) -> int:
+        return self.submitted - self.completed - self.dropped
+
+    def __str__(self) -> str:
+        return (
+            f"submitted={self.submitted} completed={self.completed} dropped={self.dropped} "
+            f"died={self.died} workers={self.worker_frames}"
+        )
+
+
+def _run_worker(index: int, config: WorkerConfig, inbound: Queue, results: Queue, degraded: Synchronized) -> None:
+
+    # Workers only decompress, prefilter and decode, everything they find goes back to the
+    # writer in the parent so the sink and database still see a single writer
+    metrics = Metrics()
+    service = MessageService(
+        DatabaseRepositoryInterface(),
+        message_filter=config.message_filter,
+        streaming=config.streaming,
+        sink=TrainSink(),
+        watch=WatchSet(config.stations, config.priority, config.schedule_stations),
+        metrics=metrics,
+        lag=DegradedFlag(degraded) if config.priority else None
+    )
+
+    while (batch := inbound.get()) is not None:
+
+        decoded = []
+        raw_message = None
+
+        for message_type, data in batch:
+            raw_message = RawMessage(message_type, data)
+
+            try:
+                item = service.decode_raw(raw_message)
+            except Exception as e:
+                metrics.count_exception(e)
+                continue
+
+            if item is not None:
+                decoded.append(item)
+
+        try:
+            sent_at = raw_message.sent_at if raw_message else None
+        except Exception:
+            sent_at = None
+
+        results.put(ParseResult(index, len(batch), decoded, sent_at, *metrics.drain()))
+
+    results.put(ParseResult(index, 0, None, None, *metrics.drain()))
+
+
+class ParsePool:
+
+    def __init__(
+        self,
+        message_service: MessageService,
+        processes: int = 2,
+        batch_size: int = 64,
+        max_delay_secs: float = 0.05,
+        maxsize: int = 10000,
+        start_method: str = "spawn",
+        put_timeout_secs: float = 30.0,
+        poll_secs: float = 1.0
+    ) -> None:
+
+        if processes < 1:
+            raise ValueError(f"At least one process is required, got {processes}")
+
+        self._message_service = message_service
+        self._batch_size = batch_size
+        self._max_delay_secs = max_delay_secs
+        self._put_timeout_secs = put_timeout_secs
+        self._poll_secs = poll_secs
+
+        self._context = multiprocessing.get_context(start_method)
+        self._config = WorkerConfig.create(message_service)
+
+        self._queue_size = max(1, maxsize // (processes * batch_size))
+        self._inbound: list[Queue] = [self._context.Queue(self._queue_size) for _ in range(processes)]
+        self._results: Queue = self._context.Queue()
+        self._degraded: Synchronized = self._context.Value("b", 0)
+        self._processes = [self._process(i) for i in range(processes)]
+
+        # A frame is appended and its batch handed over under its shard's lock, so the
+        # periodic flush can never overtake a full batch and reorder a train's updates
+        self._pending: list[list[tuple[str, bytes]]] = [[] for _ in range(processes)]
+        self._locks = [threading.Lock() for _ in range(processes)]
+
+        self._submitted = 0
+        self._completed = 0
+        self._dropped = 0
+        self._died = 0
+        self._handed = [0] * processes
+        self._counts_lock = threading.Lock()
+        self._worker_frames = [0] * processes
+        self._started = False
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._write, name="parse-writer", daemon=True)
+        self._timer = threading.Thread(target=self._flush_periodically, name="parse-flush", daemon=True)
+
+    @property
+    def processes(self) -> int:
+        return len(self._processes)
+
+    def _process(self, i: int) -> multiprocessing.Process:
+        return self._context.Process(
+            target=_run_worker,
+            args=(i, self._config, self._inbound[i], self._results, self._degraded),
+            name=f"parse-worker-{i}",
+            daemon=True
+        )
+
+    def start(self) -> None:
+
+        if self._started:
+            return
+
+        self._started = True
+
+        for process in self._processes:
+            process.start()
+
+        self._writer.start()
+        self._timer.start()
+
+    def _shard(self, raw_message: RawMessage) -> int:
+        key = (raw_message.rid or "").encode()
+        return zlib.crc32(key) % len(self._processes)
+
+    def submit(self, raw_message: RawMessage) -> None:
+
+        if self._closed.is_set():
+            raise ParsePoolClosed("Parse pool has been closed")
+
+        shard = self._shard(raw_message)
+        self._message_service.metrics.inc("frames", type=raw_message.message_type)
+
+        with self._locks[shard]:
+            pending = self._pending[shard]
+            pending.append((raw_message.message_type, raw_message.data))
+            self._submitted += 1
+
+            if len(pending) >= self._batch_size:
+                self._pending[shard] = []
+                self._hand_over(shard, pending)
+
+    def _hand_over(self, shard: int, pending: list[tuple[str, bytes]]) -> None:
+
+        inbound = self._inbound[shard]
+
+        # Never waits on a slow worker, the receiver thread would stop reading the socket. As with
+        # the ingest queue's drop-oldest policy the oldest batch makes room for the newest, and
+        # only a queue nothing can be taken from, its worker dead holding the read lock, drops it
+        try:
+            inbound.put_nowait(pending)
+            self._count(shard, handed=len(pending))
+            return
+        except queue.Full:
+            pass
+
+        try:
+            oldest = inbound.get_nowait()
+            self._count(shard, handed=-len(oldest), dropped=len(oldest))
+            inbound.put_nowait(pending)
+            self._count(shard, handed=len(pending))
+        except (queue.Empty, queue.Full) as e:
+            self._count(shard, dropped=len(pending))
+            raise ParsePoolStalled(f"Parse worker {shard} is not taking batches, dropped {len(pending)} frames") from e
+
+    def _count(self, shard: int, handed: int = 0, dropped: int = 0) -> None:
+
+        with self._counts_lock:
+            self._handed[shard] += handed
+            self._dropped += dropped
+
+        if dropped:
+            self._message_service.metrics.inc("parse_pool_dropped", dropped)
+
+    def flush(self) -> None:
+
+        for shard, lock in enumerate(self._locks):
+            with lock:
+                pending = self._pending[shard]
+
+                if pending:
+                    self._pending[shard] = []
+                    self._hand_over(shard, pending)
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self._max_delay_secs):
+            try:
+                self.flush()
+            except ParsePoolStalled as e:
+                self._message_service.metrics.count_exception(e)
+                print(e)
+
+    def _apply(self, decoded: Decoded) -> None:
+
+        try:
+            self._message_service.apply(decoded)
+        except Exception as e:
+            self._message_service.metrics.count_exception(e)
+            print(traceback.format_exc())
+
+    def _reap(self, finished: set[int]) -> None:
+
+        metrics = self._message_service.metrics
+
+        for i, process in enumerate(self._processes):
+            # Exiting cleanly only follows putting the last result, so that is still on its way
+            if i in finished or process.exitcode in (None, 0):
+                continue
+
+            # A worker waiting for its next batch dies holding its queue's read lock, so nothing
+            # can read that queue again and whatever was handed to the worker is lost with it
+            stranded = self._inbound[i]
+            stranded.cancel_join_thread()
+
+            if self._closed.is_set():
+                finished.add(i)
+            else:
+                self._inbound[i] = self._context.Queue(self._queue_size)
+                self._processes[i] = self._process(i)
+                self._processes[i].start()
+
+            with self._counts_lock:
+                lost = max(0, self._handed[i] - self._worker_frames[i])
+                self._handed[i] = self._worker_frames[i]
+                self._dropped += lost
+
+            self._died += 1
+
+            metrics.inc("parse_workers_died")
+            metrics.inc("parse_pool_dropped", lost)
+            print(f"Parse worker {i} died with exit code {process.exitcode}, dropped {lost} frames")
+
+    def _write(self) -> None:
+
+        finished: set[int] = set()
+        metrics = self._message_service.metrics
+        checked = time.monotonic()
+
+        while len(finished) < len(self._processes):
+            try:
+                result: Optional[ParseResult] = self._results.get(timeout=self._poll_secs)
+            except queue.Empty:
+                result = None
+
+            # Checked on a clock, results from the other workers keep coming while a dead one's shard waits
+            if time.monotonic() - checked >= self._poll_secs:
+                self._reap(finished)
+                checked = time.monotonic()
+
+            if result is None:
+                continue
+
+            metrics.merge(result.counters, result.histograms)
+
+            if result.decoded is None:
+                finished.add(result.worker)
+                continue
+
+            self._message_service.observe_lag(result.sent_at)
+            self._degraded.value = self._message_service.degraded
+
+            for decoded in result.decoded:
+                self._apply(decoded)
+
+            self._worker_frames[result.worker] += result.frames
+            self._completed += result.frames
+
+    def depth(self) -> int:
+        return self._submitted - self._completed - self._dropped
+
+    def stats(self) -> PoolStats:
+        return PoolStats(self._submitted, self._completed, self._dropped, self._died, list(self._worker_frames))
+
+    def close(self) -> None:
+
+        if self._closed.is_set():
+            return
+
+        self._closed.set()
+
+        if not self._started:
+            return
+
+        self._timer.join()
+
+        try:
+            self.flush()
+        finally:
+            for inbound in self._inbound:
+                try:
+                    inbound.put(None, timeout=self._put_timeout_secs)
+                except queue.Full:
+                    # Nothing is reading it, the writer finds the worker dead rather than waiting on it
+                    pass
+
+        self._writer.join()
+
+        for process in self._processes:
+            process.join()
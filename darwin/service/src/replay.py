@@ -0,0 +1,70 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+import time
+from typing import Callable, Iterable, Optional
+
+from darwin.service.src.capture import CapturedFrame
+from darwin.service.src.metrics import percentile
+
+
+@dataclass
+class ReplayStats:
+
+    frames: int
+    elapsed_secs: float
+    latencies: list[float] = field(repr=False)
+
+    @property
+    def frames_per_sec(self) -> float:
+        return self.frames / self.elapsed_secs if self.elapsed_secs else 0.0
+
+    def percentile(self, q: float) -> float:
+        return percentile(self.latencies, q)
+
+    def __str__(self) -> str:
+
+        summary = f"{self.frames} frames in {self.elapsed_secs:.2f}s ({self.frames_per_sec:.0f} frames/s)"
+
+        if not self.latencies:
+            return summary
+
+        return f"{summary}, p50 {self.percentile(50) * 1000:.3f}ms p99 {self.percentile(99) * 1000:.3f}ms"
+
+
+def replay(
+    frames: Iterable[CapturedFrame],
+    on_message: Callable[[CapturedFrame], None],
+    speed: float = 0.0,
+    drain: Optional[Callable[[], None]] = None
+) -> ReplayStats:
+
+    latencies: list[float] = []
+    first_received: Optional[float] = None
+    count = 0
+    start = time.perf_counter()
+
+    for frame in frames:
+
+        # A speed of 0 replays as fast as possible, otherwise capture time is scaled by speed
+        if speed > 0:
+            if first_received is None:
+                first_received = frame.received
+
+            delay = start + (frame.received - first_received) / speed - time.perf_counter()
+
+            if delay > 0:
+                time.sleep(delay)
+
+        began = time.perf_counter()
+        on_message(frame)
+        count += 1
+
+        # With a queue or pool to drain, on_message only hands the frame over, and timing that
+        # would pass the cost of an enqueue off as processing latency
+        if drain is None:
+            latencies.append(time.perf_counter() - began)
+
+    if drain:
+        drain()
+
+    return ReplayStats(count, time.perf_counter() - start, latencies)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
+import hashlib
+import time
+from typing import Callable, Iterable, Optional
+
+from darwin.messages.src.common import RawMessage
+from darwin.messages.src.times import parse_pport_epoch
+
+_MULTIPLIER = 2862933555777941757
+_MASK = (1 << 64) - 1
+
+
+class InvalidShardSpec(Exception): ...
+
+
+def rid_key(rid: Optional[str]) -> int:
+    return int.from_bytes(hashlib.blake2b((rid or "").encode(), digest_size=8).digest(), "big")
+
+
+def jump_hash(key: int, buckets: int) -> int:
+
+    # Jump consistent hash: growing from N to N + 1 buckets only moves 1 / (N + 1) of
+    # the keys, all of them into the new bucket
+    bucket, candidate = -1, 0
+
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * _MULTIPLIER + 1) & _MASK
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+
+    return bucket
+
+
+@dataclass(frozen=True)
+class ShardSlot:
+
+    index: Optional[int]
+    count: int
+    effective: Optional[float] = None
+
+    @classmethod
+    def parse(cls, spec: str) -> ShardSlot:
+
+        layout, _, effective = spec.partition("@")
+        index, _, count = layout.partition("/")
+
+        try:
+            slot = cls(
+                index=None if index.strip() == "-" else int(index) - 1,
+                count=int(count),
+                effective=parse_pport_epoch(effective.strip()) if effective else None
+            )
+        except ValueError as e:
+            raise InvalidShardSpec(f"Expected i/N or i/N@<ISO time>, got {spec}") from e
+
+        if slot.count < 1 or (slot.index is not None and not 0 <= slot.index < slot.count):
+            raise InvalidShardSpec(f"Shard index must be between 1 and {slot.count}, got {spec}")
+
+        return slot
+
+    def owns(self, key: int) -> bool:
+        return self.index is not None and jump_hash(key, self.count) == self.index
+
+    def __str__(self) -> str:
+
+        layout = f"{'-' if self.index is None else self.index + 1}/{self.count}"
+
+        if self.effective is None:
+            return layout
+
+        return f"{layout}@{datetime.fromtimestamp(self.effective).astimezone().isoformat()}"
+
+
+class ShardPlan:
+
+    def __init__(self, slots: Iterable[ShardSlot], clock: Callable[[], float] = time.time) -> None:
+
+        self._slots = sorted(slots, key=lambda slot: -1.0 if slot.effective is None else slot.effective)
+        self._clock = clock
+
+        if not self._slots:
+            raise InvalidShardSpec("At least one shard is required")
+
+        if sum(slot.effective is None for slot in self._slots) > 1:
+            raise InvalidShardSpec("Only one shard layout can apply without an @ effective time")
+
+    @classmethod
+    def parse(cls, specs: Iterable[str]) -> Optional[ShardPlan]:
+
+        slots = [ShardSlot.parse(spec) for spec in specs]
+        return cls(slots) if slots else None
+
+    @property
+    def slots(self) -> list[ShardSlot]:
+        return list(self._slots)
+
+    def slot_at(self, at: float) -> Optional[ShardSlot]:
+
+        current = None
+
+        for slot in self._slots:
+            if slot.effective is not None and slot.effective > at:
+                break
+            current = slot
+
+        return current
+
+    def owns(self, raw_message: RawMessage) -> bool:
+
+        if len(self._slots) == 1 and self._slots[0].effective is None:
+            slot: Optional[ShardSlot] = self._slots[0]
+        else:
+            # Layout changes take effect at a Pport timestamp rather than on each node's own
+            # clock, so every node agrees on which layout a frame falls under
+            sent_at = raw_message.sent_at
+            slot = self.slot_at(self._clock() if sent_at is None else sent_at)
+
+        return slot is not None and slot.owns(rid_key(raw_message.rid))
+
+    def __str__(self) -> str:
+        return ", ".join(str(slot) for slot in self._slots)
@@ -0,0 +1,135 @@
+from __future__ import annotations
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+from typing import IO, Iterable
+
+
+def _fsync(descriptors: Iterable[int]) -> None:
+    for fd in descriptors:
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class _Handle:
+
+    def __init__(self, path: str, buffer_size: int) -> None:
+        self.file: IO[str] = open(path, "a", buffering=buffer_size)
+        self.empty = self.file.tell() == 0
+
+    def write(self, rows: list[dict]) -> None:
+
+        if not rows:
+            return
+
+        lines = "\n".join([json.dumps(x) for x in rows])
+        self.file.write(lines if self.empty else "\n" + lines)
+        self.empty = False
+
+    def flush(self) -> int:
+
+        # A duplicate descriptor stays valid for the fsync after the lock is released, even if the file is closed
+        self.file.flush()
+        return os.dup(self.file.fileno())
+
+    def close(self) -> int:
+        fd = self.flush()
+        self.file.close()
+        return fd
+
+
+class TrainSink:
+
+    def append(self, key: str, rows: list[dict]) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class JsonlSink(TrainSink):
+
+    def __init__(
+        self,
+        directory: str = "train_info",
+        max_open_files: int = 256,
+        fsync_interval_secs: float = 5.0,
+        buffer_size: int = 65536
+    ) -> None:
+        self._directory = directory
+        self._max_open_files = max_open_files
+        self._fsync_interval_secs = fsync_interval_secs
+        self._buffer_size = buffer_size
+
+        self._handles: OrderedDict[str, _Handle] = OrderedDict()
+        self._directories: set[str] = set()
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        self._unsynced: list[int] = []
+
+    @property
+    def open_files(self) -> int:
+        return len(self._handles)
+
+    def _handle(self, key: str) -> _Handle:
+
+        path = f"{self._directory}/{key}"
+        handle = self._handles.get(path)
+
+        if handle is not None:
+            self._handles.move_to_end(path)
+            return handle
+
+        directory = os.path.dirname(path)
+
+        if directory and directory not in self._directories:
+            os.makedirs(directory, exist_ok=True)
+            self._directories.add(directory)
+
+        while len(self._handles) >= self._max_open_files:
+            _, evicted = self._handles.popitem(last=False)
+            self._unsynced.append(evicted.close())
+
+        handle = self._handles[path] = _Handle(path, self._buffer_size)
+        return handle
+
+    def append(self, key: str, rows: list[dict]) -> None:
+
+        descriptors: list[int] = []
+
+        with self._lock:
+            self._handle(key).write(rows)
+
+            if time.monotonic() - self._last_sync >= self._fsync_interval_secs:
+                descriptors = self._flush()
+
+        # Writers to other files carry on while the disk catches up
+        _fsync(descriptors)
+
+    def _flush(self) -> list[int]:
+
+        descriptors = self._unsynced + [handle.flush() for handle in self._handles.values()]
+        self._unsynced = []
+        self._last_sync = time.monotonic()
+
+        return descriptors
+
+    def sync(self) -> None:
+
+        with self._lock:
+            descriptors = self._flush()
+
+        _fsync(descriptors)
+
+    def close(self) -> None:
+
+        with self._lock:
+            descriptors = self._unsynced + [handle.close() for handle in self._handles.values()]
+            self._unsynced = []
+            self._handles.clear()
+
+        _fsync(descriptors)
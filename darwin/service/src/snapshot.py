@@ -0,0 +1,387 @@
+from __future__ import annotations
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import gc
+import mmap
+import os
+import struct
+import threading
+import traceback
+from sys import intern
+from typing import Callable, Iterator, Optional
+
+from darwin.messages.src.ts import (
+    LocationTimestamp,
+    PassingLocation,
+    Platform,
+    Service,
+    ServiceUpdate,
+    Status,
+    StoppingLocation,
+    TSMessage,
+)
+from darwin.service.src.board import LiveStateStore
+from darwin.service.src.delta import TrainState, TrainStateTable, location_key
+from darwin.service.src.metrics import Metrics, default_metrics
+
+MAGIC = b"DWSS"
+VERSION = 2
+
+# Every offset is from the start of the file, so a reader only ever slices the mapping
+_HEADER = struct.Struct("<4sHHIIqQQ")
+_TRAIN = struct.Struct("<qIIH")
+_INDEX = struct.Struct("<Q")
+_STRING = struct.Struct("<H")
+
+# tpl, working times, flags, then arrival and departure as minutes, src and flags, then platform src and text
+_LOCATION = struct.Struct("<IIBhIBhIBII")
+
+_STOPPING = 1
+_PLATFORM = 2
+_PLATFORM_CONFIRMED = 4
+
+_PRESENT = 1
+_DELAYED = 2
+_ACTUAL = 4
+
+_NO_TIMESTAMP = (0, 0, 0)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class SnapshotError(Exception): ...
+
+
+class _Strings:
+
+    # Id 0 is kept for None, the same few TIPLOCs, sources and platforms fill most of a snapshot
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+        self.values: list[str] = []
+
+    def id(self, value: Optional[str]) -> int:
+
+        if value is None:
+            return 0
+
+        found = self.ids.get(value)
+
+        if found is None:
+            self.values.append(value)
+            found = self.ids[value] = len(self.values)
+
+        return found
+
+
+def _timestamp(strings: _Strings, timestamp: Optional[LocationTimestamp]) -> tuple[int, int, int]:
+
+    if timestamp is None:
+        return _NO_TIMESTAMP
+
+    flags = _PRESENT | (_DELAYED if timestamp.delayed else 0) | (_ACTUAL if timestamp.status == Status.ACTUAL else 0)
+    return timestamp.minutes, strings.id(timestamp.src), flags
+
+
+def _encode_train(strings: _Strings, rid: str, train: TrainState) -> bytes:
+
+    rid_id = strings.id(rid)
+    uid_id = strings.id(train.uid)
+    parts = [_TRAIN.pack((train.seen - EPOCH) // timedelta(microseconds=1), rid_id, uid_id, len(train.locations))]
+
+    for (tpl, times), location in train.locations.items():
+        arrival, departure, platform = location.parts()
+        flags = 0 if isinstance(location, PassingLocation) else _STOPPING
+
+        if platform is not None:
+            flags |= _PLATFORM | (_PLATFORM_CONFIRMED if platform.confirmed else 0)
+
+        parts.append(_LOCATION.pack(
+            strings.id(tpl),
+            strings.id(times or None),
+            flags,
+            *_timestamp(strings, arrival),
+            *_timestamp(strings, departure),
+            strings.id(platform.src) if platform else 0,
+            strings.id(platform.text) if platform else 0
+        ))
+
+    return b"".join(parts)
+
+
+def write_snapshot(path: str, trains: list[tuple[str, TrainState]], taken: Optional[datetime] = None) -> int:
+
+    strings = _Strings()
+    trains = sorted(trains, key=lambda train: train[0])
+    records = [_encode_train(strings, rid, train) for rid, train in trains]
+
+    index = []
+    offset = _HEADER.size
+
+    for record in records:
+        index.append(_INDEX.pack(offset))
+        offset += len(record)
+
+    index_offset = offset
+    strings_offset = index_offset + len(index) * _INDEX.size
+    taken_us = ((taken or datetime.now()) - EPOCH) // timedelta(microseconds=1)
+
+    header = _HEADER.pack(
+        MAGIC, VERSION, 0, len(records), len(strings.values), taken_us, index_offset, strings_offset
+    )
+    encoded = [value.encode() for value in strings.values]
+
+    # Written aside and renamed over the old snapshot, so a crash never leaves a torn file to load
+    temporary = f"{path}.tmp"
+
+    with open(temporary, "wb") as f:
+        f.write(header)
+        f.writelines(records)
+        f.writelines(index)
+        f.writelines(_STRING.pack(len(value)) + value for value in encoded)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temporary, path)
+
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+    return os.path.getsize(path)
+
+
+class Snapshot:
+
+    def __init__(self, path: str) -> None:
+
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise SnapshotError(f"Empty snapshot {path}") from e
+
+        try:
+            self._read_header(path)
+        except Exception:
+            self._map.close()
+            raise
+
+    def _read_header(self, path: str) -> None:
+
+        if len(self._map) < _HEADER.size:
+            raise SnapshotError(f"Truncated snapshot {path}")
+
+        magic, version, _, count, string_count, taken_us, index_offset, strings_offset = \
+            _HEADER.unpack_from(self._map, 0)
+
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"Not a version {VERSION} snapshot {path}")
+
+        if index_offset + count * _INDEX.size != strings_offset or strings_offset > len(self._map):
+            raise SnapshotError(f"Corrupt snapshot {path}")
+
+        strings: list[Optional[str]] = [None]
+        offset = strings_offset
+
+        try:
+            for _ in range(string_count):
+                (length,) = _STRING.unpack_from(self._map, offset)
+                strings.append(intern(self._map[offset + _STRING.size:offset + _STRING.size + length].decode()))
+                offset += _STRING.size + length
+        except (struct.error, UnicodeDecodeError) as e:
+            raise SnapshotError(f"Corrupt snapshot {path}") from e
+
+        self._count = count
+        self._index_offset = index_offset
+        self._strings = strings
+        self.taken = EPOCH + timedelta(microseconds=taken_us)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __enter__(self) -> Snapshot:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def _offset(self, i: int) -> int:
+        return _INDEX.unpack_from(self._map, self._index_offset + i * _INDEX.size)[0]
+
+    def _rid(self, i: int) -> str:
+        return self._strings[_TRAIN.unpack_from(self._map, self._offset(i))[1]]
+
+    def _timestamp(self, minutes: int, src: int, flags: int) -> Optional[LocationTimestamp]:
+
+        if not flags & _PRESENT:
+            return None
+
+        status = Status.ACTUAL if flags & _ACTUAL else Status.ESTIMATED
+        return LocationTimestamp(minutes, self._strings[src], bool(flags & _DELAYED), status)
+
+    def _train(self, offset: int) -> tuple[str, TrainState]:
+
+        seen_us, rid, uid, count = _TRAIN.unpack_from(self._map, offset)
+        offset += _TRAIN.size
+        locations = {}
+
+        for (
+            tpl, times, flags,
+            arrival_minutes, arrival_src, arrival_flags,
+            departure_minutes, departure_src, departure_flags,
+            platform_src, platform_text
+        ) in _LOCATION.iter_unpack(self._map[offset:offset + count * _LOCATION.size]):
+            tpl = self._strings[tpl]
+            times = self._strings[times]
+            departure = self._timestamp(departure_minutes, departure_src, departure_flags)
+
+            if flags & _STOPPING:
+                platform = Platform(
+                    self._strings[platform_src],
+                    bool(flags & _PLATFORM_CONFIRMED),
+                    self._strings[platform_text]
+                ) if flags & _PLATFORM else None
+
+                location = StoppingLocation(
+                    tpl=tpl,
+                    arrival=self._timestamp(arrival_minutes, arrival_src, arrival_flags),
+                    departure=departure,
+                    platform=platform,
+                    working_times=times
+                )
+            else:
+                location = PassingLocation(tpl=tpl, passing=departure, working_times=times)
+
+            locations[location_key(location)] = location
+
+        return self._strings[rid], TrainState(self._strings[uid], EPOCH + timedelta(microseconds=seen_us), locations)
+
+    def train(self, rid: str) -> Optional[TrainState]:
+
+        # Records are in rid order, so one train is found without decoding the others
+        i = bisect_left(range(self._count), rid, key=self._rid)
+
+        if i < self._count and self._rid(i) == rid:
+            return self._train(self._offset(i))[1]
+
+        return None
+
+    def trains(self) -> Iterator[tuple[str, TrainState]]:
+        for i in range(self._count):
+            try:
+                yield self._train(self._offset(i))
+            except (struct.error, IndexError) as e:
+                raise SnapshotError(f"Corrupt train record {i}") from e
+
+    def close(self) -> None:
+        self._map.close()
+
+
+def load_snapshot(
+    path: str,
+    state: TrainStateTable,
+    board: Optional[LiveStateStore] = None,
+    metrics: Optional[Metrics] = None
+) -> int:
+
+    metrics = metrics or default_metrics
+
+    if not os.path.exists(path):
+        return 0
+
+    # Collections triggered by the allocations below would rescan every train restored so far,
+    # and what is restored stays for hours, so it is moved out of the collector's way afterwards
+    collecting = gc.isenabled()
+    gc.disable()
+
+    try:
+        with metrics.time("snapshot_load"):
+            try:
+                with Snapshot(path) as snapshot:
+                    trains = list(snapshot.trains())
+            except SnapshotError as e:
+                # A snapshot that cannot be read only costs a cold start
+                metrics.count_exception(e)
+                print(f"Ignoring snapshot: {e}")
+                return 0
+
+            restored = state.restore(trains)
+
+            # The board is rebuilt as if each train's last update had just arrived
+            if board is not None:
+                board.restore(
+                    TSMessage(
+                        update=ServiceUpdate(service=Service(rid=rid, uid=train.uid), ts=train.seen),
+                        locations=list(train.locations.values()),
+                        timestamp=train.seen
+                    )
+                    for rid, train in trains
+                )
+    finally:
+        if collecting:
+            gc.freeze()
+            gc.enable()
+
+    metrics.inc("snapshot_trains_loaded", restored)
+    return restored
+
+
+class SnapshotWriter:
+
+    def __init__(
+        self,
+        path: str,
+        state: TrainStateTable,
+        flush: Callable[[], None] = lambda: None,
+        interval_secs: float = 300.0,
+        metrics: Optional[Metrics] = None
+    ) -> None:
+        self._path = path
+        self._state = state
+        self._flush = flush
+        self._interval_secs = interval_secs
+        self._metrics = metrics or default_metrics
+        self._lock = threading.Lock()
+        self._written = 0
+        self._bytes = 0
+
+        self._metrics.gauge("snapshot_bytes", lambda: self._bytes)
+
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._write_periodically, name="snapshot-write", daemon=True)
+        self._timer.start()
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    def write(self) -> int:
+
+        with self._lock, self._metrics.time("snapshot_write"):
+            trains = self._state.trains()
+
+            # Every train copied was recorded after its save returned, so flushing now makes
+            # the snapshot promise nothing the database does not already hold
+            self._flush()
+
+            self._bytes = write_snapshot(self._path, trains)
+            self._written += 1
+
+        self._metrics.inc("snapshots_written")
+        return len(trains)
+
+    def _write_periodically(self) -> None:
+
+        while not self._closed.wait(self._interval_secs):
+            try:
+                self.write()
+            except Exception as e:
+                self._metrics.count_exception(e)
+                print(traceback.format_exc())
+
+    def close(self) -> int:
+        self._closed.set()
+        self._timer.join()
+        return self.write()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+from collections import Counter
+import threading
+from typing import Iterable, Optional
+
+DEFAULT_STATIONS = ("BRSTLTM",)
+DEFAULT_SCHEDULE_STATIONS = ("PADTON",)
+
+
+class EmptyWatchSet(Exception):
+    ...
+
+
+def _tiplocs(stations: Iterable[str]) -> frozenset[str]:
+    return frozenset(
+        tiploc.upper()
+        for station in stations
+        for tiploc in station.replace(",", " ").split()
+    )
+
+
+class WatchSet:
+
+    def __init__(
+        self,
+        stations: Iterable[str],
+        priority: Iterable[str] = (),
+        schedule_stations: Optional[Iterable[str]] = None
+    ) -> None:
+
+        # Priority stations are the ones still served when the service sheds load, none unless given
+        self._priority = _tiplocs(priority)
+        self._stations = _tiplocs(stations) | self._priority
+
+        if not self._stations:
+            raise EmptyWatchSet("No stations to watch")
+
+        # Schedules follow the same stations unless told otherwise, as the built-in default does
+        self._schedule_stations = self._stations if schedule_stations is None else _tiplocs(schedule_stations)
+
+        self._matches: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, stations: Iterable[str] = (), path: Optional[str] = None, priority: Iterable[str] = ()) -> WatchSet:
+
+        stations = list(stations)
+
+        if path:
+            stations.extend(cls.load(path))
+
+        if not stations:
+            return cls(DEFAULT_STATIONS, priority, DEFAULT_SCHEDULE_STATIONS)
+
+        return cls(stations, priority)
+
+    @staticmethod
+    def load(path: str) -> list[str]:
+        with open(path, "r") as f:
+            return [line.split("#", 1)[0] for line in f]
+
+    @property
+    def stations(self) -> frozenset[str]:
+        return self._stations
+
+    @property
+    def schedule_stations(self) -> frozenset[str]:
+        return self._schedule_stations
+
+    @property
+    def priority(self) -> frozenset[str]:
+        return self._priority
+
+    def record(self, matched: frozenset[str]) -> None:
+        with self._lock:
+            self._matches.update(matched)
+
+    def matches(self) -> dict[str, int]:
+        with self._lock:
+            return {station: self._matches[station] for station in sorted(self._stations | self._schedule_stations)}
+
+    def __str__(self) -> str:
+        return " ".join(f"{station}={count}" for station, count in self.matches().items())
@@ -0,0 +1,60 @@
+from __future__ import annotations
+from collections import defaultdict
+import gzip
+import os
+from typing import Optional
+
+from darwin.messages.src.ts import Location, ServiceUpdate
+from darwin.repository.db import DatabaseRepositoryInterface
+from darwin.service.src.capture import CapturedFrame
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.pool import ParsePool
+from darwin.service.src.sink import TrainSink
+from darwin.simulator.generator import GeneratorConfig, PportGenerator
+from darwin.stomp_client import StompClient
+
+
+def get_xml_fixture(file_name: str) -> bytes:
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "messages", "tests", "pport_fixtures", file_name)
+
+    with open(path, 'rb') as _file:
+        return gzip.compress(_file.read())
+
+
+class InMemoryRepository(DatabaseRepositoryInterface):
+
+    def __init__(self) -> None:
+        self.updates: list[ServiceUpdate] = []
+        self.locations: list[list[Location]] = []
+
+    def save_service_update(self, service_update: ServiceUpdate) -> int:
+        self.updates.append(service_update)
+        return len(self.updates)
+
+    def save_location(self, locations: list[Location], update_id: int) -> None:
+        self.locations.append(locations)
+
+
+class RecordingSink(TrainSink):
+
+    def __init__(self) -> None:
+        self.rows: dict[str, list[dict]] = defaultdict(list)
+
+    def append(self, key: str, rows: list[dict]) -> None:
+        self.rows[key].extend(rows)
+
+
+def generate_frames(rids: int, count: int, seed: int) -> list[CapturedFrame]:
+    generator = PportGenerator(GeneratorConfig(rids=rids, seed=seed))
+    return [CapturedFrame(0.0, headers, body) for headers, body in generator.frames(count)]
+
+
+def consume(service: MessageService, frames: list[CapturedFrame], pool: Optional[ParsePool] = None) -> None:
+
+    client = StompClient(service, pool=pool)
+
+    for frame in frames:
+        client.on_message(frame)
+
+    if pool:
+        pool.close()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import glob
+import os
+
+from darwin.service.src.archive import TrainArchive
+from darwin.service.src.sink import JsonlSink
+from darwin.service.tests.test_sink import BATCHES, read
+
+
+class TestTrainArchive:
+
+    def test_read__returns_appended_rows(self, tmp_path) -> None:
+
+        archive = TrainArchive(str(tmp_path), block_size=64)
+
+        for rows in BATCHES:
+            archive.append("ts/rid1.json", rows)
+
+        assert archive.read("ts/rid1.json") == [row for rows in BATCHES for row in rows]
+        assert archive.read("missing.json") == []
+
+        archive.close()
+
+    def test_export__matches_jsonl_sink(self, tmp_path) -> None:
+
+        archive = TrainArchive(f"{tmp_path}/archive", block_size=1)
+        sink = JsonlSink(f"{tmp_path}/expected")
+
+        for rows in BATCHES:
+            for key in ["a.json", "SC/b.json"]:
+                archive.append(key, rows)
+                sink.append(key, rows)
+
+        sink.close()
+
+        assert archive.export(f"{tmp_path}/actual") == 2
+        archive.close()
+
+        for key in ["a.json", "SC/b.json"]:
+            assert read(f"{tmp_path}/actual/{key}") == read(f"{tmp_path}/expected/{key}")
+
+    def test_append__rotates_segments(self, tmp_path) -> None:
+
+        archive = TrainArchive(str(tmp_path), max_segment_bytes=1, block_size=1)
+
+        for rows in BATCHES:
+            archive.append("rid1.json", rows)
+
+        archive.close()
+
+        assert len(glob.glob(f"{tmp_path}/segment-*.jsonl.gz")) == 3
+        assert TrainArchive(str(tmp_path)).read("rid1.json") == [row for rows in BATCHES for row in rows]
+
+    def test_load_segment__ignores_torn_entries(self, tmp_path) -> None:
+
+        archive = TrainArchive(str(tmp_path))
+        archive.append("rid1.json", BATCHES[0])
+        archive.close()
+
+        [index] = glob.glob(f"{tmp_path}/segment-*.idx")
+
+        with open(index, "a") as f:
+            f.write("rid2.json\t0\t99999\t0\t10\n")
+            f.write("rid3.json\t0\t1")
+
+        reopened = TrainArchive(str(tmp_path))
+
+        assert reopened.keys() == ["rid1.json"]
+        assert reopened.read("rid1.json") == BATCHES[0]
+
+    def test_load_segment__skips_segments_without_data(self, tmp_path) -> None:
+
+        archive = TrainArchive(str(tmp_path), max_segment_bytes=1, block_size=1)
+
+        for rows in BATCHES:
+            archive.append("rid1.json", rows)
+
+        archive.close()
+
+        os.remove(sorted(glob.glob(f"{tmp_path}/segment-*.jsonl.gz"))[0])
+
+        assert TrainArchive(str(tmp_path)).read("rid1.json") == [row for rows in BATCHES[1:] for row in rows]
+
+    def test_read__beyond_cached_segments(self, tmp_path) -> None:
+
+        archive = TrainArchive(str(tmp_path), max_segment_bytes=1, block_size=1, cached_segments=1)
+
+        for rows in BATCHES:
+            archive.append("rid1.json", rows)
+            archive.append("rid2.json", rows)
+
+        expected = [row for rows in BATCHES for row in rows]
+
+        # Every lookup walks segments the cache has to read back from their .idx files
+        assert archive.read("rid1.json") == archive.read("rid2.json") == expected
+        assert archive.keys() == ["rid1.json", "rid2.json"]
+
+        archive.close()
+
+        assert TrainArchive(str(tmp_path), cached_segments=1).read("rid2.json") == expected
+
+    def test_read__only_opens_segments_holding_the_key(self, tmp_path, monkeypatch) -> None:
+
+        archive = TrainArchive(str(tmp_path), max_segment_bytes=1, block_size=1)
+
+        for i, rows in enumerate(BATCHES):
+            archive.append(f"rid{i}.json", rows or BATCHES[0])
+
+        archive.close()
+
+        reopened = TrainArchive(str(tmp_path), cached_segments=0)
+        assert reopened.read("rid2.json") == BATCHES[2]
+
+        scanned = []
+        load_segment = reopened._load_segment
+        monkeypatch.setattr(reopened, "_load_segment", lambda *args: scanned.append(args) or load_segment(*args))
+
+        assert reopened.read("rid3.json") == BATCHES[3]
+        assert reopened.read("missing.json") == []
+        assert len(scanned) == 1
+
+    def test_read__includes_the_open_block(self, tmp_path) -> None:
+
+        archive = TrainArchive(str(tmp_path), block_size=65536, flush_interval_secs=3600)
+        archive.append("rid1.json", BATCHES[0])
+
+        assert archive.read("rid1.json") == BATCHES[0]
+
+        archive.append("rid1.json", BATCHES[3])
+        archive.close()
+
+        assert TrainArchive(str(tmp_path)).read("rid1.json") == BATCHES[0] + BATCHES[3]
@@ -0,0 +1,286 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+import json
+import urllib.error
+import urllib.request
+
+from darwin.messages.src.common import RawMessage
+from darwin.messages.src.ts import (
+    LocationTimestamp,
+    PassingLocation,
+    Platform,
+    Service,
+    ServiceUpdate,
+    Status,
+    StoppingLocation,
+    TSMessage,
+)
+from darwin.service.src.board import (
+    MAX_BOARD_LIMIT,
+    BoardKind,
+    BoardServer,
+    LiveStateStore,
+    absolute_minutes,
+    board_limit,
+)
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.metrics import Metrics
+from darwin.service.src.watch import WatchSet
+from darwin.service.tests.helpers import InMemoryRepository, get_xml_fixture
+import pytest
+
+UPDATED = datetime(2024, 6, 18, 14, 0)
+
+
+@pytest.fixture(autouse=True)
+def working_directory(tmp_path, monkeypatch) -> None:
+    monkeypatch.chdir(tmp_path)
+
+
+def at(minutes: int, status: Status = Status.ESTIMATED) -> LocationTimestamp:
+    return LocationTimestamp(minutes, "TD", False, status)
+
+
+def ts_message(rid: str, departures: dict[str, int], ts: datetime = UPDATED, platform: str = "1") -> TSMessage:
+    return TSMessage(
+        update=ServiceUpdate(service=Service(rid=rid, uid=f"U{rid}"), ts=ts),
+        locations=[
+            StoppingLocation(tpl=tpl, arrival=at(minutes - 1), departure=at(minutes), platform=Platform("P", True, platform))
+            for tpl, minutes in departures.items()
+        ] + [PassingLocation(tpl="SWINDON", passing=at(15 * 60))],
+        timestamp=ts
+    )
+
+
+def rids(entries) -> list[str]:
+    return [entry.rid for entry in entries]
+
+
+@pytest.fixture
+def store() -> LiveStateStore:
+    return LiveStateStore(metrics=Metrics())
+
+
+class TestAbsoluteMinutes:
+
+    @pytest.mark.parametrize(
+        "ts, minutes, expected",
+        [
+            (datetime(2024, 6, 18, 14, 0), 14 * 60 + 30, datetime(2024, 6, 18, 14, 30)),
+            (datetime(2024, 6, 18, 23, 50), 10, datetime(2024, 6, 19, 0, 10)),
+            (datetime(2024, 6, 19, 0, 10), 23 * 60 + 50, datetime(2024, 6, 18, 23, 50)),
+        ]
+    )
+    def test_absolute_minutes(self, ts: datetime, minutes: int, expected: datetime) -> None:
+        assert absolute_minutes(ts, minutes) == expected.toordinal() * 24 * 60 + expected.hour * 60 + expected.minute
+
+
+class TestLiveStateStore:
+
+    def test_board__upcoming_in_order(self, store) -> None:
+
+        store.update(ts_message("rid1", {"BRSTLTM": 14 * 60 + 20, "BATHSPA": 14 * 60 + 35}))
+        store.update(ts_message("rid2", {"BRSTLTM": 14 * 60 + 10}))
+        store.update(ts_message("rid3", {"BRSTLTM": 13 * 60 + 50}))
+
+        board = store.board("BRSTLTM")
+
+        assert rids(board) == ["rid2", "rid1"]
+        assert board[0].timestamp.minutes == 14 * 60 + 10
+        assert board[0].platform.text == "1"
+        assert rids(store.board("BRSTLTM", limit=1)) == ["rid2"]
+        assert rids(store.board("BRSTLTM", at=datetime(2024, 6, 18, 13, 0))) == ["rid3", "rid2", "rid1"]
+        assert rids(store.board("BATHSPA", BoardKind.ARRIVALS)) == ["rid1"]
+        assert store.board("SWINDON") == []
+
+    def test_update__moves_changed_times(self, store) -> None:
+
+        store.update(ts_message("rid1", {"BRSTLTM": 14 * 60 + 20}))
+        store.update(ts_message("rid2", {"BRSTLTM": 14 * 60 + 30}))
+        store.update(ts_message("rid1", {"BRSTLTM": 14 * 60 + 40}, platform="3"))
+
+        board = store.board("BRSTLTM")
+
+        assert rids(board) == ["rid2", "rid1"]
+        assert board[1].platform.text == "3"
+        assert store.events == 4
+
+    def test_update__second_call_at_a_looped_tiploc(self, store) -> None:
+
+        def call(minutes: int, wtd: str) -> StoppingLocation:
+            return StoppingLocation(
+                tpl="BRSTLTM", arrival=None, departure=at(minutes), platform=None, working_times=f"/{wtd}/"
+            )
+
+        def update(*locations: StoppingLocation) -> TSMessage:
+            ts = datetime(2024, 6, 18, 9, 0)
+            return TSMessage(ServiceUpdate(service=Service(rid="rid1", uid="Urid1"), ts=ts), list(locations), ts)
+
+        store.update(update(call(10 * 60, "10:00"), call(12 * 60, "12:00")))
+
+        # Darwin sends only the call that moved
+        store.update(update(call(12 * 60 + 10, "12:00")))
+
+        assert [entry.timestamp.minutes for entry in store.board("BRSTLTM")] == [10 * 60, 12 * 60 + 10]
+        assert store.events == 2
+
+    def test_update__after_midnight(self, store) -> None:
+
+        store.update(ts_message("rid1", {"BRSTLTM": 10}, ts=datetime(2024, 6, 18, 23, 50)))
+        store.update(ts_message("rid2", {"BRSTLTM": 23 * 60 + 55}, ts=datetime(2024, 6, 18, 23, 50)))
+
+        assert rids(store.board("BRSTLTM")) == ["rid2", "rid1"]
+        assert store.board("BRSTLTM")[1].format()["date"] == "2024-06-19"
+
+    def test_update__evicts_stale_trains(self, store) -> None:
+
+        store.update(ts_message("rid1", {"BRSTLTM": 14 * 60 + 20}))
+        store.update(ts_message("rid2", {"BRSTLTM": 18 * 60}, ts=UPDATED + timedelta(hours=4)))
+
+        assert len(store) == 1
+        assert store.evicted == 1
+        assert store.events == 2
+        assert store.train("rid1") == []
+
+    def test_update__bounded_size(self) -> None:
+
+        store = LiveStateStore(maxsize=2, metrics=Metrics())
+
+        for rid in ["rid1", "rid2", "rid3"]:
+            store.update(ts_message(rid, {"BRSTLTM": 14 * 60 + 20}))
+
+        assert len(store) == 2
+        assert rids(store.board("BRSTLTM")) == ["rid2", "rid3"]
+
+    def test_restore__sorted_once_keeping_newer_trains(self, store) -> None:
+
+        store.update(ts_message("rid1", {"BRSTLTM": 14 * 60 + 40}, ts=UPDATED + timedelta(minutes=5)))
+
+        restored = store.restore([
+            ts_message("rid1", {"BRSTLTM": 14 * 60 + 20}),
+            ts_message("rid2", {"BRSTLTM": 14 * 60 + 30}),
+            ts_message("rid3", {"BRSTLTM": 14 * 60 + 10}),
+            ts_message("rid4", {"BRSTLTM": 14 * 60 + 15}, ts=UPDATED - timedelta(hours=4)),
+        ])
+
+        assert restored == 2
+        assert rids(store.board("BRSTLTM")) == ["rid3", "rid2", "rid1"]
+        assert store.board("BRSTLTM")[2].timestamp.minutes == 14 * 60 + 40
+
+        # Restored trains are older than anything heard live, so they are the first to go
+        store.evict(["rid1"])
+        store.update(ts_message("rid5", {"BRSTLTM": 14 * 60 + 50}, ts=UPDATED + timedelta(hours=3, minutes=1)))
+
+        assert rids(store.board("BRSTLTM", at=UPDATED)) == ["rid5"]
+
+    def test_evict(self, store) -> None:
+
+        store.update(ts_message("rid1", {"BRSTLTM": 14 * 60 + 20}))
+        store.evict(["rid1", "rid2"])
+
+        assert len(store) == 0
+        assert store.events == 0
+
+    def test_train(self, store) -> None:
+
+        store.update(ts_message("rid1", {"BRSTLTM": 14 * 60 + 20, "BATHSPA": 14 * 60 + 35}))
+
+        assert [(entry.tpl, entry.kind) for entry in store.train("rid1")] == [
+            ("BRSTLTM", BoardKind.ARRIVALS),
+            ("BRSTLTM", BoardKind.DEPARTURES),
+            ("BATHSPA", BoardKind.ARRIVALS),
+            ("BATHSPA", BoardKind.DEPARTURES),
+        ]
+
+
+class TestBoardLimit:
+
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            ("1", 1),
+            ("10", 10),
+            (str(MAX_BOARD_LIMIT), MAX_BOARD_LIMIT),
+            ("1000000", MAX_BOARD_LIMIT),
+        ]
+    )
+    def test_board_limit(self, value: str, expected: int) -> None:
+        assert board_limit(value) == expected
+
+    @pytest.mark.parametrize("value", ["0", "-1", "ten", ""])
+    def test_board_limit__rejects(self, value: str) -> None:
+        with pytest.raises(ValueError):
+            board_limit(value)
+
+
+class TestBoardServer:
+
+    def test_get(self, store) -> None:
+
+        store.update(ts_message("rid1", {"BRSTLTM": 14 * 60 + 20}))
+
+        server = BoardServer(("127.0.0.1", 0), store)
+        server.start()
+        host, port = server.server_address
+
+        try:
+            with urllib.request.urlopen(f"http://{host}:{port}/board/brstltm?limit=5") as response:
+                body = json.loads(response.read())
+
+            assert body["tpl"] == "BRSTLTM"
+            assert body["kind"] == "departures"
+            assert body["services"] == [{
+                "rid": "rid1",
+                "uid": "Urid1",
+                "tpl": "BRSTLTM",
+                "kind": "departures",
+                "date": "2024-06-18",
+                "ts": "14:20",
+                "src": "TD",
+                "delayed": False,
+                "status": "estimated",
+                "platform": "1",
+                "platform_confirmed": True
+            }]
+
+            with urllib.request.urlopen(f"http://{host}:{port}/board/BRSTLTM/arrivals?at=14:30") as response:
+                assert json.loads(response.read())["services"] == []
+
+            with urllib.request.urlopen(f"http://{host}:{port}/train/rid1") as response:
+                assert len(json.loads(response.read())["locations"]) == 2
+
+            for path, code in [
+                ("/other", 404),
+                ("/board/BRSTLTM/passes", 400),
+                ("/board/BRSTLTM?at=25:00", 400),
+                ("/board/BRSTLTM?limit=0", 400),
+                ("/board/BRSTLTM?limit=-5", 400),
+                ("/board/BRSTLTM?limit=many", 400),
+            ]:
+                with pytest.raises(urllib.error.HTTPError) as e:
+                    urllib.request.urlopen(f"http://{host}:{port}{path}")
+
+                assert e.value.code == code
+        finally:
+            server.close()
+
+
+class TestMessageServiceBoard:
+
+    def test_parse_raw__feeds_board(self) -> None:
+
+        store = LiveStateStore(metrics=Metrics())
+        service = MessageService(InMemoryRepository(), watch=WatchSet(["BRSTLTM"]), board=store)
+
+        service.parse_raw(RawMessage("TS", get_xml_fixture("ts_stopping.xml")))
+
+        departures = store.board("BRSTLTM")
+
+        assert rids(departures) == ["202406187143949"]
+        assert departures[0].format()["ts"] == "14:08"
+        assert departures[0].platform.text == "13"
+        assert rids(store.board("CHPNHAM", BoardKind.ARRIVALS)) == ["202406187143949"]
+
+        service.parse_raw(RawMessage("SC", get_xml_fixture("sc_deactivated.xml")))
+
+        assert len(store) == 0
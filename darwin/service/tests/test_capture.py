@@ -0,0 +1,119 @@
+from __future__ import annotations
+import glob
+import os
+
+from darwin.messages.src.common import MessageType
+from darwin.service.src.capture import CapturedFrame, FrameCapture
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.replay import replay
+from darwin.service.src.sink import JsonlSink
+from darwin.service.src.watch import WatchSet
+from darwin.service.tests.helpers import InMemoryRepository, get_xml_fixture
+from darwin.stomp_client import StompClient
+
+FRAMES = [
+    CapturedFrame(1718700000.25, {"MessageType": "TS", "destination": "/topic/darwin"}, b"\x1f\x8b first"),
+    CapturedFrame(1718700000.75, {"MessageType": "SC"}, b""),
+    CapturedFrame(1718700002.5, {"MessageType": "TS"}, b"third"),
+    CapturedFrame(1718700004.0, {"MessageType": "OW"}, b"fourth"),
+]
+
+
+def capture(directory: str, frames: list[CapturedFrame], **kwargs) -> None:
+
+    frame_capture = FrameCapture(directory, **kwargs)
+
+    for frame in frames:
+        frame_capture.record(frame.headers, frame.body, frame.received)
+
+    frame_capture.close()
+
+
+class TestFrameCapture:
+
+    def test_read__round_trip(self, tmp_path) -> None:
+
+        capture(str(tmp_path), FRAMES)
+
+        assert list(FrameCapture.read(str(tmp_path))) == FRAMES
+        assert len(glob.glob(f"{tmp_path}/capture-*.frames")) == 1
+
+    def test_read__across_segments(self, tmp_path) -> None:
+
+        capture(str(tmp_path), FRAMES, max_segment_bytes=1)
+
+        assert list(FrameCapture.read(str(tmp_path))) == FRAMES
+        assert len(glob.glob(f"{tmp_path}/capture-*.frames")) == len(FRAMES)
+
+    def test_read__time_range(self, tmp_path) -> None:
+
+        capture(str(tmp_path), FRAMES)
+
+        assert list(FrameCapture.read(str(tmp_path), start=1718700000.5, end=1718700003)) == FRAMES[1:3]
+        assert list(FrameCapture.read(str(tmp_path), start=1718700003)) == FRAMES[3:]
+
+    def test_read__stops_at_torn_frame(self, tmp_path) -> None:
+
+        capture(str(tmp_path), FRAMES)
+        [path] = glob.glob(f"{tmp_path}/capture-*.frames")
+
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 2)
+
+        assert list(FrameCapture.read(str(tmp_path))) == FRAMES[:3]
+
+
+class TestReplay:
+
+    def test_replay__through_message_service(self, tmp_path) -> None:
+
+        frames = [
+            CapturedFrame(1.0, {"MessageType": "TS"}, get_xml_fixture("ts_stopping.xml")),
+            CapturedFrame(2.0, {"MessageType": "TS"}, get_xml_fixture("ts_passing.xml")),
+            CapturedFrame(3.0, {"MessageType": "SC"}, b"not gzip"),
+        ]
+        capture(f"{tmp_path}/capture", frames)
+
+        repository = InMemoryRepository()
+        service = MessageService(
+            repository,
+            message_filter=MessageType.TS,
+            sink=JsonlSink(f"{tmp_path}/train_info"),
+            watch=WatchSet(["BRSTLTM"])
+        )
+        client = StompClient(service)
+
+        stats = replay(FrameCapture.read(f"{tmp_path}/capture"), client.on_message)
+        service.close()
+
+        assert stats.frames == 3
+        assert [update.service.rid for update in repository.updates] == ["202406187143949"]
+        assert service.prefiltered_frames == 1
+        assert service.dropped_frames == 1
+        assert os.listdir(f"{tmp_path}/train_info/BRSTLTM") == ["C43949.json"]
+
+    def test_replay__scales_capture_time(self) -> None:
+
+        frames = [CapturedFrame(10.0, {}, b""), CapturedFrame(10.2, {}, b"")]
+        received: list[CapturedFrame] = []
+
+        stats = replay(frames, received.append, speed=2.0)
+
+        assert received == frames
+        assert 0.1 <= stats.elapsed_secs < 0.2
+        assert replay(frames, received.append).elapsed_secs < 0.1
+
+    def test_replay__leaves_out_latency_when_draining(self) -> None:
+
+        frames = [CapturedFrame(10.0, {}, b""), CapturedFrame(10.2, {}, b"")]
+        drained: list[bool] = []
+
+        inline = replay(frames, lambda frame: None)
+        queued = replay(frames, lambda frame: None, drain=lambda: drained.append(True))
+
+        assert len(inline.latencies) == 2
+        assert "p99" in str(inline)
+        assert drained == [True]
+        assert queued.frames == 2
+        assert not queued.latencies
+        assert "p99" not in str(queued)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+
+from darwin.messages.src.common import RawMessage
+from darwin.messages.src.ts import LocationTimestamp, PassingLocation, Status, TSMessage
+from darwin.repository.tests.helpers import ts_message
+from darwin.service.src.delta import TrainStateTable, location_keys
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.metrics import Metrics
+from darwin.service.src.watch import WatchSet
+from darwin.service.tests.helpers import InMemoryRepository, get_xml_fixture
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def working_directory(tmp_path, monkeypatch) -> None:
+    monkeypatch.chdir(tmp_path)
+
+
+def persist(table: TrainStateTable, message) -> list[str]:
+
+    changed = table.delta(message)
+
+    if changed is None:
+        return []
+
+    table.record(message, len(changed.locations))
+    return [location.tpl for location in changed.locations]
+
+
+class TestTrainStateTable:
+
+    def test_delta__only_changed_locations(self) -> None:
+
+        table = TrainStateTable()
+        message = ts_message("rid1", 0)
+
+        assert persist(table, message) == ["BRSTLTM", "BATHSPA"]
+        assert persist(table, ts_message("rid1", 0)) == []
+
+        moved = ts_message("rid1", 0)
+        moved.locations[1].passing = LocationTimestamp(14 * 60 + 3, "TD", True, Status.ESTIMATED)
+
+        assert persist(table, moved) == ["BATHSPA"]
+        assert persist(table, ts_message("rid2", 0)) == ["BRSTLTM", "BATHSPA"]
+
+        assert (table.received, table.written, table.unchanged) == (8, 5, 1)
+        assert table.write_amplification == pytest.approx(8 / 5)
+
+    def test_delta__status_and_platform_changes(self) -> None:
+
+        table = TrainStateTable()
+        persist(table, ts_message("rid1", 0))
+
+        confirmed = ts_message("rid1", 0)
+        confirmed.locations[0].platform.confirmed = False
+
+        actual = ts_message("rid1", 0)
+        actual.locations[1].passing.status = Status.ACTUAL
+
+        assert persist(table, confirmed) == ["BRSTLTM"]
+        assert persist(table, actual) == ["BRSTLTM", "BATHSPA"]
+
+    def test_delta__second_call_at_a_looped_tiploc(self) -> None:
+
+        def passing(tpl: str, minutes: int, wtp: str) -> PassingLocation:
+            return PassingLocation(
+                tpl=tpl,
+                passing=LocationTimestamp(minutes, "TD", False, Status.ESTIMATED),
+                working_times=f"//{wtp}"
+            )
+
+        table = TrainStateTable()
+        loop = ts_message("rid1", 0)
+        loop.locations = [passing("A", 600, "10:00"), passing("B", 660, "11:00"), passing("A", 720, "12:00")]
+
+        assert persist(table, loop) == ["A", "B", "A"]
+
+        # Darwin sends only the call that moved, first in the message but still the second visit
+        moved = ts_message("rid1", 5)
+        moved.locations = [passing("A", 730, "12:00")]
+
+        assert persist(table, moved) == ["A"]
+        assert persist(table, TSMessage(moved.update, [passing("A", 600, "10:00")], moved.timestamp)) == []
+
+        state = dict(table.trains())["rid1"].locations
+        assert {key: location.passing.minutes for key, location in state.items()} == {
+            ("A", "//10:00"): 600,
+            ("B", "//11:00"): 660,
+            ("A", "//12:00"): 730,
+        }
+
+    def test_location_keys(self) -> None:
+
+        at = LocationTimestamp(600, "TD", False, Status.ESTIMATED)
+        locations = [
+            PassingLocation(tpl="A", passing=at, working_times="//10:00"),
+            PassingLocation(tpl="A", passing=at, working_times="//12:00"),
+            PassingLocation(tpl="B", passing=at),
+        ]
+
+        assert location_keys(locations) == [("A", "//10:00"), ("A", "//12:00"), ("B", "")]
+
+    def test_record__evicts_stale_trains(self) -> None:
+
+        table = TrainStateTable(max_age=timedelta(hours=1))
+        persist(table, ts_message("rid1", 0))
+        persist(table, ts_message("rid2", 30))
+
+        later = ts_message("rid3", 0)
+        later.update.ts = datetime(2024, 6, 18, 15, 15)
+        persist(table, later)
+
+        assert len(table) == 2
+        assert table.evicted_stale == 1
+        assert persist(table, ts_message("rid1", 0)) == ["BRSTLTM", "BATHSPA"]
+
+    def test_record__bounded_size(self) -> None:
+
+        table = TrainStateTable(maxsize=2)
+
+        for rid in ["rid1", "rid2", "rid3"]:
+            persist(table, ts_message(rid, 0))
+
+        assert len(table) == 2
+        assert table.evicted_stale == 1
+
+    def test_evict(self) -> None:
+
+        table = TrainStateTable()
+        persist(table, ts_message("rid1", 0))
+
+        table.evict(["rid1", "rid2"])
+
+        assert len(table) == 0
+        assert table.evicted_deactivated == 1
+
+
+class TestMessageServiceDelta:
+
+    def test_parse_raw__skips_repeated_forecasts(self) -> None:
+
+        repository = InMemoryRepository()
+        metrics = Metrics()
+        service = MessageService(repository, watch=WatchSet(["BRSTLTM"]), metrics=metrics, state=TrainStateTable())
+
+        for _ in range(3):
+            service.parse_raw(RawMessage("TS", get_xml_fixture("ts_stopping.xml")))
+
+        assert [len(locations) for locations in repository.locations] == [3]
+        assert metrics.counter("locations_received") == 9
+        assert metrics.counter("locations_written") == 3
+        assert metrics.counter("ts_unchanged") == 2
+        assert service.state.write_amplification == 3.0
+
+    def test_parse_raw__deactivation_evicts(self) -> None:
+
+        service = MessageService(InMemoryRepository(), watch=WatchSet(["BRSTLTM"]), state=TrainStateTable())
+        service.parse_raw(RawMessage("TS", get_xml_fixture("ts_stopping.xml")))
+
+        assert len(service.state) == 1
+
+        service.parse_raw(RawMessage("SC", get_xml_fixture("sc_deactivated.xml")))
+
+        assert len(service.state) == 0
+        assert service.state.evicted_deactivated == 1
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import gzip
+import threading
+
+from darwin.messages.src.common import RawMessage
+from darwin.service.src.ingest import IngestQueue, IngestQueueClosed, OverflowPolicy
+import pytest
+
+
+def ts_frame(rid: str, seq: int) -> RawMessage:
+    return RawMessage("TS", gzip.compress(f'<Pport><uR><TS rid="{rid}" seq="{seq}"/></uR></Pport>'.encode()))
+
+
+class Recorder:
+
+    def __init__(self, gate: threading.Event | None = None) -> None:
+        self.seen: list[tuple[str, int]] = []
+        self.lock = threading.Lock()
+        self.gate = gate
+
+    def __call__(self, raw_message: RawMessage) -> None:
+
+        if self.gate:
+            self.gate.wait()
+
+        seq = int(raw_message.payload.split(b'seq="')[1].split(b'"')[0])
+
+        with self.lock:
+            self.seen.append((raw_message.rid, seq))
+
+    def for_rid(self, rid: str) -> list[int]:
+        return [seq for seen_rid, seq in self.seen if seen_rid == rid]
+
+
+class TestIngestQueue:
+
+    def test_submit__keeps_order_per_rid(self) -> None:
+
+        recorder = Recorder()
+        ingest = IngestQueue(workers=4, maxsize=16)
+        ingest.start(recorder)
+
+        for seq in range(200):
+            ingest.submit(ts_frame(f"rid{seq % 7}", seq))
+
+        ingest.close()
+
+        assert len(recorder.seen) == 200
+        for rid in range(7):
+            assert recorder.for_rid(f"rid{rid}") == list(range(rid, 200, 7))
+
+    def test_submit__routes_without_decompressing(self) -> None:
+
+        seen = []
+        ingest = IngestQueue(workers=4, maxsize=16)
+
+        # The rid pushed past the head, and a frame that is not gzip at all
+        padded = RawMessage("TS", gzip.compress(b"<Pport>" + b" " * 4096 + b'<uR><TS rid="rid1" seq="0"/></uR></Pport>'))
+        corrupt = RawMessage("TS", b"not gzip")
+
+        for raw_message in [padded, corrupt]:
+            ingest.submit(raw_message)
+
+        assert ingest.stats().worker_depths == [2, 0, 0, 0]
+        assert "payload" not in padded.__dict__
+
+        ingest.start(lambda raw_message: seen.append(raw_message))
+        ingest.close()
+
+        assert seen == [padded, corrupt]
+
+    def test_submit__drop_oldest(self) -> None:
+
+        gate = threading.Event()
+        recorder = Recorder(gate)
+        ingest = IngestQueue(workers=1, maxsize=3, policy=OverflowPolicy.DROP_OLDEST)
+        ingest.start(recorder)
+
+        for seq in range(10):
+            ingest.submit(ts_frame("rid1", seq))
+
+        stats = ingest.stats()
+        gate.set()
+        ingest.close()
+
+        assert stats.depth <= 3
+        assert stats.max_depth <= 3
+        assert ingest.stats().processed + ingest.stats().dropped == 10
+        assert recorder.for_rid("rid1")[-3:] == [7, 8, 9]
+        assert recorder.for_rid("rid1") == sorted(recorder.for_rid("rid1"))
+
+    def test_submit__spill_keeps_order(self, tmp_path) -> None:
+
+        gate = threading.Event()
+        recorder = Recorder(gate)
+        ingest = IngestQueue(workers=2, maxsize=4, policy=OverflowPolicy.SPILL, spill_directory=str(tmp_path))
+        ingest.start(recorder)
+
+        for seq in range(50):
+            ingest.submit(ts_frame(f"rid{seq % 3}", seq))
+
+        stats = ingest.stats()
+        gate.set()
+        ingest.close()
+
+        assert stats.spilled > 0
+        assert stats.max_depth > 4
+        assert len(recorder.seen) == 50
+        for rid in range(3):
+            assert recorder.for_rid(f"rid{rid}") == list(range(rid, 50, 3))
+
+    def test_submit__closed(self) -> None:
+
+        ingest = IngestQueue(workers=1)
+        ingest.start(Recorder())
+        ingest.close()
+
+        with pytest.raises(IngestQueueClosed):
+            ingest.submit(ts_frame("rid1", 0))
@@ -0,0 +1,188 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+import gzip
+import multiprocessing
+
+from darwin.messages.src.common import MessageType, RawMessage
+from darwin.messages.src.times import parse_pport_epoch
+from darwin.service.src.lag import DegradedFlag, LagMonitor
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.metrics import Metrics
+from darwin.service.src.sink import TrainSink
+from darwin.service.src.watch import WatchSet
+from darwin.service.tests.helpers import InMemoryRepository, get_xml_fixture
+import pytest
+
+STOPPING_SENT_AT = datetime(2024, 6, 18, 13, 3, 21, 458128, tzinfo=timezone.utc).timestamp()
+
+
+class FakeClock:
+
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestParsePportEpoch:
+
+    @pytest.mark.parametrize(
+        "value,expected",
+        [
+            ("2024-06-18T14:03:21.4581285+01:00", STOPPING_SENT_AT),
+            ("2024-06-18T13:03:21+00:00", datetime(2024, 6, 18, 13, 3, 21, tzinfo=timezone.utc).timestamp()),
+            ("2024-06-18T14:03:21", datetime(2024, 6, 18, 13, 3, 21, tzinfo=timezone.utc).timestamp()),
+            ("2024-01-18T14:03:21", datetime(2024, 1, 18, 14, 3, 21, tzinfo=timezone.utc).timestamp()),
+        ]
+    )
+    def test_parse(self, value: str, expected: float) -> None:
+        assert parse_pport_epoch(value) == pytest.approx(expected)
+
+    def test_raw_message_sent_at(self) -> None:
+
+        assert RawMessage(MessageType.TS.value, get_xml_fixture("ts_stopping.xml")).sent_at == pytest.approx(STOPPING_SENT_AT)
+        assert RawMessage(MessageType.TS.value, gzip.compress(b"<Pport/>")).sent_at is None
+
+
+class TestLagMonitor:
+
+    def test_observe__enters_and_leaves_degraded_mode_with_hysteresis(self) -> None:
+
+        clock = FakeClock(1000.0)
+        monitor = LagMonitor(threshold_secs=60, recover_secs=30, smoothing=0.5, clock=clock)
+
+        monitor.observe(990.0)
+        assert monitor.lag == 10.0
+        assert not monitor.degraded
+
+        for _ in range(5):
+            monitor.observe(900.0)
+
+        assert monitor.degraded
+        assert monitor.last_lag == 100.0
+
+        # Between the two thresholds the mode holds
+        for _ in range(5):
+            monitor.observe(955.0)
+
+        assert monitor.degraded
+        assert 30 < monitor.lag < 60
+
+        for _ in range(5):
+            monitor.observe(1000.0)
+
+        assert not monitor.degraded
+        assert monitor.transitions == 2
+
+    def test_observe__single_spike_is_smoothed(self) -> None:
+
+        clock = FakeClock(1000.0)
+        monitor = LagMonitor(threshold_secs=60, clock=clock)
+
+        monitor.observe(999.0)
+        monitor.observe(0.0)
+
+        assert not monitor.degraded
+
+
+class TestMessageServiceDegraded:
+
+    def _service(self, lag_secs: float, metrics: Metrics) -> tuple[MessageService, InMemoryRepository, TrainSink]:
+
+        repository = InMemoryRepository()
+        sink = TrainSink()
+        service = MessageService(
+            repository,
+            sink=sink,
+            watch=WatchSet(["BRSTLTM", "PADTON"], priority=["PADTON"]),
+            metrics=metrics,
+            lag=LagMonitor(threshold_secs=120, clock=FakeClock(STOPPING_SENT_AT + lag_secs))
+        )
+
+        return service, repository, sink
+
+    def test_parse_raw__within_threshold(self) -> None:
+
+        metrics = Metrics()
+        service, repository, _ = self._service(5, metrics)
+
+        service.parse_raw(RawMessage(MessageType.TS.value, get_xml_fixture("ts_stopping.xml")))
+        service.parse_raw(RawMessage(MessageType.SC.value, get_xml_fixture("sc_deactivated.xml")))
+
+        assert not service.degraded
+        assert len(repository.updates) == 1
+        assert metrics.counter("shed", type="TS") == 0
+        assert metrics.counter("shed", type="SC") == 0
+        assert metrics.counter("trains_saved", type="deactivated") == 1
+        assert "darwin_degraded 0" in metrics.render().splitlines()
+
+    def test_parse_raw__sheds_schedules_and_non_priority_stations(self) -> None:
+
+        metrics = Metrics()
+        service, repository, _ = self._service(600, metrics)
+
+        service.parse_raw(RawMessage(MessageType.TS.value, get_xml_fixture("ts_stopping.xml")))
+        service.parse_raw(RawMessage(MessageType.SC.value, get_xml_fixture("sc_deactivated.xml")))
+
+        assert service.degraded
+        assert not repository.updates
+        assert metrics.counter("frames_prefiltered") == 1
+        assert metrics.counter("shed", type="SC") == 1
+        assert metrics.counter("trains_saved", type="deactivated") == 0
+        assert "darwin_degraded 1" in metrics.render().splitlines()
+
+    def test_init__needs_priority_stations(self) -> None:
+        with pytest.raises(ValueError):
+            MessageService(InMemoryRepository(), watch=WatchSet(["BRSTLTM"]), lag=LagMonitor())
+
+    def test_parse_raw__follows_shared_flag(self) -> None:
+
+        flag = multiprocessing.Value("b", 0)
+        metrics = Metrics()
+        repository = InMemoryRepository()
+        service = MessageService(
+            repository,
+            sink=TrainSink(),
+            watch=WatchSet(["BRSTLTM", "PADTON"], priority=["PADTON"]),
+            metrics=metrics,
+            lag=DegradedFlag(flag)
+        )
+
+        flag.value = 1
+        service.parse_raw(RawMessage(MessageType.TS.value, get_xml_fixture("ts_stopping.xml")))
+        service.parse_raw(RawMessage(MessageType.SC.value, get_xml_fixture("sc_deactivated.xml")))
+
+        assert service.degraded
+        assert not repository.updates
+        assert metrics.counter("shed", type="SC") == 1
+
+        flag.value = 0
+        service.parse_raw(RawMessage(MessageType.TS.value, get_xml_fixture("ts_stopping.xml")))
+
+        assert not service.degraded
+        assert len(repository.updates) == 1
+
+
+class TestWatchSetPriority:
+
+    @pytest.mark.parametrize(
+        "stations,priority,expected_stations,expected_priority",
+        [
+            (["BRSTLTM"], [], {"BRSTLTM"}, set()),
+            (["BRSTLTM"], ["padton"], {"BRSTLTM", "PADTON"}, {"PADTON"}),
+            (["BRSTLTM", "PADTON"], ["PADTON"], {"BRSTLTM", "PADTON"}, {"PADTON"}),
+        ]
+    )
+    def test_priority(
+        self,
+        stations: list[str],
+        priority: list[str],
+        expected_stations: set[str],
+        expected_priority: set[str]
+    ) -> None:
+
+        watch = WatchSet(stations, priority)
+
+        assert watch.stations == expected_stations
+        assert watch.priority == expected_priority
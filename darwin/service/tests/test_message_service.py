@@ -0,0 +1,111 @@
+from __future__ import annotations
+import gzip
+import os
+
+from darwin.messages.src.common import MessageType, RawMessage
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.metrics import Metrics
+from darwin.service.src.watch import WatchSet
+from darwin.service.tests.helpers import InMemoryRepository, get_xml_fixture
+from darwin.stomp_client import StompClient
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def working_directory(tmp_path, monkeypatch) -> None:
+    monkeypatch.chdir(tmp_path)
+
+
+class TestMessageService:
+
+    def test_parse_raw__drops_filtered_frames_without_decompressing(self) -> None:
+
+        service = MessageService(InMemoryRepository(), message_filter=MessageType.TS)
+        raw_message = RawMessage("SC", b"not gzip")
+
+        service.parse_raw(raw_message)
+        service.parse_raw(RawMessage("OW", b"not gzip"))
+
+        assert service.dropped_frames == 2
+        assert "payload" not in raw_message.__dict__
+
+    @pytest.mark.parametrize("streaming", [True, False])
+    def test_parse_raw__saves_watched_ts(self, streaming: bool) -> None:
+
+        repository = InMemoryRepository()
+        service = MessageService(
+            repository,
+            message_filter=MessageType.TS,
+            streaming=streaming,
+            watch=WatchSet(["BRSTLTM"])
+        )
+
+        service.parse_raw(RawMessage("TS", get_xml_fixture("ts_stopping.xml")))
+        service.parse_raw(RawMessage("TS", get_xml_fixture("ts_passing.xml")))
+
+        assert service.dropped_frames == 0
+        assert [update.service.rid for update in repository.updates] == ["202406187143949"]
+        assert [len(locations) for locations in repository.locations] == [3]
+
+    def test_parse_raw__routes_to_every_matching_station(self) -> None:
+
+        repository = InMemoryRepository()
+        watch = WatchSet(["BRSTLTM,PADTON", "CHPNHAM", "READING"])
+        service = MessageService(repository, watch=watch)
+
+        service.parse_raw(RawMessage("TS", get_xml_fixture("ts_stopping.xml")))
+        service.parse_raw(RawMessage("TS", get_xml_fixture("ts_passing.xml")))
+        service.parse_raw(RawMessage("SC", get_xml_fixture("sc_cis_multiple.xml")))
+        service.close()
+
+        # Train type updates carry no locations, so they are kept once outside the stations
+        assert watch.matches() == {"BRSTLTM": 2, "CHPNHAM": 1, "PADTON": 2, "READING": 0}
+        assert len(repository.updates) == 2
+        assert sorted(os.listdir("train_info")) == ["BRSTLTM", "CHPNHAM", "PADTON", "type"]
+        assert sorted(os.listdir("train_info/BRSTLTM")) == ["C43949.json", "locations"]
+        assert os.listdir("train_info/CHPNHAM") == ["C43949.json"]
+        assert sorted(os.listdir("train_info/PADTON")) == ["L65432.json", "locations"]
+        assert os.listdir("train_info/PADTON/locations") == os.listdir("train_info/BRSTLTM/locations") == ["rid1.json"]
+        assert os.listdir("train_info/type") == ["rid2.json"]
+
+    def test_parse_raw__default_stations(self) -> None:
+
+        repository = InMemoryRepository()
+        service = MessageService(repository)
+
+        service.parse_raw(RawMessage("TS", get_xml_fixture("ts_stopping.xml")))
+        service.parse_raw(RawMessage("TS", get_xml_fixture("ts_passing.xml")))
+        service.parse_raw(RawMessage("SC", get_xml_fixture("sc_cis_multiple.xml")))
+        service.close()
+
+        # Running trains are kept for Bristol and schedules for Paddington, as before watch sets
+        assert [update.service.rid for update in repository.updates] == ["202406187143949"]
+        assert sorted(os.listdir("train_info")) == ["BRSTLTM", "PADTON", "type"]
+        assert os.listdir("train_info/BRSTLTM") == ["C43949.json"]
+        assert os.listdir("train_info/PADTON") == ["locations"]
+
+    def test_parse_raw__keeps_deactivations_once(self) -> None:
+
+        service = MessageService(InMemoryRepository(), watch=WatchSet(["BRSTLTM,PADTON"]))
+
+        service.parse_raw(RawMessage("SC", get_xml_fixture("sc_deactivated.xml")))
+        service.close()
+
+        assert os.listdir("train_info") == ["deactivated"]
+        assert service.watch.matches() == {"BRSTLTM": 0, "PADTON": 0}
+
+
+class TestStompClient:
+
+    @pytest.mark.parametrize("truncated", [False, True])
+    def test_process__reports_undecodable_frames(self, truncated: bool, capsys) -> None:
+
+        # Cut inside the first watched location, so the prefilter lets it through to the parser
+        payload = gzip.compress(gzip.decompress(get_xml_fixture("ts_stopping.xml"))[:400]) if truncated else b"not gzip"
+
+        service = MessageService(InMemoryRepository(), metrics=Metrics())
+
+        StompClient(service).process(RawMessage("TS", payload))
+
+        assert sum(service.metrics.counter("exceptions", type=name) for name in ["error", "ExpatError"]) == 1
+        assert f"Failed to process TS frame of {len(payload)} bytes" in capsys.readouterr().out
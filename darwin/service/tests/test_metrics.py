@@ -0,0 +1,128 @@
+from __future__ import annotations
+import urllib.error
+import urllib.request
+
+from darwin.messages.src.common import MessageType, RawMessage
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.metrics import Histogram, Metrics, MetricsServer, percentile
+from darwin.service.src.sink import TrainSink
+from darwin.service.src.watch import WatchSet
+from darwin.service.tests.helpers import InMemoryRepository, get_xml_fixture
+import pytest
+
+
+class TestHistogram:
+
+    @pytest.mark.parametrize(
+        "values,q,expected",
+        [
+            ([], 50, 0.0),
+            ([1e-6] * 10, 99, 1e-6),
+            ([3e-6] * 99 + [1.0], 50, 4e-6),
+            ([3e-6] * 99 + [1.0], 99, 4e-6),
+            ([3e-6] * 98 + [1.0] * 2, 99, 2 ** 20 * 1e-6),
+            ([100.0], 50, 2 ** 23 * 1e-6),
+        ]
+    )
+    def test_percentile(self, values: list[float], q: float, expected: float) -> None:
+
+        histogram = Histogram()
+
+        for value in values:
+            histogram.observe(value)
+
+        assert histogram.percentile(q) == pytest.approx(expected)
+
+
+class TestPercentile:
+
+    @pytest.mark.parametrize(
+        "values,q,expected",
+        [
+            ([], 50, 0.0),
+            ([3.0, 1.0, 2.0], 50, 2.0),
+            ([float(i) for i in range(1, 101)], 99, 100.0),
+            ([float(i) for i in range(1, 101)], 100, 100.0),
+        ]
+    )
+    def test_percentile(self, values: list[float], q: float, expected: float) -> None:
+        assert percentile(values, q) == expected
+
+
+class TestMetrics:
+
+    def test_render(self) -> None:
+
+        metrics = Metrics()
+        metrics.inc("frames", type="TS")
+        metrics.inc("frames", type="TS")
+        metrics.count_exception(KeyError("x"))
+        metrics.observe("decompress", 3e-6)
+        metrics.gauge("ingest_depth", lambda: 7)
+
+        lines = metrics.render().splitlines()
+
+        assert 'darwin_frames_total{type="TS"} 2' in lines
+        assert 'darwin_exceptions_total{type="KeyError"} 1' in lines
+        assert 'darwin_stage_seconds_bucket{stage="decompress",le="2e-06"} 0' in lines
+        assert 'darwin_stage_seconds_bucket{stage="decompress",le="4e-06"} 1' in lines
+        assert 'darwin_stage_seconds_count{stage="decompress"} 1' in lines
+        assert "darwin_ingest_depth 7" in lines
+
+    def test_message_service__records_stages_and_swallowed_exceptions(self, tmp_path) -> None:
+
+        metrics = Metrics()
+        service = MessageService(
+            InMemoryRepository(),
+            sink=TrainSink(),
+            watch=WatchSet(["BRSTLTM", "SWINDON"]),
+            metrics=metrics
+        )
+
+        service.parse_raw(RawMessage(MessageType.TS.value, get_xml_fixture("ts_stopping.xml")))
+        service.parse_raw(RawMessage(MessageType.TS.value, get_xml_fixture("ts_passing.xml")))
+        service.parse_raw(RawMessage(MessageType.SC.value, get_xml_fixture("sc_unsupported.xml")))
+
+        for stage in ["decompress", "prefilter", "xml_parse", "message_parse", "filter", "file_write", "db_write"]:
+            assert metrics.histogram(stage).count > 0, stage
+
+        assert metrics.histogram("decompress").count == 3
+        assert metrics.counter("frames_prefiltered") == 1
+        assert metrics.counter("ts_saved") == 1
+        assert metrics.counter("exceptions", type="ScheduleTypeNotSupported") == 1
+        assert "darwin_station_matches{station=\"BRSTLTM\"} 1" in metrics.render().splitlines()
+
+    def test_server(self) -> None:
+
+        metrics = Metrics()
+        metrics.inc("heartbeats")
+
+        server = MetricsServer(("127.0.0.1", 0), metrics)
+        server.start()
+        host, port = server.server_address
+
+        try:
+            with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+                assert "darwin_heartbeats_total 1" in response.read().decode().splitlines()
+
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"http://{host}:{port}/other")
+        finally:
+            server.close()
+
+    def test_drain_and_merge(self) -> None:
+
+        worker = Metrics()
+        worker.inc("frames_prefiltered", 3)
+        worker.observe("xml_parse", 3e-6)
+
+        parent = Metrics()
+        parent.inc("frames_prefiltered")
+        parent.observe("xml_parse", 1.0)
+        parent.merge(*worker.drain())
+
+        assert parent.counter("frames_prefiltered") == 4
+        assert parent.histogram("xml_parse").count == 2
+        assert parent.histogram("xml_parse").percentile(50) == pytest.approx(4e-6)
+        assert worker.counter("frames_prefiltered") == 0
+        assert worker.histogram("xml_parse") is None
@@ -0,0 +1,158 @@
+from __future__ import annotations
+from collections import defaultdict
+import multiprocessing
+import time
+
+from darwin.messages.src.common import RawMessage
+from darwin.service.src.capture import CapturedFrame
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.metrics import Metrics
+from darwin.service.src.pool import ParsePool, ParsePoolClosed, ParsePoolStalled
+from darwin.service.src.sink import TrainSink
+from darwin.service.src.watch import WatchSet
+from darwin.service.tests.helpers import (
+    InMemoryRepository,
+    RecordingSink,
+    consume,
+    generate_frames,
+    get_xml_fixture,
+)
+from darwin.simulator.generator import GeneratorConfig, PportGenerator
+import pytest
+
+
+def run(frames: list[CapturedFrame], processes: int, kill: bool = False) -> tuple[RecordingSink, InMemoryRepository, Metrics]:
+
+    sink = RecordingSink()
+    repository = InMemoryRepository()
+    metrics = Metrics()
+    service = MessageService(
+        repository,
+        sink=sink,
+        watch=WatchSet(["READING", "SWINDON"]),
+        metrics=metrics
+    )
+    pool = ParsePool(service, processes=processes, batch_size=16, poll_secs=0.05) if processes else None
+
+    if kill:
+        pool.start()
+
+        for process in multiprocessing.active_children():
+            if process.name == "parse-worker-0":
+                process.kill()
+
+        while pool.stats().died == 0:
+            time.sleep(0.01)
+
+    consume(service, frames, pool)
+
+    return sink, repository, metrics
+
+
+class TestParsePool:
+
+    def test_pool__matches_inline_processing_per_train(self) -> None:
+
+        frames = generate_frames(40, 400, seed=5)
+
+        inline_sink, inline_repository, inline_metrics = run(frames, 0)
+        pool_sink, pool_repository, pool_metrics = run(frames, 3)
+
+        assert inline_sink.rows
+        assert pool_sink.rows == inline_sink.rows
+
+        def by_rid(repository: InMemoryRepository) -> dict[str, list]:
+            updates = defaultdict(list)
+            for update in repository.updates:
+                updates[update.service.rid].append(update.ts)
+            return updates
+
+        assert by_rid(pool_repository) == by_rid(inline_repository)
+
+        for name in ["ts_saved", "frames_prefiltered"]:
+            assert pool_metrics.counter(name) == inline_metrics.counter(name) > 0, name
+
+        assert pool_metrics.histogram("xml_parse").count == inline_metrics.histogram("xml_parse").count
+
+    def test_pool__replaces_dead_workers(self) -> None:
+
+        frames = generate_frames(40, 200, seed=5)
+
+        inline_sink, _, _ = run(frames, 0)
+
+        # Replaced before it is sent anything, so the replacement is handed the whole shard
+        pool_sink, _, pool_metrics = run(frames, 2, kill=True)
+
+        assert pool_metrics.counter("parse_workers_died") == 1
+        assert pool_sink.rows == inline_sink.rows
+
+    def test_close__after_a_worker_dies(self) -> None:
+
+        service = MessageService(InMemoryRepository(), sink=TrainSink(), metrics=Metrics())
+        pool = ParsePool(service, processes=1, poll_secs=0.05)
+        pool.start()
+
+        for process in multiprocessing.active_children():
+            if process.name == "parse-worker-0":
+                process.kill()
+                process.join()
+
+        pool.close()
+
+        assert pool.stats().died == 1
+
+    def test_submit__full_queue_drops_oldest(self) -> None:
+
+        service = MessageService(InMemoryRepository(), sink=TrainSink(), metrics=Metrics())
+        pool = ParsePool(service, processes=1, batch_size=1, maxsize=1)
+
+        # Never started, so nothing takes the first batch off the queue
+        pool.submit(RawMessage("TS", get_xml_fixture("ts_stopping.xml")))
+
+        while pool._inbound[0].empty():
+            time.sleep(0.01)
+
+        data = get_xml_fixture("ts_passing.xml")
+        started = time.monotonic()
+        pool.submit(RawMessage("TS", data))
+
+        assert time.monotonic() - started < 1
+        assert pool.stats().dropped == 1
+        assert pool.depth() == 1
+        assert service.metrics.counter("parse_pool_dropped") == 1
+        assert pool._inbound[0].get(timeout=1) == [("TS", data)]
+
+    def test_submit__stalled_pool(self) -> None:
+
+        service = MessageService(InMemoryRepository(), sink=TrainSink(), metrics=Metrics())
+        pool = ParsePool(service, processes=1, batch_size=1, maxsize=1)
+        pool.submit(RawMessage("TS", get_xml_fixture("ts_stopping.xml")))
+
+        # A worker that died waiting for a batch leaves the read lock held
+        pool._inbound[0]._rlock.acquire()
+
+        with pytest.raises(ParsePoolStalled):
+            pool.submit(RawMessage("TS", get_xml_fixture("ts_stopping.xml")))
+
+        assert pool.stats().dropped == 1
+        assert pool.depth() == 1
+        assert service.metrics.counter("parse_pool_dropped") == 1
+
+    def test_submit__after_close(self) -> None:
+
+        pool = ParsePool(MessageService(InMemoryRepository(), sink=TrainSink()), processes=1)
+        pool.close()
+
+        with pytest.raises(ParsePoolClosed):
+            pool.submit(RawMessage("TS", b""))
+
+    def test_rid__read_without_decompressing_payload(self) -> None:
+
+        headers, body = PportGenerator(GeneratorConfig(rids=1, seed=1)).frame()
+        raw_message = RawMessage(headers["MessageType"], body)
+        decompressed = RawMessage(headers["MessageType"], body)
+        decompressed.payload
+
+        assert raw_message.rid is not None
+        assert raw_message.rid == decompressed.rid
+        assert "payload" not in raw_message.__dict__
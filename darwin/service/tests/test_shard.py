@@ -0,0 +1,128 @@
+from __future__ import annotations
+from collections import Counter
+from datetime import datetime, timezone
+
+from darwin.messages.src.common import RawMessage
+from darwin.service.src.capture import CapturedFrame
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.metrics import Metrics
+from darwin.service.src.shard import InvalidShardSpec, ShardPlan, ShardSlot, jump_hash, rid_key
+from darwin.service.src.watch import WatchSet
+from darwin.service.tests.helpers import InMemoryRepository, RecordingSink, consume, generate_frames
+import pytest
+
+
+def run(frames: list[CapturedFrame], shards: list[str]) -> tuple[MessageService, InMemoryRepository, RecordingSink]:
+
+    repository = InMemoryRepository()
+    sink = RecordingSink()
+    service = MessageService(
+        repository,
+        sink=sink,
+        watch=WatchSet(["READING", "SWINDON", "PADTON"]),
+        metrics=Metrics(),
+        shard=ShardPlan.parse(shards)
+    )
+
+    consume(service, frames)
+
+    return service, repository, sink
+
+
+def written(*sinks: RecordingSink) -> Counter[str]:
+
+    # A rid handed over at a cutover has its files written by both nodes, so rows are counted per key
+    return sum((Counter({key: len(rows) for key, rows in sink.rows.items()}) for sink in sinks), Counter())
+
+
+class TestShardSlot:
+
+    @pytest.mark.parametrize(
+        "spec,expected",
+        [
+            ("1/4", ShardSlot(0, 4)),
+            ("4/4", ShardSlot(3, 4)),
+            (" 2 / 3 ", ShardSlot(1, 3)),
+            ("-/6@2024-06-18T12:00:00Z", ShardSlot(None, 6, datetime(2024, 6, 18, 12, tzinfo=timezone.utc).timestamp())),
+            ("2/6@2024-06-18T13:00:00+01:00", ShardSlot(1, 6, datetime(2024, 6, 18, 12, tzinfo=timezone.utc).timestamp())),
+        ]
+    )
+    def test_parse(self, spec: str, expected: ShardSlot) -> None:
+        assert ShardSlot.parse(spec) == expected
+
+    @pytest.mark.parametrize("spec", ["", "1", "0/4", "5/4", "1/0", "a/b", "1/4@yesterday"])
+    def test_parse__invalid(self, spec: str) -> None:
+        with pytest.raises(InvalidShardSpec):
+            ShardSlot.parse(spec)
+
+    def test_plan__single_unscheduled_layout(self) -> None:
+        with pytest.raises(InvalidShardSpec):
+            ShardPlan([ShardSlot(0, 2), ShardSlot(0, 3)])
+
+
+class TestJumpHash:
+
+    def test_growing__only_moves_keys_to_the_new_shard(self) -> None:
+
+        keys = [rid_key(f"202406180{i:06d}") for i in range(10000)]
+        before = [jump_hash(key, 4) for key in keys]
+        after = [jump_hash(key, 5) for key in keys]
+
+        moved = [(old, new) for old, new in zip(before, after) if old != new]
+
+        assert all(new == 4 for _, new in moved)
+        assert 0.17 < len(moved) / len(keys) < 0.23
+        assert min(Counter(after).values()) > 1800
+
+
+class TestShardedConsumers:
+
+    def test_every_frame_and_rid_processed_exactly_once(self) -> None:
+
+        frames = generate_frames(300, 1500, seed=3)
+        _, everything, everything_sink = run(frames, [])
+
+        nodes = [run(frames, [f"{i}/3"]) for i in range(1, 4)]
+
+        plans = [ShardPlan.parse([f"{i}/3"]) for i in range(1, 4)]
+        for frame in frames:
+            raw_message = RawMessage(frame.headers["MessageType"], frame.body)
+            assert sum(plan.owns(raw_message) for plan in plans) == 1
+
+        assert sum(service.unowned_frames for service, _, _ in nodes) == 2 * len(frames)
+
+        rids = [{update.service.rid for update in repository.updates} for _, repository, _ in nodes]
+        assert all(rids)
+        assert sum(len(shard) for shard in rids) == len(set().union(*rids))
+        assert set().union(*rids) == {update.service.rid for update in everything.updates}
+
+        assert sum(len(repository.updates) for _, repository, _ in nodes) == len(everything.updates)
+        assert written(*(sink for _, _, sink in nodes)) == written(everything_sink)
+
+    def test_layout_change__hands_over_at_a_feed_timestamp(self) -> None:
+
+        frames = generate_frames(300, 1500, seed=4)
+        sent = sorted(RawMessage(frame.headers["MessageType"], frame.body).sent_at for frame in frames)
+        cutover = datetime.fromtimestamp(sent[len(sent) // 2], timezone.utc).isoformat()
+
+        # Two nodes grow to three, the third only joins at the cutover
+        layouts = [
+            ["1/2", f"1/3@{cutover}"],
+            ["2/2", f"2/3@{cutover}"],
+            [f"3/3@{cutover}"],
+        ]
+
+        _, everything, everything_sink = run(frames, [])
+        nodes = [run(frames, layout) for layout in layouts]
+
+        assert all(repository.updates for _, repository, _ in nodes)
+        assert sum(len(repository.updates) for _, repository, _ in nodes) == len(everything.updates)
+        assert written(*(sink for _, _, sink in nodes)) == written(everything_sink)
+
+        plans = [ShardPlan.parse(layout) for layout in layouts]
+        for frame in frames:
+            raw_message = RawMessage(frame.headers["MessageType"], frame.body)
+            owners = [plan.owns(raw_message) for plan in plans]
+
+            assert sum(owners) == 1
+            assert not owners[2] or raw_message.sent_at >= sent[len(sent) // 2]
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import json
+import os
+
+from darwin.service.src import sink as sink_module
+from darwin.service.src.sink import JsonlSink
+
+
+def rewrite(path: str, rows: list[dict]) -> None:
+
+    try:
+        with open(path, "r") as f:
+            data = [json.loads(line) for line in f]
+    except FileNotFoundError:
+        data = []
+
+    data.extend(rows)
+
+    with open(path, "w") as f:
+        f.write("\n".join([json.dumps(x) for x in data]))
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+BATCHES = [
+    [{"rid": "rid1", "tpl": "BRSTLTM", "departure": None}],
+    [],
+    [{"rid": "rid1", "tpl": "BATHSPA", "arrival": {"ts": "14:20", "delayed": False}}, {"rid": "rid1", "tpl": "PADTON"}],
+    [{"rid": "rid1", "tpl": "READING", "platform": {"text": "9B"}}],
+]
+
+
+class TestJsonlSink:
+
+    def test_append__matches_rewrite(self, tmp_path) -> None:
+
+        sink = JsonlSink(f"{tmp_path}/actual", max_open_files=1)
+
+        for i, rows in enumerate(BATCHES):
+            rewrite(f"{tmp_path}/expected.json", rows)
+            sink.append("a.json", rows)
+            sink.append("b.json", rows[:1])
+            rewrite(f"{tmp_path}/expected_b.json", rows[:1])
+
+        sink.close()
+
+        assert read(f"{tmp_path}/actual/a.json") == read(f"{tmp_path}/expected.json")
+        assert read(f"{tmp_path}/actual/b.json") == read(f"{tmp_path}/expected_b.json")
+
+    def test_append__continues_existing_file(self, tmp_path) -> None:
+
+        path = f"{tmp_path}/rid1.json"
+        rewrite(path, BATCHES[0])
+
+        sink = JsonlSink(str(tmp_path))
+        sink.append("rid1.json", BATCHES[2])
+        sink.close()
+
+        rewrite(f"{tmp_path}/expected.json", BATCHES[0])
+        rewrite(f"{tmp_path}/expected.json", BATCHES[2])
+
+        assert read(path) == read(f"{tmp_path}/expected.json")
+
+    def test_append__bounds_open_files(self, tmp_path) -> None:
+
+        sink = JsonlSink(str(tmp_path), max_open_files=2, fsync_interval_secs=0)
+
+        for i in range(5):
+            sink.append(f"nested/{i}.json", BATCHES[0])
+
+        assert sink.open_files == 2
+        assert all(os.path.getsize(f"{tmp_path}/nested/{i}.json") > 0 for i in range(5))
+
+        sink.close()
+
+    def test_append__syncs_outside_the_lock(self, tmp_path, monkeypatch) -> None:
+
+        sink = JsonlSink(str(tmp_path), max_open_files=2, fsync_interval_secs=3600)
+        synced = []
+        fsync = os.fsync
+
+        def record(fd: int) -> None:
+            synced.append(sink._lock.locked())
+            fsync(fd)
+
+        monkeypatch.setattr(sink_module.os, "fsync", record)
+
+        # Evicted files wait for the next sync rather than stalling the append that evicts them
+        for i in range(4):
+            sink.append(f"{i}.json", BATCHES[0])
+
+        assert synced == []
+
+        sink.sync()
+        assert synced == [False] * 4
+
+        sink.append("0.json", BATCHES[3])
+        sink.close()
+
+        assert synced == [False] * 7
+        assert read(f"{tmp_path}/0.json").count(b"\n") == 1
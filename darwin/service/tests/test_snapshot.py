@@ -0,0 +1,159 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+import os
+
+from darwin.messages.src.ts import LocationTimestamp, PassingLocation, Platform, Status, StoppingLocation
+from darwin.repository.tests.helpers import ts_message
+from darwin.service.src.board import BoardKind, LiveStateStore
+from darwin.service.src.delta import TrainState, TrainStateTable, location_key
+from darwin.service.src.metrics import Metrics
+from darwin.service.src.snapshot import Snapshot, SnapshotError, SnapshotWriter, load_snapshot, write_snapshot
+import pytest
+
+SEEN = datetime(2024, 6, 18, 14, 0, 30, 250000)
+
+
+def looping_train() -> TrainState:
+
+    locations = [
+        StoppingLocation(
+            tpl="BRSTLTM",
+            arrival=None,
+            departure=LocationTimestamp(14 * 60 + 10, "TD", False, Status.ACTUAL),
+            platform=Platform("P", True, "13"),
+            working_times="/14:10/"
+        ),
+        PassingLocation(tpl="BATHSPA", passing=LocationTimestamp(14 * 60 + 25, None, True, Status.ESTIMATED)),
+        StoppingLocation(
+            tpl="BRSTLTM",
+            arrival=LocationTimestamp(23 * 60 + 59, "Darwin", False, Status.ESTIMATED),
+            departure=None,
+            platform=None,
+            working_times="23:58:30//"
+        ),
+    ]
+
+    return TrainState("P12345", SEEN, {location_key(location): location for location in locations})
+
+
+def recorded(*rids: str) -> TrainStateTable:
+
+    table = TrainStateTable()
+
+    for minute, rid in enumerate(rids):
+        message = ts_message(rid, minute)
+        table.record(message, len(message.locations))
+
+    return table
+
+
+class TestSnapshot:
+
+    def test_write_snapshot__round_trip(self, tmp_path) -> None:
+
+        path = str(tmp_path / "state.snapshot")
+        train = looping_train()
+
+        write_snapshot(path, [("rid2", train), ("rid1", TrainState("P1", SEEN, {}))], taken=SEEN)
+
+        with Snapshot(path) as snapshot:
+            assert len(snapshot) == 2
+            assert snapshot.taken == SEEN
+            assert [rid for rid, _ in snapshot.trains()] == ["rid1", "rid2"]
+            assert snapshot.train("rid2") == train
+            assert snapshot.train("rid3") is None
+
+        assert os.listdir(tmp_path) == ["state.snapshot"]
+
+    @pytest.mark.parametrize("contents", [b"", b"DWSS", b"NOTASNAPSHOT" * 8])
+    def test_snapshot__rejects_unreadable_files(self, tmp_path, contents: bytes) -> None:
+
+        path = tmp_path / "state.snapshot"
+        path.write_bytes(contents)
+
+        with pytest.raises(SnapshotError):
+            Snapshot(str(path))
+
+    def test_snapshot__rejects_truncated_records(self, tmp_path) -> None:
+
+        path = tmp_path / "state.snapshot"
+        write_snapshot(str(path), [("rid1", looping_train())])
+
+        # Cut into the location records while leaving the header's offsets pointing past them
+        data = path.read_bytes()
+        path.write_bytes(data[:40] + data[-64:])
+
+        with pytest.raises(SnapshotError):
+            with Snapshot(str(path)) as snapshot:
+                list(snapshot.trains())
+
+
+class TestLoadSnapshot:
+
+    def test_load_snapshot__restores_state_and_board(self, tmp_path) -> None:
+
+        path = str(tmp_path / "state.snapshot")
+        write_snapshot(path, recorded("rid1", "rid2").trains())
+
+        state = TrainStateTable()
+        board = LiveStateStore(metrics=Metrics())
+
+        assert load_snapshot(path, state, board, metrics=Metrics()) == 2
+        assert len(state) == 2
+
+        # A repeat of what was written before the restart is still recognised as one
+        assert state.delta(ts_message("rid1", 0)) is None
+        arrivals = board.board("BRSTLTM", BoardKind.ARRIVALS, at=datetime(2024, 6, 18, 13, 0))
+        assert [(entry.rid, entry.platform.text) for entry in arrivals] == [("rid1", "13"), ("rid2", "13")]
+
+    def test_load_snapshot__missing_or_corrupt_is_a_cold_start(self, tmp_path) -> None:
+
+        path = tmp_path / "state.snapshot"
+        state = TrainStateTable()
+        metrics = Metrics()
+
+        assert load_snapshot(str(path), state, metrics=metrics) == 0
+
+        path.write_bytes(b"corrupt")
+
+        assert load_snapshot(str(path), state, metrics=metrics) == 0
+        assert metrics.counter("exceptions", type="SnapshotError") == 1
+        assert len(state) == 0
+
+
+class TestTrainStateTableRestore:
+
+    def test_restore__keeps_newer_trains_and_expires_stale(self) -> None:
+
+        snapshot = recorded("rid1").trains()[0][1]
+        stale = TrainState("P0", snapshot.seen - timedelta(hours=2), {})
+
+        table = TrainStateTable(max_age=timedelta(hours=1))
+        table.record(ts_message("rid1", 5), 2)
+
+        assert table.restore([("rid1", snapshot), ("rid0", stale), ("rid2", TrainState("P2", snapshot.seen, {}))]) == 2
+        assert [rid for rid, _ in table.trains()] == ["rid2", "rid1"]
+        assert table.trains()[1][1].seen == datetime(2024, 6, 18, 14, 5)
+        assert table.evicted_stale == 1
+
+
+class TestSnapshotWriter:
+
+    def test_write__flushes_before_writing(self, tmp_path) -> None:
+
+        path = str(tmp_path / "state.snapshot")
+        calls = []
+
+        def flush() -> None:
+            calls.append(os.path.exists(path))
+
+        writer = SnapshotWriter(path, recorded("rid1"), flush=flush, interval_secs=60, metrics=Metrics())
+
+        assert writer.write() == 1
+        assert calls == [False]
+
+        assert writer.close() == 1
+        assert writer.written == 2
+
+        with Snapshot(path) as snapshot:
+            assert [rid for rid, _ in snapshot.trains()] == ["rid1"]
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from darwin.service.src.watch import DEFAULT_SCHEDULE_STATIONS, DEFAULT_STATIONS, EmptyWatchSet, WatchSet
+import pytest
+
+
+class TestWatchSet:
+
+    @pytest.mark.parametrize(
+        "stations,expected",
+        [
+            (["BRSTLTM"], {"BRSTLTM"}),
+            (["brstltm, padton", "READING"], {"BRSTLTM", "PADTON", "READING"}),
+            (["BRSTLTM BRSTLTM"], {"BRSTLTM"}),
+            ([], set(DEFAULT_STATIONS)),
+        ]
+    )
+    def test_create(self, stations: list[str], expected: set[str]) -> None:
+        assert WatchSet.create(stations).stations == frozenset(expected)
+
+    @pytest.mark.parametrize(
+        "stations,expected_stations,expected_schedule_stations",
+        [
+            ([], set(DEFAULT_STATIONS), set(DEFAULT_SCHEDULE_STATIONS)),
+            (["READING"], {"READING"}, {"READING"}),
+        ]
+    )
+    def test_create__schedule_stations(
+        self,
+        stations: list[str],
+        expected_stations: set[str],
+        expected_schedule_stations: set[str]
+    ) -> None:
+
+        watch = WatchSet.create(stations)
+
+        assert watch.stations == frozenset(expected_stations)
+        assert watch.schedule_stations == frozenset(expected_schedule_stations)
+
+    def test_create__merges_file(self, tmp_path) -> None:
+
+        path = f"{tmp_path}/stations.txt"
+
+        with open(path, "w") as f:
+            f.write("# Great Western\nPADTON\nSWINDON  # junction\n\n")
+
+        assert WatchSet.create(["BRSTLTM"], path).stations == frozenset(["BRSTLTM", "PADTON", "SWINDON"])
+
+    def test_init__empty(self) -> None:
+        with pytest.raises(EmptyWatchSet):
+            WatchSet([" , "])
+
+    def test_record(self) -> None:
+
+        watch = WatchSet(["BRSTLTM", "PADTON"])
+        watch.record(frozenset(["BRSTLTM"]))
+        watch.record(frozenset(["BRSTLTM", "PADTON"]))
+
+        assert watch.matches() == {"BRSTLTM": 2, "PADTON": 1}
+        assert str(watch) == "BRSTLTM=2 PADTON=1"
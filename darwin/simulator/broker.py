@@ -0,0 +1,200 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+import gzip
+import itertools
+import socket
+import socketserver
+import threading
+import time
+from typing import Iterator, Optional
+
+from darwin.messages.src.common import PPORT_TS_PATTERN
+from darwin.simulator.generator import PportGenerator
+
+
+class StompProtocolError(Exception):
+    ...
+
+
+def encode_frame(command: str, headers: dict[str, str], body: bytes = b"") -> bytes:
+
+    lines = [command] + [f"{key}:{value}" for key, value in headers.items()]
+
+    if body:
+        lines.append(f"content-length:{len(body)}")
+
+    return ("\n".join(lines) + "\n\n").encode() + body + b"\x00"
+
+
+class _FrameReader:
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock = sock
+        self._buffer = b""
+
+    def read(self) -> Optional[tuple[str, dict[str, str]]]:
+
+        while True:
+            # Heart-beats arrive as bare end-of-lines between frames
+            self._buffer = self._buffer.lstrip(b"\r\n")
+            end = self._buffer.find(b"\x00")
+
+            if end >= 0:
+                frame, self._buffer = self._buffer[:end], self._buffer[end + 1:]
+                head = frame.split(b"\n\n", 1)[0].decode().replace("\r", "")
+                command, *lines = head.split("\n")
+
+                return command, dict(line.split(":", 1) for line in lines if ":" in line)
+
+            chunk = self._sock.recv(65536)
+
+            if not chunk:
+                return None
+
+            self._buffer += chunk
+
+
+class _StompHandler(socketserver.BaseRequestHandler):
+
+    server: StompBroker
+
+    def setup(self) -> None:
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._heartbeat_secs = 0.0
+
+    def _send(self, data: bytes) -> None:
+        with self._lock:
+            self.request.sendall(data)
+
+    def _background(self, target, *args) -> None:
+
+        def run() -> None:
+            try:
+                target(*args)
+            except OSError:
+                self._closed.set()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _heartbeat(self) -> None:
+        while not self._closed.wait(self._heartbeat_secs):
+            self._send(b"\n")
+
+    def _publish(self, subscription: str, destination: str) -> None:
+
+        message_ids = itertools.count()
+
+        for headers, body in self.server.frames(self._closed):
+            self._send(encode_frame("MESSAGE", {
+                "subscription": subscription,
+                "message-id": f"{self.server.name}-{next(message_ids)}",
+                "destination": destination,
+                **headers
+            }, body))
+
+    def handle(self) -> None:
+
+        reader = _FrameReader(self.request)
+
+        try:
+            while (frame := reader.read()) is not None:
+                command, headers = frame
+
+                if command in ("CONNECT", "STOMP"):
+                    # Only the client's wish to receive heart-beats is honoured, none are expected back
+                    client_receive = int(headers.get("heart-beat", "0,0").split(",")[1])
+                    self._heartbeat_secs = client_receive / 1000
+
+                    self._send(encode_frame("CONNECTED", {
+                        "version": "1.2",
+                        "server": self.server.name,
+                        "heart-beat": f"{client_receive},0"
+                    }))
+
+                    if self._heartbeat_secs:
+                        self._background(self._heartbeat)
+
+                elif command == "SUBSCRIBE":
+                    self._background(self._publish, headers.get("id", "1"), headers.get("destination", ""))
+
+                elif command == "DISCONNECT":
+                    if "receipt" in headers:
+                        self._send(encode_frame("RECEIPT", {"receipt-id": headers["receipt"]}))
+                    return
+
+                elif command not in ("ACK", "NACK", "UNSUBSCRIBE"):
+                    raise StompProtocolError(f"Unsupported command {command}")
+
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._closed.set()
+
+
+class StompBroker(socketserver.ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        generator: PportGenerator,
+        rate: float = 0.0,
+        count: int = 0,
+        pool: int = 10000,
+        restamp: bool = True,
+        name: str = "darwin-simulator"
+    ) -> None:
+        super().__init__(address, _StompHandler)
+
+        self.name = name
+        self._rate = rate
+        self._count = count
+
+        self._restamp = restamp
+
+        # Generating XML is slower than parsing it, so a pool of frames is built up front and
+        # cycled to find the consumer's saturation point. Restamped frames are compressed as
+        # they are sent so their Pport ts is the send time and feed lag can be measured
+        if restamp:
+            self._pool = [generator.xml_frame() for _ in range(pool)]
+        else:
+            self._pool = list(generator.frames(pool))
+
+        self._lock = threading.Lock()
+        self._sent = 0
+
+    @property
+    def sent(self) -> int:
+        return self._sent
+
+    def frames(self, closed: threading.Event) -> Iterator[tuple[dict[str, str], bytes]]:
+
+        start = time.perf_counter()
+        sent = 0
+
+        for headers, body in itertools.cycle(self._pool):
+
+            if closed.is_set() or (self._count and sent >= self._count):
+                return
+
+            if self._rate > 0:
+                delay = start + sent / self._rate - time.perf_counter()
+
+                if delay > 0:
+                    time.sleep(delay)
+
+            if self._restamp:
+                stamp = datetime.now(timezone.utc).isoformat(timespec="microseconds").encode()
+                body = gzip.compress(
+                    PPORT_TS_PATTERN.sub(lambda match: match.group(0).replace(match.group(1), stamp), body, count=1),
+                    compresslevel=1
+                )
+
+            yield headers, body
+
+            sent += 1
+            with self._lock:
+                self._sent += 1
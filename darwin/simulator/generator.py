@@ -0,0 +1,191 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import gzip
+import random
+from typing import Iterator, Optional
+
+PPORT_NS = "http://www.thalesgroup.com/rtti/PushPort/v16"
+FORECASTS_NS = "http://www.thalesgroup.com/rtti/PushPort/Forecasts/v3"
+SCHEDULES_NS = "http://www.thalesgroup.com/rtti/PushPort/Schedules/v3"
+
+# Roughly the Great Western main line, busiest first
+DEFAULT_TIPLOCS = (
+    "PADTON", "READING", "BRSTLTM", "SWINDON", "DIDCOTP", "SLOUGH", "BATHSPA", "CHPNHAM",
+    "BRSTPWY", "NEWPRTS", "CRDFCEN", "OXFD", "HTRWAPT", "MDNHEAD", "TWYFORD", "KEMBLE",
+    "STROUD", "GLOSTER", "CHLTNHM", "WSTBRYW", "TRWBRDG", "FROME", "TAUNTON", "EXETRSD",
+)
+
+
+@dataclass
+class GeneratorConfig:
+
+    rids: int = 2000
+    tiplocs: tuple[str, ...] = DEFAULT_TIPLOCS
+    skew: float = 1.0
+    min_stops: int = 3
+    max_stops: int = 12
+    locations_per_update: int = 3
+    passing_ratio: float = 0.3
+    mix: dict[str, float] = field(default_factory=lambda: {
+        "ts": 0.85,
+        "cis": 0.07,
+        "darwin": 0.02,
+        "deactivated": 0.06,
+    })
+    seed: Optional[int] = None
+    start: datetime = datetime(2024, 6, 18, 6, 0)
+
+
+@dataclass
+class _Train:
+
+    rid: str
+    uid: str
+    train_id: str
+    departs: datetime
+    route: list[str]
+    position: int = 0
+
+    def time_at(self, stop: int, offset_mins: int = 0) -> str:
+        return (self.departs + timedelta(minutes=stop * 4 + offset_mins)).strftime("%H:%M")
+
+
+class PportGenerator:
+
+    def __init__(self, config: Optional[GeneratorConfig] = None) -> None:
+
+        self._config = config or GeneratorConfig()
+        self._random = random.Random(self._config.seed)
+        self._weights = [1 / (rank + 1) ** self._config.skew for rank in range(len(self._config.tiplocs))]
+        self._kinds = list(self._config.mix)
+        self._kind_weights = [self._config.mix[kind] for kind in self._kinds]
+
+        self._sequence = 0
+        self._next_train = 0
+        self._clock = self._config.start
+        self._trains = [self._new_train() for _ in range(self._config.rids)]
+
+    def _new_train(self) -> _Train:
+
+        number = self._next_train
+        self._next_train += 1
+
+        stops = self._random.randint(self._config.min_stops, min(self._config.max_stops, len(self._config.tiplocs)))
+        route: list[str] = []
+
+        # Weighted sampling without replacement keeps busy stations on most routes
+        while len(route) < stops:
+            tiploc = self._random.choices(self._config.tiplocs, weights=self._weights)[0]
+            if tiploc not in route:
+                route.append(tiploc)
+
+        return _Train(
+            rid=f"{self._clock:%Y%m%d}{number:07d}",
+            uid=f"C{number % 100000:05d}",
+            train_id=f"{self._random.randint(1, 9)}{self._random.choice('ABCFHKLMPSTVW')}{number % 100:02d}",
+            departs=self._clock + timedelta(minutes=self._random.randint(0, 120)),
+            route=route
+        )
+
+    def _pport(self, children: str, namespace: str = "") -> bytes:
+
+        ts = self._clock.strftime("%Y-%m-%dT%H:%M:%S") + f".{self._random.randint(0, 9999999):07d}+01:00"
+
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<Pport xmlns="{PPORT_NS}"{namespace} ts="{ts}" version="16.0">{children}</Pport>'
+        ).encode()
+
+    def _ts(self, train: _Train) -> bytes:
+
+        locations = []
+
+        for _ in range(self._config.locations_per_update):
+            stop = train.position % len(train.route)
+            tpl = train.route[stop]
+            late = self._random.choice([0, 0, 0, 1, 2, 5])
+
+            if 0 < stop < len(train.route) - 1 and self._random.random() < self._config.passing_ratio:
+                locations.append(
+                    f'<ns5:Location tpl="{tpl}" wtp="{train.time_at(stop)}:30">'
+                    f'<ns5:pass et="{train.time_at(stop, late)}" src="TD"/>'
+                    f'</ns5:Location>'
+                )
+            else:
+                arrival = train.time_at(stop)
+                departure = train.time_at(stop, 1)
+                delayed = ' delayed="true"' if late > 2 else ""
+                locations.append(
+                    f'<ns5:Location tpl="{tpl}" wta="{arrival}" wtd="{departure}" pta="{arrival}" ptd="{departure}">'
+                    f'<ns5:arr at="{train.time_at(stop, late)}" src="TD"/>'
+                    f'<ns5:dep et="{train.time_at(stop, late + 1)}" src="Darwin"{delayed}/>'
+                    f'<ns5:plat platsrc="A" conf="true">{self._random.randint(1, 15)}</ns5:plat>'
+                    f'</ns5:Location>'
+                )
+
+            train.position += 1
+
+        return self._pport(
+            f'<uR updateOrigin="TD"><TS rid="{train.rid}" uid="{train.uid}" ssd="{train.departs:%Y-%m-%d}">'
+            + "".join(locations) +
+            '</TS></uR>',
+            namespace=f' xmlns:ns5="{FORECASTS_NS}"'
+        )
+
+    def _schedule(self, train: _Train, origin: str) -> bytes:
+
+        locations = [f'<ns2:OR tpl="{train.route[0]}" act="TB" ptd="{train.time_at(0)}" wtd="{train.time_at(0)}"/>']
+
+        for stop, tpl in enumerate(train.route[1:-1], start=1):
+            at = train.time_at(stop)
+            locations.append(f'<ns2:IP tpl="{tpl}" act="T " pta="{at}" ptd="{at}" wta="{at}" wtd="{at}"/>')
+
+        last = len(train.route) - 1
+        locations.append(f'<ns2:DT tpl="{train.route[last]}" act="TF" pta="{train.time_at(last)}" wta="{train.time_at(last)}"/>')
+
+        return self._pport(
+            f'<uR updateOrigin="{origin}">'
+            f'<schedule rid="{train.rid}" uid="{train.uid}" trainId="{train.train_id}" ssd="{train.departs:%Y-%m-%d}" toc="GW">'
+            + "".join(locations) +
+            '</schedule></uR>',
+            namespace=f' xmlns:ns2="{SCHEDULES_NS}"'
+        )
+
+    def _deactivated(self, index: int) -> bytes:
+
+        train = self._trains[index]
+        self._trains[index] = self._new_train()
+
+        return self._pport(f'<uR updateOrigin="Darwin"><deactivated rid="{train.rid}"/></uR>')
+
+    def xml(self) -> tuple[str, bytes]:
+
+        self._sequence += 1
+        self._clock += timedelta(milliseconds=50)
+
+        index = self._random.randrange(len(self._trains))
+        kind = self._random.choices(self._kinds, weights=self._kind_weights)[0]
+
+        if kind == "ts":
+            return "TS", self._ts(self._trains[index])
+        if kind == "cis":
+            return "SC", self._schedule(self._trains[index], "CIS")
+        if kind == "darwin":
+            return "SC", self._schedule(self._trains[index], "Darwin")
+
+        return "SC", self._deactivated(index)
+
+    def xml_frame(self) -> tuple[dict[str, str], bytes]:
+
+        message_type, xml = self.xml()
+        return {"MessageType": message_type, "PushPortSequence": str(self._sequence)}, xml
+
+    def frame(self) -> tuple[dict[str, str], bytes]:
+
+        headers, xml = self.xml_frame()
+        return headers, gzip.compress(xml, compresslevel=6)
+
+    def frames(self, count: int) -> Iterator[tuple[dict[str, str], bytes]]:
+        for _ in range(count):
+            yield self.frame()
@@ -0,0 +1,59 @@
+from __future__ import annotations
+import threading
+import time
+
+import stomp
+
+from darwin.messages.src.common import MessageType
+from darwin.service.src.message_service import MessageService
+from darwin.service.src.sink import TrainSink
+from darwin.service.src.watch import WatchSet
+from darwin.service.tests.helpers import InMemoryRepository
+from darwin.simulator.broker import StompBroker
+from darwin.simulator.generator import GeneratorConfig, PportGenerator
+from darwin.stomp_client import StompClient
+
+
+class CountingClient(StompClient):
+
+    def __init__(self, message_service: MessageService) -> None:
+        super().__init__(message_service)
+        self.frames = 0
+
+    def on_message(self, frame) -> None:
+        super().on_message(frame)
+        self.frames += 1
+
+
+class TestStompBroker:
+
+    def test_listen__consumes_generated_frames(self) -> None:
+
+        broker = StompBroker(("127.0.0.1", 0), PportGenerator(GeneratorConfig(rids=50, seed=2)), count=300, pool=100)
+        threading.Thread(target=broker.serve_forever, daemon=True).start()
+
+        repository = InMemoryRepository()
+        service = MessageService(
+            repository,
+            message_filter=MessageType.TS,
+            sink=TrainSink(),
+            watch=WatchSet(["PADTON"])
+        )
+        client = CountingClient(service)
+
+        conn = stomp.Connection12([broker.server_address], auto_decode=False, heartbeats=(0, 1000))
+        conn.set_listener("", client)
+        conn.connect(username="user", passcode="pass", wait=True)
+        conn.subscribe(destination="/topic/darwin.pushport-v16", id="1", ack="auto")
+
+        deadline = time.monotonic() + 10
+        while client.frames < 300 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        conn.disconnect()
+        broker.shutdown()
+        broker.server_close()
+
+        assert client.frames == broker.sent == 300
+        assert service.dropped_frames > 0
+        assert repository.updates
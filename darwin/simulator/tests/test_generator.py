@@ -0,0 +1,68 @@
+from __future__ import annotations
+from collections import Counter
+import zlib
+
+from darwin.messages.src.common import Message, RawMessage
+from darwin.messages.src.decoder import StreamingDecoder
+from darwin.messages.src.schedule import InvalidDarwinScheduleException, ScheduleParser, TrainDeactivated, TrainLocations
+from darwin.messages.src.ts import TSService
+from darwin.simulator.generator import GeneratorConfig, PportGenerator
+
+
+def decode(headers: dict[str, str], body: bytes) -> list:
+
+    raw_message = RawMessage(headers["MessageType"], body)
+
+    if raw_message.message_type == "TS":
+        streaming = StreamingDecoder.decode_ts(raw_message.payload)
+        assert streaming == TSService.parse(Message.from_message(raw_message))
+        return [streaming]
+
+    try:
+        streaming = StreamingDecoder.decode_schedule(raw_message.payload)
+    except InvalidDarwinScheduleException:
+        return []
+
+    message = Message.from_message(raw_message)
+    assert streaming == ScheduleParser.create(message.body, message.timestamp)
+    return streaming
+
+
+class TestPportGenerator:
+
+    def test_frames__decode_on_both_paths(self) -> None:
+
+        kinds: Counter[str] = Counter()
+
+        for headers, body in PportGenerator(GeneratorConfig(rids=20, seed=7)).frames(400):
+            kinds.update(type(message).__name__ for message in decode(headers, body))
+
+        assert kinds["TSMessage"] > 250
+        assert kinds["TrainLocations"] > 0
+        assert kinds["TrainDeactivated"] > 0
+
+    def test_frames__bounded_active_rids(self) -> None:
+
+        generator = PportGenerator(GeneratorConfig(rids=5, seed=1, mix={"ts": 1.0}))
+        rids = {decode(headers, body)[0].update.service.rid for headers, body in generator.frames(200)}
+
+        assert len(rids) == 5
+
+    def test_frames__tiploc_skew(self) -> None:
+
+        config = GeneratorConfig(rids=200, seed=3, skew=2.0, tiplocs=("BUSY", "QUIET", "QUIETER", "QUIETEST"), min_stops=1, max_stops=1, mix={"ts": 1.0})
+        counts = Counter(
+            location.tpl
+            for headers, body in PportGenerator(config).frames(200)
+            for location in decode(headers, body)[0].locations
+        )
+
+        assert counts.most_common(1)[0][0] == "BUSY"
+        assert counts["BUSY"] > counts["QUIET"] > counts["QUIETEST"]
+
+    def test_frame__deterministic_with_seed(self) -> None:
+
+        first = [zlib.decompress(body, zlib.MAX_WBITS | 32) for _, body in PportGenerator(GeneratorConfig(seed=5)).frames(20)]
+        second = [zlib.decompress(body, zlib.MAX_WBITS | 32) for _, body in PportGenerator(GeneratorConfig(seed=5)).frames(20)]
+
+        assert first == second
@@ -1,10 +1,14 @@
 import traceback
+from typing import Optional
 from darwin.messages.src.common import NotURMessage
 import stomp
 import time
 import logging
-from darwin.messages.src.common import Message, RawMessage, NoValidMessageTypeFound
+from darwin.messages.src.common import RawMessage, NoValidMessageTypeFound
+from darwin.service.src.capture import FrameCapture
+from darwin.service.src.ingest import IngestQueue
 from darwin.service.src.message_service import MessageService
+from darwin.service.src.pool import ParsePool, ParsePoolStalled
 from darwin.messages.src.ts import IncorrectMessageFormat
 
 
@@ -12,12 +16,61 @@ RECONNECT_DELAY_SECS = 15
 
 class StompClient(stomp.ConnectionListener):
 
-    def __init__(self, message_service: MessageService, show_raw: bool = False):
+    def __init__(
+        self,
+        message_service: MessageService,
+        show_raw: bool = False,
+        ingest: Optional[IngestQueue] = None,
+        capture: Optional[FrameCapture] = None,
+        pool: Optional[ParsePool] = None
+    ):
         self._message_service = message_service
         self._show_raw = show_raw
+        self._ingest = ingest
+        self._capture = capture
+        self._pool = pool
+
+        if self._ingest:
+            self._ingest.start(self.process)
+
+        if self._pool:
+            self._pool.start()
+
+        self._register_gauges()
+
+    def _register_gauges(self) -> None:
+
+        metrics = self._message_service.metrics
+        ingest = self._ingest
+        capture = self._capture
+        pool = self._pool
+        service_cache = self._message_service.service_cache
+
+        if ingest:
+            metrics.gauge("ingest_depth", ingest.depth)
+            metrics.gauge("ingest_max_depth", lambda: ingest.stats().max_depth)
+            metrics.gauge("ingest_processed", lambda: ingest.stats().processed)
+            metrics.gauge("ingest_dropped", lambda: ingest.stats().dropped)
+            metrics.gauge("ingest_spilled", lambda: ingest.stats().spilled)
+
+        if pool:
+            metrics.gauge("parse_pool_depth", pool.depth)
+            for i in range(pool.processes):
+                metrics.gauge("parse_pool_frames", lambda i=i: pool.stats().worker_frames[i], worker=str(i))
+
+        if capture:
+            metrics.gauge("captured_frames", lambda: capture.frames)
+
+        if service_cache:
+            metrics.gauge("service_cache_size", lambda: len(service_cache))
+            metrics.gauge("service_cache_hit_rate", lambda: service_cache.hit_rate)
 
     def on_heartbeat(self):
-        print('Received a heartbeat')
+
+        self._message_service.metrics.inc("heartbeats")
+
+        if self._capture:
+            self._capture.flush()
 
     def on_heartbeat_timeout(self):
         print('Heartbeat timeout')
@@ -35,21 +88,39 @@ class StompClient(stomp.ConnectionListener):
 
     def on_message(self, frame):
 
+        if self._capture:
+            self._capture.record(frame.headers, frame.body)
+
         raw_message = RawMessage.parse(frame)
         
         if self._show_raw:
             print(raw_message)
             return
-        
+
+        if not self._message_service.admit(raw_message):
+            return
+
+        if self._pool:
+            try:
+                self._pool.submit(raw_message)
+            except ParsePoolStalled as e:
+                self._message_service.metrics.count_exception(e)
+                print(e)
+        elif self._ingest:
+            self._ingest.submit(raw_message)
+        else:
+            self.process(raw_message)
+
+    def process(self, raw_message: RawMessage) -> None:
+
         try:
-            msg = Message.from_message(raw_message)
-            self._message_service.parse(msg)
-        except NoValidMessageTypeFound: 
-            ...
-        except IncorrectMessageFormat:
-            ...
-        except NotURMessage:
-            ...
+            self._message_service.parse_raw(raw_message)
+        except (NoValidMessageTypeFound, IncorrectMessageFormat, NotURMessage) as e:
+            self._message_service.metrics.count_exception(e)
         except Exception as e: 
-            print(raw_message.body)
-            print(traceback.format_exc())
+            self._message_service.metrics.count_exception(e)
+
+            # The body is parsed on first use, so printing it would raise the same error again
+            data = raw_message.data
+            print(f"Failed to process {raw_message.message_type} frame of {len(data)} bytes: {data[:64]!r}")
+            print(traceback.format_exc())
\ No newline at end of file
@@ -4,13 +4,16 @@ create table service (
     PRIMARY KEY(rid)
 );
 create table service_update (
-    update_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    update_id BIGINT GENERATED BY DEFAULT AS IDENTITY,
     ts TIMESTAMP NOT NULL,
     rid varchar(30) NOT NULL,
+    PRIMARY KEY(update_id, ts),
     CONSTRAINT service_rid
         FOREIGN KEY(rid) 
         REFERENCES service(rid)
-);
+) partition by range (ts);
+create index service_update_rid_ts on service_update(rid, ts);
+create index service_update_ts on service_update(ts);
 create table timestamp (
     ts_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
     ts TIME NOT NULL,
@@ -24,16 +27,16 @@ create table platform (
     confirmed BOOLEAN,
     text varchar(30)
 );
+-- update_id can't reference service_update on its own now its key includes ts, both are retired by day together
 create table location (
-    loc_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
-    update_id BIGINT,
+    loc_id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    update_id BIGINT NOT NULL,
+    ts TIMESTAMP NOT NULL,
     tpl varchar(10) NOT NULL,
-    departure_id BIGINT UNIQUE,
-    arrival_id BIGINT UNIQUE,
-    platform_id BIGINT UNIQUE,
-    CONSTRAINT service_update
-        FOREIGN KEY(update_id) 
-        REFERENCES service_update(update_id),
+    departure_id BIGINT,
+    arrival_id BIGINT,
+    platform_id BIGINT,
+    PRIMARY KEY(loc_id, ts),
     CONSTRAINT departure_ts
         FOREIGN KEY(departure_id) 
         REFERENCES timestamp(ts_id),
@@ -43,4 +46,42 @@ create table location (
     CONSTRAINT platform_id
         FOREIGN KEY(platform_id) 
         REFERENCES platform(plat_id)
-);
\ No newline at end of file
+) partition by range (ts);
+create index location_update_id on location(update_id);
+create index location_tpl_ts on location(tpl, ts);
+create table location_flat (
+    loc_id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    update_id BIGINT NOT NULL,
+    ts TIMESTAMP NOT NULL,
+    tpl varchar(10) NOT NULL,
+    arrival_ts TIME,
+    arrival_src varchar(30),
+    arrival_delayed BOOLEAN,
+    arrival_status varchar(30),
+    departure_ts TIME,
+    departure_src varchar(30),
+    departure_delayed BOOLEAN,
+    departure_status varchar(30),
+    platform_src varchar(30),
+    platform_confirmed BOOLEAN,
+    platform_text varchar(30),
+    PRIMARY KEY(loc_id, ts)
+) partition by range (ts);
+create index location_flat_update_id on location_flat(update_id);
+create index location_flat_tpl_ts on location_flat(tpl, ts);
+-- Partitions for the coming week, darwin listen creates the next ones at startup and hourly after that,
+-- there is no default partition so a database nothing maintains rejects inserts once these run out
+do $$
+declare
+    day date;
+    parent text;
+begin
+    for day in select generate_series(current_date - 1, current_date + 7, interval '1 day')::date loop
+        foreach parent in array array['service_update', 'location', 'location_flat'] loop
+            execute format(
+                'create table if not exists %I partition of %I for values from (%L) to (%L)',
+                parent || '_' || to_char(day, 'YYYYMMDD'), parent, day, day + 1
+            );
+        end loop;
+    end loop;
+end $$;
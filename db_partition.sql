@@ -0,0 +1,135 @@
+-- Moves a database created by an earlier db.sql onto the partitioned tables, run once with ingestion stopped.
+-- location_flat only exists where a db.sql from before partitioning added it, it is created here either way
+begin;
+
+alter table location drop constraint service_update;
+alter table if exists location_flat drop constraint if exists service_update;
+
+alter table service_update rename to service_update_unpartitioned;
+alter table service_update_unpartitioned rename constraint service_update_pkey to service_update_unpartitioned_pkey;
+alter table location rename to location_unpartitioned;
+alter table location_unpartitioned rename constraint location_pkey to location_unpartitioned_pkey;
+alter table if exists location_flat rename to location_flat_unpartitioned;
+alter table if exists location_flat_unpartitioned rename constraint location_flat_pkey to location_flat_unpartitioned_pkey;
+alter index if exists location_flat_update_id rename to location_flat_unpartitioned_update_id;
+alter index if exists location_flat_tpl_ts rename to location_flat_unpartitioned_tpl_ts;
+
+create table service_update (
+    update_id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    ts TIMESTAMP NOT NULL,
+    rid varchar(30) NOT NULL,
+    PRIMARY KEY(update_id, ts),
+    CONSTRAINT service_rid
+        FOREIGN KEY(rid) 
+        REFERENCES service(rid)
+) partition by range (ts);
+create table location (
+    loc_id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    update_id BIGINT NOT NULL,
+    ts TIMESTAMP NOT NULL,
+    tpl varchar(10) NOT NULL,
+    departure_id BIGINT,
+    arrival_id BIGINT,
+    platform_id BIGINT,
+    PRIMARY KEY(loc_id, ts),
+    CONSTRAINT departure_ts
+        FOREIGN KEY(departure_id) 
+        REFERENCES timestamp(ts_id),
+    CONSTRAINT arrival_ts
+        FOREIGN KEY(arrival_id) 
+        REFERENCES timestamp(ts_id),
+    CONSTRAINT platform_id
+        FOREIGN KEY(platform_id) 
+        REFERENCES platform(plat_id)
+) partition by range (ts);
+create table location_flat (
+    loc_id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    update_id BIGINT NOT NULL,
+    ts TIMESTAMP NOT NULL,
+    tpl varchar(10) NOT NULL,
+    arrival_ts TIME,
+    arrival_src varchar(30),
+    arrival_delayed BOOLEAN,
+    arrival_status varchar(30),
+    departure_ts TIME,
+    departure_src varchar(30),
+    departure_delayed BOOLEAN,
+    departure_status varchar(30),
+    platform_src varchar(30),
+    platform_confirmed BOOLEAN,
+    platform_text varchar(30),
+    PRIMARY KEY(loc_id, ts)
+) partition by range (ts);
+
+-- Daily partitions covering every stored update and the coming week
+do $$
+declare
+    day date;
+    parent text;
+begin
+    for day in
+        select generate_series(
+            coalesce((select min(ts)::date from service_update_unpartitioned), current_date - 1),
+            current_date + 7,
+            interval '1 day'
+        )::date
+    loop
+        foreach parent in array array['service_update', 'location', 'location_flat'] loop
+            execute format(
+                'create table if not exists %I partition of %I for values from (%L) to (%L)',
+                parent || '_' || to_char(day, 'YYYYMMDD'), parent, day, day + 1
+            );
+        end loop;
+    end loop;
+end $$;
+
+insert into service_update (update_id, ts, rid)
+select update_id, ts, rid from service_update_unpartitioned;
+
+-- Locations take their update's ts, any without an update were unreachable from the by-rid read and are left behind
+insert into location (loc_id, update_id, ts, tpl, departure_id, arrival_id, platform_id)
+select l.loc_id, l.update_id, su.ts, l.tpl, l.departure_id, l.arrival_id, l.platform_id
+from location_unpartitioned l
+join service_update_unpartitioned su on l.update_id = su.update_id;
+
+do $$
+begin
+    if to_regclass('location_flat_unpartitioned') is null then
+        return;
+    end if;
+
+    insert into location_flat (
+        loc_id, update_id, ts, tpl,
+        arrival_ts, arrival_src, arrival_delayed, arrival_status,
+        departure_ts, departure_src, departure_delayed, departure_status,
+        platform_src, platform_confirmed, platform_text
+    )
+    select
+        l.loc_id, l.update_id, su.ts, l.tpl,
+        l.arrival_ts, l.arrival_src, l.arrival_delayed, l.arrival_status,
+        l.departure_ts, l.departure_src, l.departure_delayed, l.departure_status,
+        l.platform_src, l.platform_confirmed, l.platform_text
+    from location_flat_unpartitioned l
+    join service_update_unpartitioned su on l.update_id = su.update_id;
+end $$;
+
+-- Indexes are built once the rows are in rather than maintained through the copy
+create index service_update_rid_ts on service_update(rid, ts);
+create index service_update_ts on service_update(ts);
+create index location_update_id on location(update_id);
+create index location_tpl_ts on location(tpl, ts);
+create index location_flat_update_id on location_flat(update_id);
+create index location_flat_tpl_ts on location_flat(tpl, ts);
+
+select setval(pg_get_serial_sequence('service_update', 'update_id'), (select coalesce(max(update_id), 1) from service_update));
+select setval(pg_get_serial_sequence('location', 'loc_id'), (select coalesce(max(loc_id), 1) from location));
+select setval(pg_get_serial_sequence('location_flat', 'loc_id'), (select coalesce(max(loc_id), 1) from location_flat));
+
+commit;
+
+analyze service_update;
+analyze location;
+analyze location_flat;
+
+-- Once the copy has been checked:
+-- drop table if exists location_unpartitioned, location_flat_unpartitioned, service_update_unpartitioned;